@@ -0,0 +1,77 @@
+"""
+Scaling of load_caption_file (line parser) against the previous regex parser.
+
+$ python benchmarks/bench_caption_parser.py --sizes 1000,10000,100000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+from common import make_caption_text, measure
+
+from captions import iter_caption_file, load_caption_file
+from legacy import load_caption_file_regex
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--sizes', default='1000,10000,100000')
+parser.add_argument(
+    '--baseline_max',
+    help='skip the regex parser above this size',
+    default=100000,
+    type=int,
+)
+parser.add_argument('--output', help='save results as json', default=None)
+args = parser.parse_args()
+
+results = []
+with tempfile.TemporaryDirectory() as tmp_dir:
+    for ext in ('srt', 'vtt'):
+        for adversarial in (False, True):
+            for size in [int(size) for size in args.sizes.split(',')]:
+                path = os.path.join(tmp_dir, f'caption.{ext}')
+                with open(path, 'w') as f:
+                    f.write(
+                        make_caption_text(size, ext, adversarial=adversarial)
+                    )
+
+                row = {
+                    'ext': ext,
+                    'adversarial': adversarial,
+                    'num_items': size,
+                    'mb': round(os.path.getsize(path) / 1e6, 2),
+                }
+                _, row['load_caption_file'] = measure(load_caption_file, path)
+                # lazy iteration keeps only one cue in memory
+                _, row['iter_caption_file'] = measure(
+                    lambda: sum(1 for _ in iter_caption_file(path))
+                )
+                if size <= args.baseline_max:
+                    _, row['regex'] = measure(load_caption_file_regex, path)
+                row['us_per_item'] = round(
+                    row['load_caption_file']['seconds'] / size * 1e6, 2
+                )
+                results.append(row)
+                print(json.dumps(row))
+
+# the last cue text has no trailing newline: the regex backtracks
+# exponentially in the length of that line
+with tempfile.TemporaryDirectory() as tmp_dir:
+    path = os.path.join(tmp_dir, 'caption.srt')
+    for length in (16, 18, 20, 22, 1_000_000):
+        with open(path, 'w') as f:
+            f.write(make_caption_text(10))
+            f.write('11\n00:00:59,000 --> 00:01:00,000\n')
+            f.write('a' * length)
+
+        row = {'unterminated_line_length': length}
+        _, row['load_caption_file'] = measure(load_caption_file, path)
+        if length <= 22:
+            _, row['regex'] = measure(load_caption_file_regex, path)
+        results.append(row)
+        print(json.dumps(row))
+
+if args.output is not None:
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,245 @@
+"""
+Time and peak memory of each caption pipeline function on synthetic inputs.
+
+Results are saved as json with the commit they were measured on, and can be
+compared with a previous run to catch regressions.
+
+$ python benchmarks/bench_caption_pipeline.py --sizes 1000,10000,100000 \
+    --output before.json
+$ python benchmarks/bench_caption_pipeline.py --sizes 1000,10000,100000 \
+    --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import (
+    ROOT_DIR,
+    make_caption,
+    make_caption_text,
+    make_word_timestamps,
+    measure,
+)
+
+from caption_track import CaptionTrack
+from captions import (
+    caption_to_sentences,
+    caption_to_string,
+    load_caption_file,
+    load_nlp,
+    word_timestamp_to_caption,
+)
+from translate import combine_captions
+
+
+def setup_load_caption_file(size: int, adversarial: bool, tmp_dir: str):
+    path = os.path.join(tmp_dir, 'caption.srt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(make_caption_text(size, 'srt', adversarial=adversarial))
+    return (path,), {}
+
+
+def setup_caption_to_sentences(size: int, adversarial: bool, tmp_dir: str):
+    # no item ends a sentence: everything is joined into one
+    sentence_ends = 0.0 if adversarial else 0.3
+    return (make_caption(size, sentence_ends=sentence_ends),), {}
+
+
+def setup_word_timestamp_to_caption(
+    size: int, adversarial: bool, tmp_dir: str
+):
+    # one sentence: the transcript cannot be split into windows
+    sentence_ends = 0.0 if adversarial else 1 / 15
+    word_timestamps = make_word_timestamps(size, sentence_ends=sentence_ends)
+    return (word_timestamps,), {}
+
+
+def setup_caption_to_string(size: int, adversarial: bool, tmp_dir: str):
+    words_per_item = 60 if adversarial else 12
+    return (make_caption(size, words_per_item=words_per_item),), {}
+
+
+def setup_combine_captions(size: int, adversarial: bool, tmp_dir: str):
+    words_per_item = 60 if adversarial else 12
+    cap_1 = make_caption(size, seed=0, words_per_item=words_per_item)
+    cap_2 = make_caption(size, seed=1, words_per_item=words_per_item)
+    return (cap_1, cap_2), {}
+
+
+def setup_combine_tracks(size: int, adversarial: bool, tmp_dir: str):
+    (cap_1, cap_2), _ = setup_combine_captions(size, adversarial, tmp_dir)
+    return (
+        CaptionTrack.from_captions(cap_1),
+        CaptionTrack.from_captions(cap_2),
+    ), {}
+
+
+# name: (function, setup(size, adversarial, tmp_dir) -> (args, kwargs))
+CASES = {
+    'load_caption_file': (load_caption_file, setup_load_caption_file),
+    'caption_to_sentences': (
+        caption_to_sentences,
+        setup_caption_to_sentences,
+    ),
+    'word_timestamp_to_caption': (
+        word_timestamp_to_caption,
+        setup_word_timestamp_to_caption,
+    ),
+    'caption_to_string': (caption_to_string, setup_caption_to_string),
+    'combine_captions': (combine_captions, setup_combine_captions),
+    'combine_tracks': (combine_captions, setup_combine_tracks),
+}
+
+
+def git_commit():
+    try:
+        res = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    return res.stdout.strip() or None
+
+
+def result_key(row: dict):
+    return (row['function'], row['num_items'], row['adversarial'])
+
+
+def compare(results: list[dict], previous: list[dict], threshold: float):
+    """
+    Print time/memory ratios against a previous run.
+
+    Returns:
+        Number of regressions (ratio over threshold).
+    """
+    previous_rows = {result_key(row): row for row in previous}
+    num_regressions = 0
+    print(
+        f'{"function":<28}{"items":>9}{"adv":>5}'
+        f'{"seconds":>10}{"ratio":>8}{"peak_mb":>10}{"ratio":>8}'
+    )
+    for row in results:
+        before = previous_rows.get(result_key(row))
+        if before is None or 'error' in row or 'error' in before:
+            continue
+        # timings under a millisecond are mostly noise
+        time_ratio = max(row['seconds'], 1e-3) / max(
+            before['seconds'], 1e-3
+        )
+        peak_ratio = max(row['peak_mb'], 0.01) / max(before['peak_mb'], 0.01)
+        regression = time_ratio > threshold or peak_ratio > threshold
+        num_regressions += regression
+        print(
+            f'{row["function"]:<28}{row["num_items"]:>9}'
+            f'{"y" if row["adversarial"] else "n":>5}'
+            f'{row["seconds"]:>10.4f}{time_ratio:>8.2f}'
+            f'{row["peak_mb"]:>10.2f}{peak_ratio:>8.2f}'
+            + ('  <- regression' if regression else '')
+        )
+    return num_regressions
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--sizes', default='1000,10000,100000,1000000')
+parser.add_argument(
+    '--functions',
+    help=f'comma separated subset of: {", ".join(CASES)}',
+    default=','.join(CASES),
+)
+parser.add_argument(
+    '--max_sizes',
+    help='per function size limit, e.g. caption_to_sentences=100000',
+    default='word_timestamp_to_caption=100000',
+)
+parser.add_argument(
+    '--adversarial',
+    help='also run adversarial inputs',
+    default=1,
+    type=int,
+)
+parser.add_argument(
+    '--segmenter',
+    help='segmenter of word_timestamp_to_caption (see captions.load_nlp)',
+    default='sentencizer',
+)
+parser.add_argument('--repeat', help='timing runs', default=3, type=int)
+parser.add_argument('--output', help='save results as json', default=None)
+parser.add_argument('--compare', help='json of a previous run', default=None)
+parser.add_argument(
+    '--threshold',
+    help='ratio against --compare reported as a regression',
+    default=1.2,
+    type=float,
+)
+args = parser.parse_args()
+
+max_sizes = {}
+for item in filter(None, args.max_sizes.split(',')):
+    name, size = item.split('=')
+    max_sizes[name] = int(size)
+
+if 'word_timestamp_to_caption' in args.functions:
+    # the pipeline is cached per process: do not time its loading
+    try:
+        load_nlp(segmenter=args.segmenter)
+    except OSError:
+        pass
+
+results = []
+with tempfile.TemporaryDirectory() as tmp_dir:
+    for name in args.functions.split(','):
+        func, setup = CASES[name]
+        for adversarial in (False, True)[: 1 + bool(args.adversarial)]:
+            for size in [int(size) for size in args.sizes.split(',')]:
+                if size > max_sizes.get(name, size):
+                    continue
+                row: dict = {
+                    'function': name,
+                    'num_items': size,
+                    'adversarial': adversarial,
+                }
+                func_args, func_kwargs = setup(size, adversarial, tmp_dir)
+                if name == 'word_timestamp_to_caption':
+                    func_kwargs['segmenter'] = args.segmenter
+                try:
+                    _, stats = measure(
+                        func, *func_args, repeat=args.repeat, **func_kwargs
+                    )
+                except Exception as e:
+                    # e.g. the spaCy model is not installed
+                    row['error'] = f'{type(e).__name__}: {e}'
+                else:
+                    row.update(stats)
+                    row['us_per_item'] = round(
+                        stats['seconds'] / size * 1e6, 3
+                    )
+                del func_args, func_kwargs
+                results.append(row)
+                print(json.dumps(row), flush=True)
+
+report = {
+    'commit': git_commit(),
+    'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    'python': sys.version.split()[0],
+    'platform': platform.platform(),
+    'results': results,
+}
+
+if args.output is not None:
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+if args.compare is not None:
+    with open(args.compare, 'r') as f:
+        previous = json.load(f)
+    if compare(results, previous['results'], args.threshold) > 0:
+        sys.exit(1)
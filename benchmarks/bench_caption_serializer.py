@@ -0,0 +1,58 @@
+"""
+Throughput of the streaming caption serializer against string concatenation.
+
+$ python benchmarks/bench_caption_serializer.py --sizes 10000,100000,1000000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+from common import iter_caption, make_caption, measure
+
+from captions import CaptionExt, caption_to_string, save_caption
+from legacy import caption_to_string_concat
+
+
+def save_caption_concat(caption, save_path):
+    with open(save_path, 'w') as f:
+        f.write(caption_to_string_concat(caption, CaptionExt.VTT))
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--sizes', default='10000,100000,1000000')
+parser.add_argument(
+    '--baseline_max',
+    help='skip string concatenation above this size',
+    default=1000000,
+    type=int,
+)
+parser.add_argument('--output', help='save results as json', default=None)
+args = parser.parse_args()
+
+results = []
+with tempfile.TemporaryDirectory() as tmp_dir:
+    path = os.path.join(tmp_dir, 'caption.vtt')
+    for size in [int(size) for size in args.sizes.split(',')]:
+        caption = make_caption(size)
+        row: dict = {'num_items': size}
+
+        _, row['save_caption'] = measure(save_caption, caption, path)
+        row['mb'] = round(os.path.getsize(path) / 1e6, 2)
+        # items are generated while writing: nothing is held in memory
+        _, row['save_caption_lazy'] = measure(
+            lambda: save_caption(iter_caption(size), path)
+        )
+        _, row['caption_to_string'] = measure(caption_to_string, caption)
+        if size <= args.baseline_max:
+            _, row['concat'] = measure(save_caption_concat, caption, path)
+        row['mb_per_second'] = round(
+            row['mb'] / row['save_caption']['seconds'], 1
+        )
+        results.append(row)
+        print(json.dumps(row))
+
+if args.output is not None:
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
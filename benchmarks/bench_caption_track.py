@@ -0,0 +1,71 @@
+"""
+Memory and speed of CaptionTrack against list of CaptionData dicts.
+
+$ python benchmarks/bench_caption_track.py --sizes 100000,1000000
+"""
+
+import argparse
+import json
+
+from common import make_caption, measure
+
+from caption_track import CaptionTrack
+from translate import combine_captions
+
+
+def shift_dicts(caption, seconds):
+    return [
+        {
+            **item,
+            'start': round(item['start'] + seconds, 3),
+            'end': round(item['end'] + seconds, 3),
+        }
+        for item in caption
+    ]
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--sizes', default='100000,1000000')
+parser.add_argument('--output', help='save results as json', default=None)
+args = parser.parse_args()
+
+results = []
+for size in [int(size) for size in args.sizes.split(',')]:
+    # memory of holding the data
+    caption, dict_stats = measure(make_caption, size)
+    track, track_stats = measure(CaptionTrack.from_captions, caption)
+    translated = track.with_texts(f'translated {text}' for text in track.texts)
+    translated_dicts = translated.to_captions()
+
+    row = {
+        'num_items': size,
+        'dicts_mb': dict_stats['peak_mb'],
+        # from_captions peak includes temporary lists of the columns
+        'track_build': track_stats,
+        'track_mb': round(
+            (
+                track.starts.nbytes
+                + track.ends.nbytes
+                + track.durations.nbytes
+                + track.indices.nbytes
+                + track._offsets.nbytes
+                + len(track._text.encode('utf-8'))
+            )
+            / 1e6,
+            3,
+        ),
+    }
+    _, row['shift_dicts'] = measure(shift_dicts, caption, 1.5)
+    _, row['shift_track'] = measure(track.shift, 1.5)
+    _, row['combine_dicts'] = measure(
+        combine_captions, caption, translated_dicts
+    )
+    _, row['combine_track'] = measure(combine_captions, track, translated)
+    _, row['clip_track'] = measure(track.clip, 60.0, 3600.0)
+    _, row['to_captions'] = measure(track.to_captions)
+    results.append(row)
+    print(json.dumps(row))
+
+if args.output is not None:
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,83 @@
+"""
+Compare single-pass and chunked multi-process transcription.
+
+Reports wall time of both paths and drift of word timestamps of the chunked
+path against the single-pass one (words are aligned by text).
+
+$ python benchmarks/bench_chunked_transcribe.py outputs/talk/audio.mp3 --num_workers 4
+"""
+
+import argparse
+import difflib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from transcribe import generate_transcribed_caption  # noqa: E402
+
+
+def word_drift(reference: list[dict], target: list[dict]):
+    ref_words = [item['word'].strip().lower() for item in reference]
+    target_words = [item['word'].strip().lower() for item in target]
+    matcher = difflib.SequenceMatcher(None, ref_words, target_words, False)
+
+    drifts = []
+    for block in matcher.get_matching_blocks():
+        for k in range(block.size):
+            drifts.append(
+                abs(
+                    reference[block.a + k]['start']
+                    - target[block.b + k]['start']
+                )
+            )
+    drifts.sort()
+    return {
+        'matched_ratio': round(len(drifts) / max(1, len(reference)), 4),
+        'mean': round(sum(drifts) / max(1, len(drifts)), 4),
+        'p95': drifts[int(len(drifts) * 0.95)] if drifts else None,
+        'max': drifts[-1] if drifts else None,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('audio', help='audio file')
+    parser.add_argument('--model', default='base')
+    parser.add_argument('--num_workers', default=4, type=int)
+    parser.add_argument('--chunk_seconds', default=300.0, type=float)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    _, single = generate_transcribed_caption(
+        args.audio, args.model, verbose=None
+    )
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, chunked = generate_transcribed_caption(
+        args.audio,
+        args.model,
+        verbose=None,
+        num_workers=args.num_workers,
+        chunk_seconds=args.chunk_seconds,
+    )
+    chunked_seconds = time.perf_counter() - start
+
+    print(
+        json.dumps(
+            {
+                'audio': args.audio,
+                'model': args.model,
+                'num_workers': args.num_workers,
+                'single_seconds': round(single_seconds, 3),
+                'chunked_seconds': round(chunked_seconds, 3),
+                'speedup': round(single_seconds / chunked_seconds, 2),
+                'num_words': [len(single), len(chunked)],
+                'drift': word_drift(single, chunked),
+            },
+            indent=2,
+        )
+    )
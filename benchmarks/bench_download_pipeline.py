@@ -0,0 +1,158 @@
+"""
+End-to-end throughput of the download path on an offline machine.
+
+Synthetic videos (ffmpeg test patterns) are served by a local MediaServer
+with the given latency and bandwidth, and downloaded, captioned and muxed
+by `run_batch` with the local backend.
+
+$ python benchmarks/bench_download_pipeline.py --videos 8 --seconds 60 \
+    --bandwidth 8 --workers 4
+"""
+
+import argparse
+import functools
+import os
+import subprocess
+import tempfile
+import time
+
+# puts src on sys.path
+from common import ROOT_DIR  # noqa: F401
+
+from batch import print_summary, run_batch
+from local_source import LocalSource, MediaServer, add_fixture
+from scheduler import StageScheduler, default_stage_limits
+
+
+def make_media(media_dir: str, seconds: int, resolution: str):
+    """Returns: (video-only mp4, audio-only m4a) of a test pattern."""
+    video = os.path.join(media_dir, 'video.mp4')
+    audio = os.path.join(media_dir, 'audio.m4a')
+    size = {'360p': '640x360', '720p': '1280x720', '1080p': '1920x1080'}
+    subprocess.run(
+        [
+            'ffmpeg',
+            '-y',
+            '-f',
+            'lavfi',
+            '-i',
+            f'testsrc2=size={size[resolution]}:rate=30:duration={seconds}',
+            '-c:v',
+            'libx264',
+            '-preset',
+            'ultrafast',
+            video,
+        ],
+        capture_output=True,
+        check=True,
+    )
+    subprocess.run(
+        [
+            'ffmpeg',
+            '-y',
+            '-f',
+            'lavfi',
+            '-i',
+            f'sine=frequency=440:duration={seconds}',
+            '-c:a',
+            'aac',
+            audio,
+        ],
+        capture_output=True,
+        check=True,
+    )
+    return video, audio
+
+
+def make_transcript(seconds: int):
+    return [
+        {'text': f'Line number {i}.', 'start': float(i), 'duration': 1.0}
+        for i in range(seconds)
+    ]
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--videos', help='number of videos', default=8, type=int)
+parser.add_argument(
+    '--seconds', help='duration of each video', default=60, type=int
+)
+parser.add_argument('--resolution', default='1080p')
+parser.add_argument(
+    '--bandwidth',
+    help='bandwidth per connection (MB/s, 0: unlimited)',
+    default=8,
+    type=float,
+)
+parser.add_argument(
+    '--latency', help='latency per request (s)', default=0.05, type=float
+)
+parser.add_argument(
+    '--workers', help='videos processed concurrently', default=4, type=int
+)
+parser.add_argument(
+    '--connections', help='connections per stream', default=4, type=int
+)
+parser.add_argument(
+    '--download_only', help='skip muxing', default=0, type=int
+)
+args = parser.parse_args()
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    fixture_dir = os.path.join(tmp_dir, 'fixtures')
+    video, audio = make_media(tmp_dir, args.seconds, args.resolution)
+    video_ids = [f'video{i}' for i in range(args.videos)]
+    for video_id in video_ids:
+        add_fixture(
+            fixture_dir,
+            video_id,
+            video_id,
+            [
+                {
+                    'itag': 137,
+                    'type': 'video',
+                    'subtype': 'mp4',
+                    'resolution': args.resolution,
+                    'file': video,
+                },
+                {
+                    'itag': 140,
+                    'type': 'audio',
+                    'subtype': 'mp4',
+                    'abr': '128kbps',
+                    'file': audio,
+                },
+            ],
+            {'en': make_transcript(args.seconds)},
+        )
+    total_mb = (
+        (os.path.getsize(video) + os.path.getsize(audio))
+        * args.videos
+        / 1e6
+    )
+
+    bandwidth = args.bandwidth * 1e6 if args.bandwidth > 0 else None
+    with MediaServer(fixture_dir, args.latency, bandwidth) as server:
+        # outputs are written to <cwd>/outputs
+        os.chdir(tmp_dir)
+        start = time.perf_counter()
+        results = run_batch(
+            video_ids,
+            max_workers=args.workers,
+            scheduler=StageScheduler(default_stage_limits()),
+            out_dir='bench',
+            resolutions=[args.resolution],
+            audio_format='native',
+            connections=args.connections,
+            download_only=bool(args.download_only),
+            use_cache=False,
+            backend=functools.partial(
+                LocalSource, fixture_dir=fixture_dir, server=server
+            ),
+        )
+        elapsed = time.perf_counter() - start
+
+    print_summary(results)
+    print(
+        f'\n{args.videos} videos, {total_mb:.1f}MB in {elapsed:.2f}s '
+        f'({total_mb / elapsed:.1f}MB/s)'
+    )
@@ -0,0 +1,60 @@
+"""
+Throughput of the segmented downloader against a local range server.
+
+$ python benchmarks/bench_downloader.py --size 64 --bandwidth 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# modules in src import each other by bare name
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from src.downloader import download_file  # noqa: E402
+from tests.http_fixtures import RangeServer  # noqa: E402
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--size', help='payload size (MB)', default=64, type=int)
+parser.add_argument(
+    '--bandwidth',
+    help='bandwidth per connection (MB/s)',
+    default=8,
+    type=float,
+)
+parser.add_argument(
+    '--latency', help='latency per request (s)', default=0.05, type=float
+)
+parser.add_argument(
+    '--chunk_size', help='range size (MB)', default=4, type=float
+)
+parser.add_argument(
+    '--connections', help='connections to compare', default='1,2,4,8'
+)
+args = parser.parse_args()
+
+payload = os.urandom(args.size * 1_000_000)
+
+with RangeServer(
+    payload,
+    latency=args.latency,
+    bandwidth=int(args.bandwidth * 1_000_000),
+) as server:
+    for connections in [int(c) for c in args.connections.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            start = time.perf_counter()
+            download_file(
+                f'{server.url}/media',
+                f'{tmp_dir}/media',
+                filesize=len(payload),
+                connections=connections,
+                chunk_size=int(args.chunk_size * 1_000_000),
+            )
+            elapsed = time.perf_counter() - start
+        print(
+            f'connections={connections:<3}{elapsed:8.2f}s'
+            f'{args.size / elapsed:10.1f}MB/s'
+        )
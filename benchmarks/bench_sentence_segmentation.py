@@ -0,0 +1,62 @@
+"""
+Sentence segmentation of whisper word timestamps (word_timestamp_to_caption).
+
+Hour-long speech is about 9000 words. Needs the en_core_web_sm model
+($ python -m spacy download en_core_web_sm) except for the sentencizer.
+
+$ python benchmarks/bench_sentence_segmentation.py --words 9000,36000
+"""
+
+import argparse
+import json
+
+from common import make_word_timestamps, measure
+
+from captions import load_nlp, word_timestamp_to_caption
+from legacy import word_timestamp_to_caption_full
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--words', default='9000,36000')
+parser.add_argument(
+    '--segmenters',
+    help='comma separated: parser, senter, sentencizer',
+    default='parser,senter,sentencizer',
+)
+parser.add_argument('--window_words', default=2000, type=int)
+parser.add_argument(
+    '--baseline_max',
+    help='skip the previous implementation above this size',
+    default=36000,
+    type=int,
+)
+parser.add_argument('--output', help='save results as json', default=None)
+args = parser.parse_args()
+
+segmenters = args.segmenters.split(',')
+# pipelines are cached per process: load them outside of the measurement
+for segmenter in segmenters:
+    load_nlp(segmenter=segmenter)
+
+results = []
+for num_words in [int(num_words) for num_words in args.words.split(',')]:
+    word_timestamps = make_word_timestamps(num_words)
+    row: dict = {'num_words': num_words}
+
+    if num_words <= args.baseline_max:
+        _, row['legacy'] = measure(
+            word_timestamp_to_caption_full, word_timestamps
+        )
+    for segmenter in segmenters:
+        caption, row[segmenter] = measure(
+            word_timestamp_to_caption,
+            word_timestamps,
+            segmenter=segmenter,
+            window_words=args.window_words,
+        )
+        row[segmenter]['num_sentences'] = len(caption)
+    results.append(row)
+    print(json.dumps(row))
+
+if args.output is not None:
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,162 @@
+"""Synthetic inputs and measurement helpers shared by the benchmarks."""
+
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), '..')
+# modules in src import each other by bare name
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+WORDS = (
+    'the web as we know it today has become incredibly important but '
+    "it's not without its problems many websites offer us a free service "
+    'in exchange for our data'
+).split()
+
+
+def format_time(t: float, delimiter=','):
+    total_ms = round(t * 1000)
+    hours, rest = divmod(total_ms, 3_600_000)
+    minutes, rest = divmod(rest, 60_000)
+    seconds, ms = divmod(rest, 1000)
+    return f'{hours:02}:{minutes:02}:{seconds:02}{delimiter}{ms:03}'
+
+
+def iter_caption(
+    num_items: int, seed=0, words_per_item=12, sentence_ends=0.3
+):
+    """
+    Generate caption items (CaptionData) of about 3 seconds each.
+
+    sentence_ends: ratio of items ending a sentence.
+    """
+    rng = random.Random(seed)
+    t = 0.0
+    for i in range(num_items):
+        duration = round(rng.uniform(1.0, 5.0), 3)
+        text = ' '.join(rng.choices(WORDS, k=words_per_item))
+        if rng.random() < sentence_ends:
+            text += '.'
+        yield {
+            'index': i + 1,
+            'start': round(t, 3),
+            'end': round(t + duration, 3),
+            'duration': duration,
+            'text': text,
+        }
+        t += duration
+
+
+def make_caption(
+    num_items: int, seed=0, words_per_item=12, sentence_ends=0.3
+):
+    return list(iter_caption(num_items, seed, words_per_item, sentence_ends))
+
+
+def make_caption_text(
+    num_items: int,
+    ext='srt',
+    seed=0,
+    lines_per_item=2,
+    adversarial=False,
+):
+    """
+    srt/vtt file content with num_items cues.
+
+    adversarial: cues with many long lines, nbsp, CRLF, stray lines with
+        '-->' and cues that are not separated by a blank line.
+    """
+    rng = random.Random(seed)
+    delimiter = ',' if ext == 'srt' else '.'
+    parts = ['WEBVTT\n\n'] if ext == 'vtt' else []
+    t = 0.0
+    for i in range(num_items):
+        duration = rng.uniform(1.0, 5.0)
+        start = format_time(t, delimiter)
+        end = format_time(t + duration, delimiter)
+        t += duration
+
+        num_lines = lines_per_item
+        newline = '\n'
+        if adversarial:
+            num_lines = rng.randint(1, 20)
+            newline = '\r\n' if rng.random() < 0.2 else '\n'
+        max_words = 40 if adversarial else 8
+        lines = [
+            ' '.join(rng.choices(WORDS, k=rng.randint(3, max_words)))
+            + ('\xa0 ' if adversarial and rng.random() < 0.3 else ' ')
+            for _ in range(num_lines)
+        ]
+        if adversarial and rng.random() < 0.1:
+            lines.append('not a timing line --> really')
+
+        separator = newline
+        if adversarial and rng.random() < 0.1:
+            # missing blank line after the cue
+            separator = ''
+        parts.append(
+            f'{i + 1}{newline}{start} --> {end}{newline}'
+            + newline.join(lines)
+            + newline
+            + separator
+        )
+    return ''.join(parts)
+
+
+def make_word_timestamps(num_words: int, seed=0, sentence_ends=1 / 15):
+    """
+    Whisper-like word timestamps with a sentence end every ~15 words.
+
+    sentence_ends: ratio of words ending a sentence.
+    """
+    rng = random.Random(seed)
+    word_timestamps = []
+    t = 0.0
+    for i in range(num_words):
+        word = rng.choice(WORDS)
+        if i == 0 or word_timestamps[-1]['word'].endswith('.'):
+            word = word.capitalize()
+        if rng.random() < sentence_ends:
+            word += '.'
+        duration = rng.uniform(0.1, 0.5)
+        word_timestamps.append(
+            {
+                'word': f' {word}',
+                'start': round(t, 2),
+                'end': round(t + duration, 2),
+                'probability': rng.random(),
+            }
+        )
+        t += duration
+    word_timestamps[-1]['word'] += '.'
+    return word_timestamps
+
+
+def measure(func, *args, repeat=1, **kwargs):
+    """
+    Returns:
+        (result of the last call, {'seconds': best wall time,
+        'peak_mb': peak traced memory})
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = func(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, {
+        'seconds': round(best, 6),
+        'peak_mb': round(peak / 1e6, 3),
+    }
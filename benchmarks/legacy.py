@@ -0,0 +1,117 @@
+"""Previous implementations kept as baselines for the benchmarks."""
+
+import re
+
+from captions import CaptionData, CaptionExt, WordTimestamp, strptime
+
+
+def load_caption_file_regex(file_path: str):
+    """load_caption_file before the line-oriented parser."""
+    if file_path[-3:] == CaptionExt.SRT.value:
+        file_ext = CaptionExt.SRT
+    elif file_path[-3:] == CaptionExt.VTT.value:
+        file_ext = CaptionExt.VTT
+    else:
+        raise ValueError('file extension should be .srt or .vtt')
+
+    with open(file_path, 'r') as f:
+        caption_text = f.read()
+
+    if file_ext == CaptionExt.SRT:
+        pattern = re.compile(
+            r'(?P<index>(^\d+$\n)?)(?P<start>^\d+:\d\d:\d\d,\d\d\d) --> (?P<end>\d+:\d\d:\d\d,\d\d\d$)\n(?P<text>^((.*)+\n)+?$)',
+            re.MULTILINE,
+        )
+    elif file_ext == CaptionExt.VTT:
+        pattern = re.compile(
+            r'(?P<index>(^\d+$\n)?)(?P<start>^\d+:\d\d:\d\d\.\d\d\d) --> (?P<end>\d+:\d\d:\d\d\.\d\d\d$)\n(?P<text>^((.*)+\n)+?$)',
+            re.MULTILINE,
+        )
+
+    result: list[CaptionData] = []
+    for i, match in enumerate(pattern.finditer(caption_text)):
+        start = strptime(match.group('start'), file_ext)
+        end = strptime(match.group('end'), file_ext)
+        text = (
+            match.group('text').replace('\xa0', ' ').replace('\n', '').strip()
+        ).strip()
+
+        result.append(
+            {
+                'index': int(match.group('index') or i + 1),
+                'start': start,
+                'end': end,
+                'text': text,
+                'duration': round((end - start), 3),
+            }
+        )
+
+    return result
+
+
+def strftime_legacy(t: float, ext: CaptionExt):
+    """strftime before the millisecond fix (always formats 000 ms)."""
+    hours = int(t // 3600)
+    minutes = int((t % 3600) // 60)
+    seconds = int(t % 60)
+    milliseconds = int((t - int(t)) // 1000)
+
+    delimiter = ',' if ext == CaptionExt.SRT else '.'
+    return f'{hours:02}:{minutes:02}:{seconds:02}{delimiter}{milliseconds:03}'
+
+
+def caption_to_string_concat(caption: list[CaptionData], ext=CaptionExt.VTT):
+    """caption_to_string before the streaming serializer."""
+    caption_text = ''
+    if ext == CaptionExt.VTT:
+        caption_text += 'WEBVTT\n\n'
+    for data in caption:
+        caption_text += f"""{data['index']}
+{strftime_legacy(data['start'], ext)} --> {strftime_legacy(data['end'], ext)}
+{data['text']}
+
+"""
+    return caption_text
+
+
+def word_timestamp_to_caption_full(word_timestamps: list[WordTimestamp]):
+    """word_timestamp_to_caption before the pipeline cache and windows."""
+    import spacy
+
+    text = ''.join([item['word'] for item in word_timestamps]).strip()
+    nlp = spacy.load('en_core_web_sm')
+    doc = nlp(text)
+    tokens = (token for token in doc)
+
+    caption: list[CaptionData] = []
+
+    caption_item: CaptionData = {'text': ''}  # type: ignore
+    index = 1
+    tmp_word = ''
+    for word_item in word_timestamps:
+        word = ''.join(word_item['word'].split())
+
+        while tmp_word != word:
+            token = next(tokens)
+            if token.is_sent_start and 'start' not in caption_item:
+                caption_item['start'] = word_item['start']
+            tmp_word += token.text
+
+        caption_item['text'] += word
+        tmp_word = ''
+
+        if token.is_sent_end:
+            caption_item['index'] = index
+            caption_item['end'] = word_item['end']
+            caption_item['duration'] = round(
+                caption_item['end'] - caption_item['start'], 3
+            )
+
+            caption.append(caption_item)
+
+            caption_item = {'text': ''}  # type: ignore
+            index += 1
+        else:
+            caption_item['text'] += ' '
+
+    return caption
@@ -0,0 +1,101 @@
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict
+
+from loader import download_and_save_video
+from scheduler import StageScheduler, default_stage_limits
+
+
+class BatchResult(TypedDict):
+    video_id: str
+    success: bool
+    error: str | None
+    elapsed: float
+
+
+def read_video_ids(file_path: str):
+    """Read video ids from a file (one per line, `#` starts a comment)."""
+    video_ids: list[str] = []
+    with open(file_path, 'r') as f:
+        for line in f:
+            video_id = line.split('#', 1)[0].strip()
+            if video_id != '':
+                video_ids.append(video_id)
+    return video_ids
+
+
+def _run_one(video_id: str, options: dict) -> BatchResult:
+    start = time.perf_counter()
+    try:
+        success = download_and_save_video(video_id=video_id, **options)
+        error = None if success else 'failed'
+    except Exception as e:
+        traceback.print_exc()
+        success = False
+        error = f'{type(e).__name__}: {e}'
+
+    return {
+        'video_id': video_id,
+        'success': bool(success),
+        'error': error,
+        'elapsed': round(time.perf_counter() - start, 3),
+    }
+
+
+def run_batch(
+    video_ids: list[str],
+    max_workers=4,
+    scheduler: StageScheduler | None = None,
+    **options,
+):
+    """
+    Download many videos concurrently.
+
+    Each video runs the same chain as `download_and_save_video`, while
+    `scheduler` bounds how many videos are in each stage at the same time.
+
+    Args:
+        video_ids: Youtube video ids. Duplicates are processed once.
+        max_workers: number of videos in flight.
+        scheduler: per-stage concurrency limits.
+        options: keyword arguments of `download_and_save_video`.
+    Returns:
+        BatchResult per video id, in input order.
+    """
+    if scheduler is None:
+        scheduler = StageScheduler(default_stage_limits())
+
+    # every video needs its own dir when a common one is given
+    out_dir = options.pop('out_dir', None)
+
+    video_ids = list(dict.fromkeys(video_ids))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                _run_one,
+                video_id,
+                {
+                    **options,
+                    'out_dir': (
+                        None if out_dir is None else f'{out_dir}/{video_id}'
+                    ),
+                    'scheduler': scheduler,
+                },
+            )
+            for video_id in video_ids
+        ]
+        results = [future.result() for future in futures]
+
+    return results
+
+
+def print_summary(results: list[BatchResult]):
+    num_success = sum(result['success'] for result in results)
+    print(f'\n{num_success}/{len(results)} videos succeeded.')
+    for result in results:
+        status = 'OK' if result['success'] else 'FAILED'
+        line = f'{status:<7}{result["video_id"]:<16}{result["elapsed"]:>9.1f}s'
+        if result['error'] is not None:
+            line += f'  {result["error"]}'
+        print(line)
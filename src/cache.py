@@ -0,0 +1,58 @@
+import json
+import os
+import re
+import threading
+import time
+
+CACHE_DIR = os.environ.get(
+    'YOUTUBE_DOWNLOADER_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'youtube-downloader'),
+)
+
+
+class FileCache:
+    """
+    JSON values stored one file per key under `<cache_dir>/<namespace>`.
+
+    Args:
+        namespace: sub directory of the cache.
+        ttl: seconds before an entry expires (None: never).
+        cache_dir: root directory of the cache.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: float | None = None,
+        cache_dir=CACHE_DIR,
+    ):
+        self.dir = os.path.join(cache_dir, namespace)
+        self.ttl = ttl
+
+    def path(self, key: str):
+        return os.path.join(self.dir, re.sub(r'[^\w.-]', '_', key) + '.json')
+
+    def get(self, key: str):
+        """Returns: the value, or None if missing or expired."""
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self.ttl is not None and time.time() - entry['created'] > self.ttl:
+            return None
+        return entry['value']
+
+    def put(self, key: str, value):
+        os.makedirs(self.dir, exist_ok=True)
+        path = self.path(key)
+        # concurrent readers never see a partially written file
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'created': time.time(), 'value': value}, f)
+        os.replace(tmp_path, path)
+
+    def delete(self, key: str):
+        if os.path.exists(self.path(key)):
+            os.remove(self.path(key))
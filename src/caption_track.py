@@ -0,0 +1,194 @@
+from itertools import compress
+from typing import TYPE_CHECKING, Iterable
+
+from captions import CaptionData
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class CaptionTrack:
+    """
+    Columnar caption track.
+
+    Times are kept in numpy arrays and texts in one string with offsets,
+    instead of one dict per cue. Time operations are vectorized and return
+    a new track that shares the unchanged columns.
+
+    Args:
+        starts: start time of each cue (seconds).
+        ends: end time of each cue (seconds).
+        texts: text of each cue.
+        indices: index of each cue (default: 1, 2, ...).
+        durations: duration of each cue (default: ends - starts).
+    """
+
+    def __init__(
+        self,
+        starts,
+        ends,
+        texts: Iterable[str] | None = None,
+        indices=None,
+        durations=None,
+        _text_store: tuple[str, 'np.ndarray'] | None = None,
+    ):
+        import numpy as np
+
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        if len(self.starts) != len(self.ends):
+            raise ValueError('starts and ends should be the same length.')
+
+        if indices is None:
+            indices = np.arange(1, len(self.starts) + 1)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        if durations is None:
+            durations = np.round(self.ends - self.starts, 3)
+        self.durations = np.asarray(durations, dtype=np.float64)
+
+        if _text_store is None:
+            _text_store = self._make_text_store(texts or [])
+        self._text, self._offsets = _text_store
+        if len(self._offsets) != len(self.starts) + 1:
+            raise ValueError('texts should be the same length as starts.')
+
+    @staticmethod
+    def _make_text_store(texts: Iterable[str]):
+        import numpy as np
+
+        texts = list(texts)
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, texts), np.int64), out=offsets[1:])
+        return ''.join(texts), offsets
+
+    @classmethod
+    def from_captions(cls, caption: Iterable[CaptionData]):
+        caption = list(caption)
+        return cls(
+            starts=[item['start'] for item in caption],
+            ends=[item['end'] for item in caption],
+            texts=[item['text'] for item in caption],
+            indices=[item['index'] for item in caption],
+            durations=[item['duration'] for item in caption],
+        )
+
+    def to_captions(self):
+        return list(self)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _index(self, i: int):
+        # offsets have one more item, so negative indices are normalized
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('caption index out of range')
+        return i
+
+    def text(self, i: int):
+        i = self._index(i)
+        return self._text[self._offsets[i] : self._offsets[i + 1]]
+
+    def iter_texts(self):
+        text = self._text
+        offsets = self._offsets.tolist()
+        for (start, end) in zip(offsets, offsets[1:]):
+            yield text[start:end]
+
+    @property
+    def texts(self):
+        return list(self.iter_texts())
+
+    def __getitem__(self, i: int) -> CaptionData:
+        i = self._index(i)
+        return {
+            'index': int(self.indices[i]),
+            'start': round(float(self.starts[i]), 3),
+            'end': round(float(self.ends[i]), 3),
+            'duration': float(self.durations[i]),
+            'text': self.text(i),
+        }
+
+    def __iter__(self):
+        import numpy as np
+
+        starts = np.round(self.starts, 3).tolist()
+        ends = np.round(self.ends, 3).tolist()
+        for (index, start, end, duration, text) in zip(
+            self.indices.tolist(),
+            starts,
+            ends,
+            self.durations.tolist(),
+            self.iter_texts(),
+        ):
+            item: CaptionData = {
+                'index': index,
+                'start': start,
+                'end': end,
+                'duration': duration,
+                'text': text,
+            }
+            yield item
+
+    def _with_times(self, starts, ends, mask=None):
+        if mask is None:
+            return CaptionTrack(
+                starts,
+                ends,
+                indices=self.indices,
+                _text_store=(self._text, self._offsets),
+            )
+        return CaptionTrack(
+            starts[mask],
+            ends[mask],
+            texts=compress(self.iter_texts(), mask.tolist()),
+            indices=self.indices[mask],
+        )
+
+    def shift(self, seconds: float):
+        """Move all cues by seconds."""
+        return self._with_times(self.starts + seconds, self.ends + seconds)
+
+    def scale(self, factor: float, origin=0.0):
+        """Stretch times around origin (e.g. to fix a frame rate mismatch)."""
+        return self._with_times(
+            origin + (self.starts - origin) * factor,
+            origin + (self.ends - origin) * factor,
+        )
+
+    def clip(self, start=0.0, end=float('inf')):
+        """Drop cues outside [start, end] and cut cues on the boundaries."""
+        import numpy as np
+
+        mask = (self.ends > start) & (self.starts < end)
+        starts = np.clip(self.starts, start, end)
+        ends = np.clip(self.ends, start, end)
+        if mask.all():
+            return self._with_times(starts, ends)
+        return self._with_times(starts, ends, mask)
+
+    def recompute_durations(self):
+        import numpy as np
+
+        self.durations = np.round(self.ends - self.starts, 3)
+        return self.durations
+
+    def with_texts(self, texts: Iterable[str]):
+        """Same times with other texts (e.g. translations)."""
+        return CaptionTrack(
+            self.starts,
+            self.ends,
+            texts=texts,
+            indices=self.indices,
+            durations=self.durations,
+        )
+
+    def combine(self, other: 'CaptionTrack'):
+        """Join texts of both tracks line by line."""
+        if len(self) != len(other):
+            raise ValueError('both captions should be the same index length.')
+        pairs = zip(self.iter_texts(), other.iter_texts())
+        return self.with_texts(
+            text_1 + '\n' + text_2 for (text_1, text_2) in pairs
+        )
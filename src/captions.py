@@ -1,17 +1,16 @@
+import io
+import os
 import re
+import subprocess
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from enum import Enum
-from typing import TypedDict
+from typing import Any, Iterable, Iterator, TextIO, TypedDict
 
-import ffmpeg  # type: ignore
-import spacy
-from youtube_transcript_api import YouTubeTranscriptApi  # type: ignore
-from youtube_transcript_api.formatters import (  # type: ignore
-    SRTFormatter,
-    TextFormatter,
-    WebVTTFormatter,
-)
+from cache import FileCache
+from tracing import span, submit, traced
 
 
 class WordTimestamp(TypedDict):
@@ -35,67 +34,279 @@ class CaptionExt(Enum):
     TXT = 'txt'
 
 
+# transcripts of a video rarely change
+TRANSCRIPT_TTL = 30 * 24 * 60 * 60
+
+# ISO 639-1 (youtube, DeepL) to ISO 639-2 (language of subtitle tracks)
+LANGUAGE_CODES = {
+    'ar': 'ara',
+    'de': 'deu',
+    'en': 'eng',
+    'es': 'spa',
+    'fr': 'fra',
+    'hi': 'hin',
+    'id': 'ind',
+    'it': 'ita',
+    'ja': 'jpn',
+    'ko': 'kor',
+    'nl': 'nld',
+    'pl': 'pol',
+    'pt': 'por',
+    'ru': 'rus',
+    'th': 'tha',
+    'tr': 'tur',
+    'uk': 'ukr',
+    'vi': 'vie',
+    'zh': 'zho',
+}
+
+
+def language_code(language: str):
+    """'en', 'en-US' -> 'eng' ('und' if unknown)."""
+    return LANGUAGE_CODES.get(language.split('-')[0].lower(), 'und')
+
+
+def fetch_transcript(video_id: str, languages: Iterable[str] = ('en',)):
+    """
+    Fetch a transcript from youtube.
+
+    Returns:
+        Raw transcript: [{'text': str, 'start': float, 'duration': float}]
+    """
+    from youtube_transcript_api import YouTubeTranscriptApi  # type: ignore
+
+    languages = list(languages)
+    if hasattr(YouTubeTranscriptApi, 'get_transcript'):
+        return YouTubeTranscriptApi.get_transcript(video_id, languages)
+    # youtube-transcript-api >= 1.0
+    fetched = YouTubeTranscriptApi().fetch(video_id, languages)
+    return fetched.to_raw_data()
+
+
+def transcript_to_caption(transcript: list[dict]):
+    """
+    Raw transcript to caption items.
+
+    Same timing as the formatters of youtube-transcript-api: a cue ends
+    at the start of the next one if they overlap.
+    """
+    caption: list[CaptionData] = []
+    for (i, line) in enumerate(transcript):
+        start = line['start']
+        end = start + line['duration']
+        if i + 1 < len(transcript):
+            end = min(end, transcript[i + 1]['start'])
+        caption.append(
+            {
+                'index': i + 1,
+                'start': round(start, 3),
+                'end': round(end, 3),
+                'duration': round(end - start, 3),
+                'text': line['text'],
+            }
+        )
+    return caption
+
+
+def load_yt_transcript(
+    video_id: str,
+    languages: Iterable[str] = ('en',),
+    cache: FileCache | None = None,
+    source=None,
+):
+    """
+    Load a transcript as caption items.
+
+    Args:
+        cache: the raw transcript is fetched only if it is not cached
+            (keyed by video id and languages). Not used for sources
+            without cache_transcripts.
+        source: video_source.MediaSource to fetch from (None: youtube).
+    """
+    if source is not None and not source.cache_transcripts:
+        cache = None
+    languages = list(languages)
+    key = f'{video_id}.{"-".join(languages)}'
+    transcript = None if cache is None else cache.get(key)
+    if transcript is None:
+        with span('transcript.fetch'):
+            if source is None:
+                transcript = fetch_transcript(video_id, languages)
+            else:
+                transcript = source.fetch_transcript(languages)
+        if cache is not None:
+            cache.put(key, transcript)
+    return transcript_to_caption(transcript)
+
+
 def load_yt_caption(
     video_id: str,
     exts: set[CaptionExt],
+    languages: Iterable[str] = ('en',),
+    cache: FileCache | None = None,
+    source=None,
 ):
     if len(exts) == 0:
         raise ValueError('No ext item is provided.')
-    transcript = YouTubeTranscriptApi.get_transcript(video_id)
-    formatted = {}
 
-    if CaptionExt.SRT in exts:
-        formatter = SRTFormatter()
-        formatted['srt'] = formatter.format_transcript(transcript)
+    caption = load_yt_transcript(video_id, languages, cache, source)
+    return {ext.value: caption_to_string(caption, ext) for ext in exts}
 
-    if CaptionExt.VTT in exts:
-        formatter = WebVTTFormatter()
-        formatted['vtt'] = formatter.format_transcript(transcript)
 
-    if CaptionExt.TXT in exts:
-        formatter = TextFormatter()
-        formatted['txt'] = formatter.format_transcript(transcript)
+def caption_stem(output_path: str, languages: list[str], language: str):
+    """
+    Path (without ext) of the caption of a language: the first language
+    is saved as `<output_path>.<ext>`, others as
+    `<output_path>.<language>.<ext>`.
+    """
+    if language == languages[0]:
+        return output_path
+    return f'{output_path}.{language}'
 
-    return formatted
 
+def download_captions(
+    video_id: str,
+    output_path: str,
+    languages: Iterable[str] = ('en',),
+    exts={CaptionExt.SRT},
+    cache: FileCache | None = None,
+    source=None,
+):
+    """
+    Fetch the transcript of each language concurrently and save them.
 
-def download_caption(video_id: str, output_path: str, exts={CaptionExt.SRT}):
-    try:
-        captions = load_yt_caption(video_id, exts)
-    except BaseException:
-        traceback.print_exc()
-        print('Failed to load caption.')
-        return False
+    Args:
+        output_path: path of captions without ext (see caption_stem).
+        source: video_source.MediaSource to fetch from (None: youtube).
+    Returns:
+        Saved file names (a language without transcript is skipped).
+    """
+    languages = list(languages)
+    if len(languages) == 0:
+        raise ValueError('No language is provided.')
+
+    with ThreadPoolExecutor(max_workers=len(languages)) as executor:
+        futures = [
+            submit(
+                executor,
+                load_yt_caption,
+                video_id,
+                exts,
+                [language],
+                cache,
+                source,
+            )
+            for language in languages
+        ]
+
+    saved: list[str] = []
+    for (language, future) in zip(languages, futures):
+        try:
+            captions = future.result()
+        except Exception:
+            traceback.print_exc()
+            print(f'Failed to load caption ({language}).')
+            continue
+
+        stem = caption_stem(output_path, languages, language)
+        for (ext, text) in captions.items():
+            with open(f'{stem}.{ext}', 'w', encoding='utf-8') as f:
+                f.write(text)
+            saved.append(os.path.basename(f'{stem}.{ext}'))
+    return saved
 
-    for key in captions.keys():
-        with open(f'{output_path}.{key}', 'w', encoding='utf-8') as f:
-            f.write(captions[key])
 
-    return True
+def download_caption(
+    video_id: str,
+    output_path: str,
+    exts={CaptionExt.SRT},
+    cache: FileCache | None = None,
+    source=None,
+):
+    saved = download_captions(
+        video_id, output_path, ['en'], exts, cache, source
+    )
+    return len(saved) > 0
 
 
 def add_subtitle_to_video(
     input_video: str,
-    subtitle_file: str,
+    subtitle_files: str | list[str],
     output_file: str,
-    subtitle_language='a.en',
+    subtitle_languages: str | list[str] = 'eng',
+    subtitle_titles: list[str] | None = None,
 ):
-    # TODO: add multiple subtitles
-    video_input_stream = ffmpeg.input(input_video)
-    subtitle_input_stream = ffmpeg.input(subtitle_file)
-    subtitle_track_title = subtitle_file[:-3]
-
-    stream = ffmpeg.output(
-        video_input_stream,
-        subtitle_input_stream,
-        output_file,
-        **{'c': 'copy', 'c:s': 'mov_text'},
-        **{
-            'metadata:s:s:0': f'language={subtitle_language}',
-            'metadata:s:s:1': f'title={subtitle_track_title}',
-        },
+    """
+    Copy input_video into output_file with subtitle tracks (one pass).
+
+    Args:
+        subtitle_files: srt/vtt files.
+        subtitle_languages: ISO 639-2 language of each track (or of all).
+        subtitle_titles: title of each track (default: file name).
+    """
+    if isinstance(subtitle_files, str):
+        subtitle_files = [subtitle_files]
+    if isinstance(subtitle_languages, str):
+        subtitle_languages = [subtitle_languages] * len(subtitle_files)
+    if subtitle_titles is None:
+        subtitle_titles = [
+            os.path.splitext(os.path.basename(file))[0]
+            for file in subtitle_files
+        ]
+
+    inputs = ['-i', input_video]
+    maps = ['-map', '0:v', '-map', '0:a?']
+    metadata = []
+    for (i, subtitle_file) in enumerate(subtitle_files):
+        inputs += ['-i', subtitle_file]
+        maps += ['-map', f'{i + 1}:0']
+        metadata += [
+            f'-metadata:s:s:{i}',
+            f'language={subtitle_languages[i]}',
+            f'-metadata:s:s:{i}',
+            f'title={subtitle_titles[i]}',
+            # mp4 keeps track names as handler_name
+            f'-metadata:s:s:{i}',
+            f'handler_name={subtitle_titles[i]}',
+        ]
+    subprocess.run(
+        [
+            'ffmpeg',
+            '-y',
+            *inputs,
+            *maps,
+            '-c',
+            'copy',
+            '-c:s',
+            'mov_text',
+            *metadata,
+            output_file,
+        ],
+        capture_output=True,
+        check=True,
     )
-    ffmpeg.run(stream, overwrite_output=True)
+
+
+TIME_PATTERNS = {
+    CaptionExt.SRT: re.compile(
+        r'(?P<hour>\d+):(?P<min>\d\d):(?P<sec>\d\d),(?P<ms>\d\d\d)'
+    ),
+    CaptionExt.VTT: re.compile(
+        r'(?P<hour>\d+):(?P<min>\d\d):(?P<sec>\d\d).(?P<ms>\d\d\d)'
+    ),
+}
+
+# cue timing lines (vtt hours are optional and cue settings may follow)
+TIMING_PATTERNS = {
+    CaptionExt.SRT: re.compile(
+        r'(\d+):(\d\d):(\d\d),(\d\d\d) --> '
+        r'(\d+):(\d\d):(\d\d),(\d\d\d)$'
+    ),
+    CaptionExt.VTT: re.compile(
+        r'(?:(\d+):)?(\d\d):(\d\d)\.(\d\d\d) --> '
+        r'(?:(\d+):)?(\d\d):(\d\d)\.(\d\d\d)(?:$|[ \t])'
+    ),
+}
 
 
 def strptime(time_str: str, ext=CaptionExt.VTT):
@@ -107,18 +318,10 @@ def strptime(time_str: str, ext=CaptionExt.VTT):
     Returns:
         Total seconds of timedelta.
     """
-    if ext == CaptionExt.SRT:
-        pattern = re.compile(
-            r'(?P<hour>\d+):(?P<min>\d\d):(?P<sec>\d\d),(?P<ms>\d\d\d)'
-        )
-    elif ext == CaptionExt.VTT:
-        pattern = re.compile(
-            r'(?P<hour>\d+):(?P<min>\d\d):(?P<sec>\d\d).(?P<ms>\d\d\d)'
-        )
-    else:
+    if ext not in TIME_PATTERNS:
         raise ValueError('file extension should be .srt or .vtt')
 
-    match = pattern.search(time_str)
+    match = TIME_PATTERNS[ext].search(time_str)
     if match is None:
         raise ValueError('Timeformat is not valid.')
 
@@ -144,56 +347,106 @@ def strftime(t: timedelta | float, ext: CaptionExt):
     if isinstance(t, timedelta):
         t = t.total_seconds()
 
-    hours = int(t // 3600)
-    minutes = int((t % 3600) // 60)
-    seconds = int(t % 60)
-    milliseconds = int((t - int(t)) // 1000)
+    total_ms = round(t * 1000)
+    hours, total_ms = divmod(total_ms, 3_600_000)
+    minutes, total_ms = divmod(total_ms, 60_000)
+    seconds, milliseconds = divmod(total_ms, 1000)
 
     delimiter = ',' if ext == CaptionExt.SRT else '.'
     return f'{hours:02}:{minutes:02}:{seconds:02}{delimiter}{milliseconds:03}'
 
 
-def load_caption_file(file_path: str):
-    """Convert srt to formatted list of dict."""
+def get_caption_ext(file_path: str):
     if file_path[-3:] == CaptionExt.SRT.value:
-        file_ext = CaptionExt.SRT
+        return CaptionExt.SRT
     elif file_path[-3:] == CaptionExt.VTT.value:
-        file_ext = CaptionExt.VTT
+        return CaptionExt.VTT
     else:
         raise ValueError('file extension should be .srt or .vtt')
 
-    with open(file_path, 'r') as f:
-        caption_text = f.read()
 
-    if file_ext == CaptionExt.SRT:
-        pattern = re.compile(
-            r'(?P<index>(^\d+$\n)?)(?P<start>^\d+:\d\d:\d\d,\d\d\d) --> (?P<end>\d+:\d\d:\d\d,\d\d\d$)\n(?P<text>^((.*)+\n)+?$)',
-            re.MULTILINE,
-        )
-    elif file_ext == CaptionExt.VTT:
-        pattern = re.compile(
-            r'(?P<index>(^\d+$\n)?)(?P<start>^\d+:\d\d:\d\d\.\d\d\d) --> (?P<end>\d+:\d\d:\d\d\.\d\d\d$)\n(?P<text>^((.*)+\n)+?$)',
-            re.MULTILINE,
-        )
+def _to_seconds(hour: str | None, minute: str, sec: str, ms: str):
+    total_ms = ((int(hour or 0) * 60 + int(minute)) * 60 + int(sec)) * 1000
+    return (total_ms + int(ms)) / 1000
 
-    result: list[CaptionData] = []
-    for i, match in enumerate(pattern.finditer(caption_text)):
-        start = strptime(match.group('start'), file_ext)
-        end = strptime(match.group('end'), file_ext)
-        text = (
-            match.group('text').replace('\xa0', ' ').replace('\n', '').strip()
-        ).strip()
 
-        result.append(
-            {
-                'index': int(match.group('index') or i + 1),
-                'start': start,
-                'end': end,
-                'text': text,
-                'duration': round((end - start), 3),
-            }
-        )
+def _make_caption_item(
+    index: int, start: float, end: float, text_lines: list[str]
+) -> CaptionData:
+    return {
+        'index': index,
+        'start': start,
+        'end': end,
+        'text': ''.join(text_lines).replace('\xa0', ' ').strip(),
+        'duration': round((end - start), 3),
+    }
+
+
+def parse_caption_lines(
+    lines: Iterable[str], file_ext: CaptionExt
+) -> Iterator[CaptionData]:
+    """
+    Parse srt/vtt lines into caption items one cue at a time.
+
+    A cue is an optional index line, a timing line and text lines up to a
+    blank line. Each line is looked at once, so malformed or very long cues
+    cannot make parsing slower than linear.
+    """
+    pattern = TIMING_PATTERNS[file_ext]
+
+    num_items = 0
+    prev_line = ''
+    cue: tuple[int, float, float] | None = None
+    text_lines: list[str] = []
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        match = pattern.match(line) if '-->' in line else None
+
+        if match is not None:
+            index_line = prev_line
+            if cue is not None:
+                # previous cue is not terminated by a blank line
+                index_line = text_lines[-1] if text_lines else ''
+                if index_line.isascii() and index_line.isdigit():
+                    text_lines.pop()
+                yield _make_caption_item(*cue, text_lines)
+
+            num_items += 1
+            index = (
+                int(index_line)
+                if index_line.isascii() and index_line.isdigit()
+                else num_items
+            )
+            cue = (
+                index,
+                _to_seconds(*match.groups()[:4]),
+                _to_seconds(*match.groups()[4:]),
+            )
+            text_lines = []
+        elif cue is not None:
+            if line == '':
+                yield _make_caption_item(*cue, text_lines)
+                cue = None
+            else:
+                text_lines.append(line)
+
+        prev_line = line
+
+    if cue is not None:
+        yield _make_caption_item(*cue, text_lines)
+
+
+def iter_caption_file(file_path: str) -> Iterator[CaptionData]:
+    """Lazily read srt/vtt file as caption items."""
+    file_ext = get_caption_ext(file_path)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        yield from parse_caption_lines(f, file_ext)
 
+
+def load_caption_file(file_path: str):
+    """Convert srt to formatted list of dict."""
+    result: list[CaptionData] = list(iter_caption_file(file_path))
     return result
 
 
@@ -201,41 +454,106 @@ def caption_to_sentences(caption: list[CaptionData]):
     """Convert caption so that each item is whole sentence."""
     converted: list[CaptionData] = []
 
-    converted_item: CaptionData = {'text': ''}  # type: ignore
+    converted_item: CaptionData = {}  # type: ignore
+    # texts are joined once per sentence (repeated += is quadratic)
+    texts: list[str] = []
     index = 1
     for item in caption:
         if 'start' not in converted_item:
             converted_item['start'] = item['start']
             converted_item['index'] = index
 
-        if converted_item['text'] != '':
-            converted_item['text'] += ' '
-        converted_item['text'] += item['text']
+        if len(texts) > 0 or item['text'] != '':
+            texts.append(item['text'])
 
         if item['text'].endswith(('.', '!', '?')):
+            converted_item['text'] = ' '.join(texts)
             converted_item['end'] = item['end']
             converted_item['duration'] = round(
                 item['end'] - converted_item['start'], 3
             )
             converted.append(converted_item)
             index += 1
-            converted_item = {'text': ''}  # type: ignore
+            converted_item = {}  # type: ignore
+            texts = []
         else:
             continue
 
     return converted
 
 
-def word_timestamp_to_caption(word_timestamps: list[WordTimestamp]):
-    text = ''.join([item['word'] for item in word_timestamps]).strip()
-    nlp = spacy.load('en_core_web_sm')
-    doc = nlp(text)
-    tokens = (token for token in doc)
+SENTENCE_ENDS = ('.', '!', '?')
 
-    caption: list[CaptionData] = []
+# components dropped by each segmenter: sentence boundaries are all we need
+SEGMENTER_EXCLUDES = {
+    'parser': ['tagger', 'attribute_ruler', 'lemmatizer', 'ner'],
+    'senter': ['parser', 'tagger', 'attribute_ruler', 'lemmatizer', 'ner'],
+}
+
+_nlp_cache: dict[tuple[str, str], Any] = {}
+_nlp_lock = threading.Lock()
+
+
+def load_nlp(model_name='en_core_web_sm', segmenter='parser'):
+    """
+    Load a spaCy pipeline for sentence segmentation (cached per process).
+
+    Args:
+        model_name: spaCy model name.
+        segmenter: 'parser' (dependency parser, most accurate),
+            'senter' (statistical sentence splitter only, much faster) or
+            'sentencizer' (punctuation rules, no model needed).
+    """
+    if segmenter not in ('parser', 'senter', 'sentencizer'):
+        raise ValueError(f'unknown segmenter: {segmenter}')
+
+    key = (model_name, segmenter)
+    with _nlp_lock:
+        if key not in _nlp_cache:
+            import spacy
+
+            with span('spacy.load', model_name=model_name):
+                if segmenter == 'sentencizer':
+                    nlp = spacy.blank(model_name.split('_')[0])
+                    nlp.add_pipe('sentencizer')
+                else:
+                    nlp = spacy.load(
+                        model_name, exclude=SEGMENTER_EXCLUDES[segmenter]
+                    )
+                    if segmenter == 'senter':
+                        nlp.enable_pipe('senter')
+            _nlp_cache[key] = nlp
+        return _nlp_cache[key]
+
+
+def split_word_windows(
+    word_timestamps: Iterable[WordTimestamp], window_words=2000
+):
+    """
+    Split word timestamps into windows of at least window_words words,
+    ending on a sentence-ending word so no sentence spans two windows.
+    """
+    window: list[WordTimestamp] = []
+    for word_item in word_timestamps:
+        window.append(word_item)
+        if len(window) >= window_words and word_item[
+            'word'
+        ].rstrip().endswith(SENTENCE_ENDS):
+            yield window
+            window = []
+    if len(window) > 0:
+        yield window
+
+
+def _align_sentences(
+    word_timestamps: list[WordTimestamp],
+    doc,
+    caption: list[CaptionData],
+    index: int,
+):
+    tokens = (token for token in doc)
 
     caption_item: CaptionData = {'text': ''}  # type: ignore
-    index = 1
     tmp_word = ''
     for word_item in word_timestamps:
         word = ''.join(word_item['word'].split())
@@ -264,35 +582,86 @@ def word_timestamp_to_caption(word_timestamps: list[WordTimestamp]):
         else:
             caption_item['text'] += ' '
 
+    return index
+
+
+@traced('sentences')
+def word_timestamp_to_caption(
+    word_timestamps: list[WordTimestamp],
+    model_name='en_core_web_sm',
+    segmenter='parser',
+    window_words=2000,
+):
+    """
+    Group word timestamps into one caption item per sentence.
+
+    Args:
+        word_timestamps: words from whisper.
+        model_name: spaCy model name.
+        segmenter: see `load_nlp`.
+        window_words: words are segmented in windows of about this size
+            through `nlp.pipe`, so memory does not grow with the transcript.
+    """
+    nlp = load_nlp(model_name, segmenter)
+    windows = list(split_word_windows(word_timestamps, window_words))
+    docs = nlp.pipe(
+        ''.join([item['word'] for item in window]).strip()
+        for window in windows
+    )
+
+    caption: list[CaptionData] = []
+    index = 1
+    for (window, doc) in zip(windows, docs):
+        index = _align_sentences(window, doc, caption, index)
+
     return caption
 
 
 def convert_caption_item(data: CaptionData, ext=CaptionExt.VTT):
-    return f"""{data['index']}
-{strftime(data['start'], ext)} --> {strftime(data['end'], ext)}
-{data['text']}
+    if ext == CaptionExt.TXT:
+        return f'{data["text"]}\n'
 
-"""
+    start = strftime(data['start'], ext)
+    end = strftime(data['end'], ext)
+    return f'{data["index"]}\n{start} --> {end}\n{data["text"]}\n\n'
 
 
-def caption_to_string(caption: list[CaptionData], ext=CaptionExt.VTT):
-    caption_text = ''
+def write_caption(
+    caption: Iterable[CaptionData],
+    f: TextIO,
+    ext=CaptionExt.VTT,
+    chunk_size=1000,
+):
+    """
+    Write caption items to a file object as srt/vtt/txt.
+
+    Items are formatted chunk_size at a time, so any iterable (e.g. lazily
+    parsed items) can be written with flat memory usage.
+    """
     if ext == CaptionExt.VTT:
-        caption_text += 'WEBVTT\n\n'
+        f.write('WEBVTT\n\n')
+
+    buffer: list[str] = []
     for item in caption:
-        caption_text += convert_caption_item(item, ext)
-    return caption_text
+        buffer.append(convert_caption_item(item, ext))
+        if len(buffer) >= chunk_size:
+            f.write(''.join(buffer))
+            buffer.clear()
+    f.write(''.join(buffer))
 
 
-def save_caption(caption: list[CaptionData], save_path: str):
-    if save_path[-3:] == CaptionExt.SRT.value:
-        file_ext = CaptionExt.SRT
-    elif save_path[-3:] == CaptionExt.VTT.value:
-        file_ext = CaptionExt.VTT
-    else:
-        raise ValueError('save_path extension should be .srt or .vtt')
+def caption_to_string(caption: Iterable[CaptionData], ext=CaptionExt.VTT):
+    with io.StringIO() as f:
+        write_caption(caption, f, ext)
+        return f.getvalue()
+
 
-    caption_text = caption_to_string(caption, file_ext)
+def save_caption(caption: Iterable[CaptionData], save_path: str):
+    for file_ext in CaptionExt:
+        if save_path[-3:] == file_ext.value:
+            break
+    else:
+        raise ValueError('save_path extension should be .srt, .vtt or .txt')
 
-    with open(save_path, 'w') as f:
-        f.write(caption_text)
+    with open(save_path, 'w', encoding='utf-8') as f:
+        write_caption(caption, f, file_ext)
@@ -0,0 +1,278 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from urllib.parse import unquote, urlparse
+
+if TYPE_CHECKING:
+    import requests  # type: ignore
+
+# same as pytube's default range size (larger ranges get throttled by youtube)
+DEFAULT_CHUNK_SIZE = 9 * 1024 * 1024
+READ_SIZE = 256 * 1024
+# a connection without new bytes for this many seconds is stalled
+DEFAULT_STALL_TIMEOUT = 30.0
+
+
+class DownloadError(Exception):
+    pass
+
+
+def journal_path(path: str):
+    return f'{path}.journal'
+
+
+class Journal:
+    """
+    Sidecar file recording which chunks of a download are complete.
+
+    The journal is rewritten atomically after every chunk, so it never
+    claims a chunk that has not been written to the output file.
+    """
+
+    def __init__(self, path: str, filesize: int, chunk_size: int):
+        self.path = path
+        self.filesize = filesize
+        self.chunk_size = chunk_size
+        self.done: set[int] = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, filesize: int, chunk_size: int):
+        journal = cls(path, filesize, chunk_size)
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return journal
+
+        # a journal of another file layout cannot be trusted
+        if (
+            data.get('filesize') == filesize
+            and data.get('chunk_size') == chunk_size
+        ):
+            journal.done = set(data.get('done', []))
+        return journal
+
+    def mark_done(self, index: int):
+        with self._lock:
+            self.done.add(index)
+            self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(
+                {
+                    'filesize': self.filesize,
+                    'chunk_size': self.chunk_size,
+                    'done': sorted(self.done),
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def probe(
+    url: str, session: 'requests.Session', timeout=DEFAULT_STALL_TIMEOUT
+):
+    """
+    Returns:
+        (filesize, whether the server accepts range requests)
+    """
+    res = session.head(url, allow_redirects=True, timeout=timeout)
+    res.raise_for_status()
+    filesize = int(res.headers.get('Content-Length', 0)) or None
+    accept_ranges = res.headers.get('Accept-Ranges', '').lower() == 'bytes'
+    return filesize, accept_ranges
+
+
+def _download_whole(
+    url: str,
+    path: str,
+    session: 'requests.Session',
+    on_chunk=None,
+    stall_timeout=DEFAULT_STALL_TIMEOUT,
+):
+    with session.get(url, stream=True, timeout=stall_timeout) as res:
+        res.raise_for_status()
+        with open(path, 'wb') as f:
+            for data in res.iter_content(READ_SIZE):
+                f.write(data)
+                if on_chunk is not None:
+                    on_chunk(len(data))
+
+
+def _copy_local(url: str, path: str, on_chunk=None):
+    """Copy a file:// url (e.g. fixtures of local_source)."""
+    with open(unquote(urlparse(url).path), 'rb') as src:
+        with open(path, 'wb') as f:
+            while data := src.read(READ_SIZE):
+                f.write(data)
+                if on_chunk is not None:
+                    on_chunk(len(data))
+    return os.path.getsize(path)
+
+
+def _download_range(
+    url: str,
+    path: str,
+    start: int,
+    end: int,
+    session: 'requests.Session',
+    retries: int,
+    on_chunk=None,
+    stall_timeout=DEFAULT_STALL_TIMEOUT,
+):
+    """Download bytes [start, end] of url into the same offsets of path."""
+    import requests  # type: ignore
+
+    for attempt in range(retries + 1):
+        written = 0
+        try:
+            # a stalled connection raises ReadTimeout and is retried
+            with session.get(
+                url,
+                headers={'Range': f'bytes={start}-{end}'},
+                stream=True,
+                timeout=stall_timeout,
+            ) as res:
+                if res.status_code != 206:
+                    raise DownloadError(
+                        f'range {start}-{end}: status {res.status_code}'
+                    )
+                with open(path, 'r+b') as f:
+                    f.seek(start)
+                    for data in res.iter_content(READ_SIZE):
+                        f.write(data)
+                        written += len(data)
+                        if on_chunk is not None:
+                            on_chunk(len(data))
+
+            if written != end - start + 1:
+                raise DownloadError(
+                    f'range {start}-{end}: got {written} bytes'
+                )
+            return
+        except (requests.RequestException, DownloadError) as e:
+            if on_chunk is not None and written > 0:
+                # the range is downloaded again from its start
+                on_chunk(-written)
+            if attempt == retries:
+                raise DownloadError(str(e)) from e
+            time.sleep(0.5 * 2**attempt)
+
+
+def download_file(
+    url: str,
+    path: str,
+    filesize: int | None = None,
+    connections=4,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    retries=3,
+    session: 'requests.Session | None' = None,
+    on_chunk=None,
+    stall_timeout=DEFAULT_STALL_TIMEOUT,
+):
+    """
+    Download url to path over several connections using range requests.
+    file:// urls are copied.
+
+    Completed ranges are recorded in `<path>.journal`, so an interrupted
+    download resumes from where it stopped when called again.
+
+    Args:
+        url: media url.
+        path: output file path.
+        filesize: size of the file if known (probed with HEAD otherwise).
+        connections: number of parallel connections.
+        chunk_size: size of each range request.
+        retries: retries per range before giving up.
+        session: requests session (connections are pooled per session).
+        on_chunk: callback called with the number of bytes written
+            (e.g. progress.StreamProgress).
+        stall_timeout: seconds without new bytes before a connection is
+            aborted and its range retried.
+    Returns:
+        Size of the downloaded file.
+    """
+    if url.startswith('file://'):
+        return _copy_local(url, path, on_chunk)
+
+    if session is None:
+        import requests  # type: ignore
+        from requests.adapters import HTTPAdapter  # type: ignore
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+    accept_ranges = True
+    if filesize is None:
+        filesize, accept_ranges = probe(url, session, stall_timeout)
+
+    if filesize is None or not accept_ranges:
+        _download_whole(url, path, session, on_chunk, stall_timeout)
+        return os.path.getsize(path)
+
+    journal = Journal.load(journal_path(path), filesize, chunk_size)
+    if not os.path.exists(journal.path) and os.path.exists(path):
+        if os.path.getsize(path) == filesize:
+            # completed by a previous run
+            return filesize
+    if not os.path.exists(path) or os.path.getsize(path) != filesize:
+        journal.done.clear()
+    # the journal must exist before the file is created or written, so a
+    # full size file without a journal is always a completed one
+    journal.save()
+    if len(journal.done) == 0:
+        with open(path, 'wb') as f:
+            f.truncate(filesize)
+
+    def chunk_range(index: int):
+        start = index * chunk_size
+        return start, min(start + chunk_size, filesize) - 1
+
+    num_chunks = (filesize + chunk_size - 1) // chunk_size
+    todo = [i for i in range(num_chunks) if i not in journal.done]
+    if on_chunk is not None:
+        # the last chunk may be shorter
+        ranges = [chunk_range(index) for index in journal.done]
+        on_chunk(sum(end - start + 1 for (start, end) in ranges))
+
+    def fetch(index: int):
+        start, end = chunk_range(index)
+        _download_range(
+            url,
+            path,
+            start,
+            end,
+            session,
+            retries,
+            on_chunk,
+            stall_timeout,
+        )
+        journal.mark_done(index)
+
+    executor = ThreadPoolExecutor(max_workers=connections)
+    futures = [executor.submit(fetch, index) for index in todo]
+    try:
+        for future in futures:
+            future.result()
+    finally:
+        # wait for running ranges so that the journal is consistent
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    journal.remove()
+    return filesize
@@ -1,18 +1,176 @@
 import os
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from typing import Callable
 
+from cache import FileCache
 from captions import (
+    TRANSCRIPT_TTL,
     CaptionExt,
     add_subtitle_to_video,
-    download_caption,
+    caption_stem,
+    download_captions,
+    language_code,
     save_caption,
     word_timestamp_to_caption,
 )
-from pytubefix import YouTube  # type: ignore
+from manifest import MANIFEST_NAME, StageManifest
+from progress import ProgressMonitor
 from pytubefix.exceptions import RegexMatchError  # type: ignore
+from scheduler import StageScheduler
+from tracing import submit, traced
 from transcribe import generate_transcribed_caption
+from transcribe_worker import transcribe_with_worker, worker_available
 from translate import create_translated_caption
-from videos import combine_audio, download_audio, download_video
+from translation_memory import TranslationMemory
+from video_source import VIDEO_INFO_TTL, MediaSource, VideoSource
+from videos import (
+    assemble_video,
+    combine_audio,
+    convert_audio,
+    download_audio,
+    download_video,
+)
+
+# held while an out_dir is checked and claimed
+_out_dir_lock = threading.Lock()
+
+
+def _fetch_audio(
+    source: MediaSource,
+    out_dir: str,
+    filename: str,
+    to_mp3: bool,
+    scheduler: StageScheduler,
+    connections: int,
+    manifest: StageManifest,
+    progress: ProgressMonitor | None,
+):
+    """
+    Args:
+        to_mp3: also write an mp3 of the native stream.
+    Returns:
+        File name of the native stream (m4a/webm), which is transcribed
+        and muxed as it is.
+    """
+    params = {'filename': filename}
+    if manifest.is_done('audio', params):
+        print('Audio is up to date.')
+        audio_name = manifest.outputs('audio')[0]
+    else:
+        audio_name = scheduler.run(
+            'download',
+            download_audio,
+            source,
+            out_dir,
+            filename,
+            connections,
+            progress=progress,
+        )
+        if audio_name is None:
+            return None
+        manifest.complete('audio', params, [audio_name])
+
+    mp3_name = f'{filename}.mp3'
+    if to_mp3 and not manifest.is_done('mp3', inputs=[audio_name]):
+        print(f'converting {audio_name} to mp3...')
+        scheduler.run(
+            'ffmpeg',
+            convert_audio,
+            f'{out_dir}/{audio_name}',
+            f'{out_dir}/{mp3_name}',
+        )
+        manifest.complete('mp3', outputs=[mp3_name], inputs=[audio_name])
+    return audio_name
+
+
+def _fetch_caption(
+    source: MediaSource,
+    out_dir: str,
+    filename: str,
+    caption_exts: set[CaptionExt],
+    languages: list[str],
+    scheduler: StageScheduler,
+    cache: FileCache | None,
+    manifest: StageManifest,
+):
+    """Returns: saved caption files."""
+    exts = sorted(ext.value for ext in caption_exts)
+    params = {'exts': exts, 'filename': filename, 'languages': languages}
+    if manifest.is_done('caption', params):
+        print('Caption is up to date.')
+        return manifest.outputs('caption')
+
+    saved = scheduler.run(
+        'transcript',
+        download_captions,
+        source.video_id,
+        f'{out_dir}/{filename}',
+        languages,
+        caption_exts,
+        cache,
+        source=source,
+    )
+    if len(saved) > 0:
+        manifest.complete('caption', params, saved)
+    return saved
+
+
+def _video_params(resolutions: str | list[str], filename: str):
+    return {'resolutions': resolutions, 'filename': filename}
+
+
+def _fetch_video(
+    source: MediaSource,
+    out_dir: str,
+    filename: str,
+    resolutions: str | list[str],
+    scheduler: StageScheduler,
+    connections: int,
+    manifest: StageManifest,
+    progress: ProgressMonitor | None,
+):
+    params = _video_params(resolutions, filename)
+    if manifest.is_done('video', params):
+        print('Video is up to date.')
+        return True
+
+    success = scheduler.run(
+        'download',
+        download_video,
+        source,
+        output_path=out_dir,
+        resolutions=resolutions,
+        filename=filename,
+        connections=connections,
+        progress=progress,
+    )
+    if success:
+        manifest.complete('video', params, [filename], hash=False)
+    return success
+
+
+def _restore_stream(
+    result: dict,
+    resolutions: str | list[str],
+    scheduler: StageScheduler,
+    connections: int,
+    progress: ProgressMonitor | None,
+):
+    """Download the video-only stream again if it was removed after a mux."""
+    if os.path.exists(f'{result["out_dir"]}/{result["stream_name"]}'):
+        return True
+    result['manifest'].invalidate('video')
+    return _fetch_video(
+        result['source'],
+        result['out_dir'],
+        result['stream_name'],
+        resolutions,
+        scheduler,
+        connections,
+        result['manifest'],
+        progress,
+    )
 
 
 def download_contents(
@@ -23,26 +181,93 @@ def download_contents(
     caption_exts: set[CaptionExt] = {CaptionExt.SRT},
     make_metadata=True,
     file_name=None,
+    scheduler: StageScheduler | None = None,
+    audio_format='mp3',
+    connections=4,
+    resume=False,
+    use_cache=True,
+    force=False,
+    progress: ProgressMonitor | None = None,
+    backend: Callable[..., MediaSource] | None = None,
+    caption_languages: list[str] = ['en'],
 ):
-    audio_name = 'audio.mp3' if file_name is None else f'{file_name}.mp3'
+    """
+    Download audio, caption and video of a Youtube video.
+
+    Stages recorded in the manifest of out_dir are skipped, so running
+    again only fetches what is missing or was run with other params.
+
+    Args:
+        audio_format: 'mp3' or 'native', the format of the audio file
+            in audio mode. The audio stream is downloaded in its native
+            container (m4a/webm), which is transcribed and muxed into
+            videos as it is. 'mp3' writes an mp3 of it as well in audio
+            mode.
+        connections: number of parallel connections per stream.
+        resume: continue downloading into an existing out_dir without a
+            manifest.
+        use_cache: reuse transcripts and video metadata cached by
+            previous runs.
+        force: run every stage again.
+        progress: monitor of download progress.
+        backend: MediaSource class (or factory) called with the video id
+            and a metadata cache (default: VideoSource, i.e. youtube).
+        caption_languages: transcript languages, fetched concurrently
+            (see captions.caption_stem for file names).
+    """
+    if scheduler is None:
+        scheduler = StageScheduler()
+
+    audio_stem = 'audio' if file_name is None else file_name
+    audio_name = f'{audio_stem}.mp3'
     video_name = 'video.mp4' if file_name is None else f'{file_name}.mp4'
+    # video-only stream, removed after the mux unless keep_streams is set
+    stream_name = 'no_audio.mp4'
     caption_name = 'caption' if file_name is None else file_name
     audio_success = video_success = cap_success = None
+    caption_files: list[str] = []
 
-    try:
-        url = f'https://www.youtube.com/watch?v={video_id}'
-        yt = YouTube(url)
-    except RegexMatchError:
-        print(f'"{url}" is not a valid Youtube URL.')
-        return False
+    if backend is None:
+        backend = VideoSource
+    source = backend(
+        video_id,
+        FileCache('video_info', VIDEO_INFO_TTL) if use_cache else None,
+    )
+    url = source.url
+    with scheduler.stage('metadata'):
+        try:
+            # title and streams are resolved at once (or read from cache)
+            title = source.title
+        except RegexMatchError:
+            print(f'"{url}" is not a valid Youtube URL.')
+            return False
 
-    if out_dir is None:
-        out_dir = f"outputs/{yt.title.lower().replace(' ', '_')}"
-    else:
-        out_dir = f'outputs/{out_dir}'
+        if out_dir is None:
+            out_dir = f"outputs/{title.lower().replace(' ', '_')}"
+        else:
+            out_dir = f'outputs/{out_dir}'
 
-    if os.path.exists(out_dir):
-        print(f'outdir: {out_dir} already exists.')
+    # dirs made by this tool have a manifest, other dirs are not touched
+    error = None
+    # videos of a batch with the same title resolve to the same out_dir
+    with _out_dir_lock:
+        if (
+            os.path.exists(out_dir)
+            and not os.path.exists(f'{out_dir}/{MANIFEST_NAME}')
+            and not resume
+        ):
+            error = f'outdir: {out_dir} already exists.'
+        else:
+            os.makedirs(out_dir, exist_ok=True)
+            manifest = StageManifest(out_dir)
+            if not manifest.claim(video_id):
+                error = (
+                    f'outdir: {out_dir} belongs to video'
+                    f' {manifest.video_id}. Use another out_dir.'
+                )
+
+    if error is not None:
+        print(error)
         return {
             'audio_success': False,
             'cap_success': False,
@@ -51,35 +276,74 @@ def download_contents(
             'audio_name': audio_name,
             'caption_name': caption_name,
             'video_name': video_name,
+            'stream_name': stream_name,
+            'caption_files': caption_files,
+            'manifest': None,
+            'source': source,
         }
-    else:
-        os.mkdir(out_dir)
+
+    if force:
+        manifest.clear()
 
     if make_metadata is True:
         with open(f'{out_dir}/url.txt', 'w') as f:
             f.write(url)
 
-    audio_success = download_audio(
-        yt, output_path=out_dir, filename=audio_name
-    )
-
-    # High res video can only be downloaded without audio!
+    # audio, caption and video are independent, so fetch them concurrently
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        audio_future = submit(
+            executor,
+            _fetch_audio,
+            source,
+            out_dir,
+            audio_stem,
+            mode == 'audio' and audio_format == 'mp3',
+            scheduler,
+            connections,
+            manifest,
+            progress,
+        )
 
-    # download caption
-    cap_success = download_caption(
-        video_id, f'{out_dir}/{caption_name}', caption_exts
-    )
+        # High res video can only be downloaded without audio!
 
-    if mode == 'video':
-        # XXX: need to modify function_patterns in ciper.py
-        # -> https://github.com/pytube/pytube/issues/1954
-        video_success = download_video(
-            yt,
-            output_path=out_dir,
-            resolutions=resolutions,
-            filename=video_name,
+        # download caption
+        cap_future = submit(
+            executor,
+            _fetch_caption,
+            source,
+            out_dir,
+            caption_name,
+            caption_exts,
+            caption_languages,
+            scheduler,
+            FileCache('transcripts', TRANSCRIPT_TTL) if use_cache else None,
+            manifest,
         )
 
+        if mode == 'video':
+            # XXX: need to modify function_patterns in ciper.py
+            # -> https://github.com/pytube/pytube/issues/1954
+            video_future = submit(
+                executor,
+                _fetch_video,
+                source,
+                out_dir,
+                stream_name,
+                resolutions,
+                scheduler,
+                connections,
+                manifest,
+                progress,
+            )
+            video_success = video_future.result()
+
+        fetched_audio_name = audio_future.result()
+        audio_success = fetched_audio_name is not None
+        if audio_success:
+            audio_name = fetched_audio_name
+        caption_files = cap_future.result()
+        cap_success = len(caption_files) > 0
+
     return {
         'audio_success': audio_success,
         'cap_success': cap_success,
@@ -88,6 +352,10 @@ def download_contents(
         'audio_name': audio_name,
         'caption_name': caption_name,
         'video_name': video_name,
+        'stream_name': stream_name,
+        'caption_files': caption_files,
+        'manifest': manifest,
+        'source': source,
     }
 
 
@@ -96,26 +364,117 @@ def transcribe_audio(
     audio_name: str,
     translate=True,
     deepl_api_key: str | None = None,
+    scheduler: StageScheduler | None = None,
+    worker_socket: str | None = None,
+    num_workers: int | None = None,
+    translation_memory: str | None = None,
+    manifest: StageManifest | None = None,
+    translate_languages: list[str] = ['ja'],
 ):
+    """
+    Args:
+        worker_socket: socket path of a transcribe worker. The model is
+            loaded in this process if the worker is not available.
+        num_workers: transcribe chunks of audio in this many processes
+            (of the worker if worker_socket is given).
+        translation_memory: translation memory file (None: disabled).
+        manifest: stages already done in out_dir.
+        translate_languages: DeepL target languages. The first one is
+            saved as translated.vtt, others as translated.<language>.vtt.
+            The language of the transcription is not translated.
+    Returns:
+        (caption file, language) of the transcription (in the language
+        detected by whisper) and translations.
+    """
+    if scheduler is None:
+        scheduler = StageScheduler()
+    if manifest is None:
+        manifest = StageManifest(out_dir)
+
     # transcribe caption from audio
     # TODO: add transcribe config(model_name, etc.)
-    _, word_timestamps = generate_transcribed_caption(
-        f'{out_dir}/{audio_name}'
-    )
-    caption = word_timestamp_to_caption(word_timestamps)
-    save_caption(caption, f'{out_dir}/transcribe.vtt')
-
-    # translate caption
-    if translate is True:
-        # TODO: error handling of api
-        create_translated_caption(
-            file_path=f'{out_dir}/transcribe.vtt',
-            save_path=f'{out_dir}/translated.vtt',
-            deepl_api_key=str(deepl_api_key),
-            trim_caption_to_sentences=False,
+    if manifest.is_done('transcribe', inputs=[audio_name]):
+        print('Transcription is up to date.')
+        language = manifest.info('transcribe').get('language')
+    else:
+        with scheduler.stage('whisper'):
+            if worker_socket is not None and worker_available(
+                worker_socket
+            ):
+                _, word_timestamps, language = transcribe_with_worker(
+                    worker_socket,
+                    f'{out_dir}/{audio_name}',
+                    num_workers=num_workers,
+                    return_language=True,
+                )
+            else:
+                _, word_timestamps, language = generate_transcribed_caption(
+                    f'{out_dir}/{audio_name}',
+                    num_workers=num_workers,
+                    return_language=True,
+                )
+            caption = word_timestamp_to_caption(word_timestamps)
+        save_caption(caption, f'{out_dir}/transcribe.vtt')
+        manifest.complete(
+            'transcribe',
+            outputs=['transcribe.vtt'],
+            inputs=[audio_name],
+            info={'language': language},
         )
+    # whisper detects the spoken language (English if it could not)
+    if language is None:
+        language = 'en'
+
+    tracks = [('transcribe.vtt', language)]
+    if translate is False:
+        return tracks
+
+    # translate caption into each language
+    todo = []
+    for target in translate_languages:
+        if target.split('-')[0].lower() == language:
+            print(f'Transcription is already in {target}.')
+            continue
+        stem = caption_stem('translated', translate_languages, target)
+        name = f'{stem}.vtt'
+        if manifest.is_done(f'translate.{target}', inputs=['transcribe.vtt']):
+            print(f'Translation ({target}) is up to date.')
+            tracks.append((name, target))
+        else:
+            todo.append((target, name))
+    if len(todo) == 0:
+        return tracks
+
+    # TODO: error handling of api
+    memory = None
+    if translation_memory is not None:
+        memory = TranslationMemory(translation_memory)
+    try:
+        for (target, name) in todo:
+            with scheduler.stage('translate'):
+                stats = create_translated_caption(
+                    file_path=f'{out_dir}/transcribe.vtt',
+                    save_path=f'{out_dir}/{name}',
+                    deepl_api_key=str(deepl_api_key),
+                    trim_caption_to_sentences=False,
+                    source_lang=language.upper(),
+                    target_lang=target.upper(),
+                    memory=memory,
+                )
+            if stats is not None:
+                manifest.complete(
+                    f'translate.{target}',
+                    outputs=[name],
+                    inputs=['transcribe.vtt'],
+                )
+                tracks.append((name, target))
+    finally:
+        if memory is not None:
+            memory.close()
+    return tracks
 
 
+@traced('video', 'video_id')
 def download_and_save_video(
     video_id: str,
     mode='video',
@@ -128,7 +487,35 @@ def download_and_save_video(
     transcribe=False,
     translate=False,
     deepl_api_key: str | None = None,
+    scheduler: StageScheduler | None = None,
+    reencode=False,
+    audio_format='mp3',
+    connections=4,
+    resume=False,
+    transcribe_worker: str | None = None,
+    transcribe_workers: int | None = None,
+    translation_memory: str | None = None,
+    use_cache=True,
+    force=False,
+    progress: ProgressMonitor | None = None,
+    backend: Callable[..., MediaSource] | None = None,
+    caption_languages: list[str] = ['en'],
+    translate_languages: list[str] = ['ja'],
+    keep_streams=False,
 ):
+    """
+    Download a video and mux its audio and subtitle tracks (youtube
+    captions of caption_languages, and transcription/translations if
+    transcribe is True) into one file.
+
+    Args:
+        keep_streams: keep the video-only stream (no_audio.mp4) after the
+            mux, so that muxing again (e.g. with a new caption) does not
+            download it again. It is removed by default.
+    """
+    if scheduler is None:
+        scheduler = StageScheduler()
+
     result = download_contents(
         video_id,
         mode,
@@ -137,60 +524,139 @@ def download_and_save_video(
         caption_exts,
         make_metadata,
         file_name,
+        scheduler,
+        audio_format,
+        connections,
+        resume,
+        use_cache,
+        force,
+        progress,
+        backend,
+        caption_languages,
     )
+    if result is False:
+        return False
 
     download_success = not (
         (result['audio_success'] is False)
         or (result['video_success'] is False)
         or (result['cap_success'] is False)
     )
-    if download_only or not download_success:
-        return download_success
+    if not download_success:
+        return False
+    if download_only:
+        if mode == 'video':
+            return _restore_stream(
+                result, resolutions, scheduler, connections, progress
+            )
+        return True
 
+    transcribed_tracks = []
     if transcribe is True:
-        transcribe_audio(
-            result['out_dir'], result['audio_name'], translate, deepl_api_key
+        transcribed_tracks = transcribe_audio(
+            result['out_dir'],
+            result['audio_name'],
+            translate,
+            deepl_api_key,
+            scheduler,
+            transcribe_worker,
+            transcribe_workers,
+            translation_memory,
+            result['manifest'],
+            translate_languages,
         )
 
     if mode == 'audio':
         return True
 
-    # using same output path as input one fails to combine!
-    subprocess.run(
-        ['mv', f'{result["out_dir"]}/{result["video_name"]}', f'{result["out_dir"]}/no_audio.mp4']
-    )
-    combine_audio(
-        f'{result["out_dir"]}/no_audio.mp4',
-        f'{result["out_dir"]}/{result["audio_name"]}',
-        f'{result["out_dir"]}/no_caption.mp4',
-    )
-    subprocess.run(['rm', '-rf', f'{result["out_dir"]}/no_audio.mp4'])
-
-    if result['cap_success'] is False:
-        caption_file = None
-    elif CaptionExt.SRT in caption_exts:
-        caption_file = f'{result["out_dir"]}/{result["caption_name"]}.srt'
-    elif CaptionExt.VTT in caption_exts:
-        caption_file = f'{result["out_dir"]}/{result["caption_name"]}.vtt'
-    else:
-        caption_file = None
-
-    if caption_file is None:
-        subprocess.run(
-            [
-                'mv',
-                f'{result["out_dir"]}/no_caption.mp4',
-                f'{result["out_dir"]}/{result["video_name"]}',
-            ]
-        )
-    else:
-        add_subtitle_to_video(
-            f'{result["out_dir"]}/no_caption.mp4',
-            caption_file,
-            f'{result["out_dir"]}/{result["video_name"]}',
+    out_dir = result['out_dir']
+    manifest = result['manifest']
+    stream_name = result['stream_name']
+    audio_name = result['audio_name']
+    video_path = f'{out_dir}/{result["video_name"]}'
+
+    # (file, language, title) of subtitle tracks
+    subtitles = []
+    for language in caption_languages:
+        stem = caption_stem(
+            result['caption_name'], caption_languages, language
         )
-        subprocess.run(['rm', '-rf', f'{result["out_dir"]}/no_caption.mp4'])
+        for ext in ('srt', 'vtt'):
+            if f'{stem}.{ext}' in result['caption_files']:
+                subtitles.append(
+                    (f'{stem}.{ext}', language, f'{language} (YouTube)')
+                )
+                break
+    for (name, language) in transcribed_tracks:
+        engine = 'Whisper' if name == 'transcribe.vtt' else 'DeepL'
+        subtitles.append((name, language, f'{language} ({engine})'))
+    subtitle_names = [name for (name, _, _) in subtitles]
+    subtitle_files = [f'{out_dir}/{name}' for name in subtitle_names]
+    subtitle_languages = [language_code(lang) for (_, lang, _) in subtitles]
+    subtitle_titles = [title for (_, _, title) in subtitles]
+
+    # the stream may be removed, so the video stage is compared by params
+    video_params = _video_params(resolutions, stream_name)
+    mux_params = {
+        'reencode': reencode,
+        'languages': subtitle_languages,
+        'titles': subtitle_titles,
+        'video': video_params,
+    }
+    mux_inputs = [audio_name, *subtitle_names]
+    if manifest.is_done('mux', mux_params, mux_inputs):
+        print(f'{video_path} is up to date.')
+        return True
+    if not _restore_stream(
+        result, resolutions, scheduler, connections, progress
+    ):
+        return False
+
+    # every track is written in a single ffmpeg pass
+    with scheduler.stage('ffmpeg'):
+        if reencode is False:
+            assemble_video(
+                f'{out_dir}/{stream_name}',
+                f'{out_dir}/{audio_name}',
+                video_path,
+                subtitle_files=subtitle_files,
+                subtitle_languages=subtitle_languages,
+                subtitle_titles=subtitle_titles,
+            )
+        elif len(subtitles) == 0:
+            combine_audio(
+                f'{out_dir}/{stream_name}',
+                f'{out_dir}/{audio_name}',
+                video_path,
+                reencode=True,
+            )
+        else:
+            combine_audio(
+                f'{out_dir}/{stream_name}',
+                f'{out_dir}/{audio_name}',
+                f'{out_dir}/no_caption.mp4',
+                reencode=True,
+            )
+            add_subtitle_to_video(
+                f'{out_dir}/no_caption.mp4',
+                subtitle_files,
+                video_path,
+                subtitle_languages,
+                subtitle_titles,
+            )
+            os.remove(f'{out_dir}/no_caption.mp4')
+    manifest.complete(
+        'mux',
+        mux_params,
+        [result['video_name']],
+        inputs=mux_inputs,
+        hash=False,
+    )
+    if not keep_streams:
+        os.remove(f'{out_dir}/{stream_name}')
+        # still done: the stream is downloaded again only to mux again
+        manifest.complete('video', video_params, hash=False)
 
-    print(f'Successfully saved a video to {result["out_dir"]}.')
+    print(f'Successfully saved a video to {out_dir}.')
 
     return True
@@ -0,0 +1,285 @@
+"""
+Offline media backend serving fixture videos from a directory.
+
+A fixture dir has one sub dir per video:
+
+    <fixture_dir>/<video_id>/info.json        title and streams
+    <fixture_dir>/<video_id>/<stream files>
+    <fixture_dir>/<video_id>/transcript.<language>.json
+
+Streams are read from disk (file:// urls), or through a MediaServer on
+localhost with latency and bandwidth of a remote server, so that the
+download path can be tested and benchmarked without youtube.
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable
+from urllib.parse import quote, unquote, urlparse
+
+from cache import FileCache
+from video_source import MediaSource, StreamInfo, VideoInfo
+
+
+class _MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_empty(self, status: int):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _file_path(self):
+        server: MediaServer = self.server.media_server  # type: ignore
+        path = server.resolve(unquote(urlparse(self.path).path))
+        if path is None:
+            self._send_empty(404)
+        return path
+
+    def do_HEAD(self):
+        path = self._file_path()
+        if path is None:
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+    def do_GET(self):
+        server: MediaServer = self.server.media_server  # type: ignore
+        path = self._file_path()
+        if path is None:
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match is not None:
+            start = int(match.group(1))
+            if match.group(2) != '':
+                end = min(int(match.group(2)), end)
+        server.record({'path': self.path, 'start': start, 'end': end})
+
+        if server.fail_from is not None and start >= server.fail_from:
+            self._send_empty(503)
+            return
+
+        time.sleep(server.latency)
+        self.send_response(206 if match is not None else 200)
+        if match is not None:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+
+        block = 64 * 1024
+        stall_at = server.take_stall(start, end)
+        try:
+            with open(path, 'rb') as f:
+                f.seek(start)
+                offset = start
+                while offset <= end:
+                    if stall_at is not None and offset + block > stall_at:
+                        self.wfile.flush()
+                        time.sleep(server.stall)
+                        stall_at = None
+                    data = f.read(min(block, end + 1 - offset))
+                    self.wfile.write(data)
+                    offset += len(data)
+                    # throttle each connection like a remote server
+                    if server.bandwidth is not None:
+                        time.sleep(len(data) / server.bandwidth)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up (e.g. on a stalled response)
+            pass
+
+
+class MediaServer:
+    """
+    Serve files of a directory on localhost with range requests.
+
+    Args:
+        root: directory to serve.
+        latency: seconds before each response.
+        bandwidth: bytes per second per connection (None: unlimited).
+        fail_from: ranges starting at or after this offset fail with 503.
+        stall_at: the first response reaching this offset stops sending
+            for stall seconds.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        latency=0.0,
+        bandwidth: float | None = None,
+        fail_from: int | None = None,
+        stall_at: int | None = None,
+        stall=0.0,
+    ):
+        self.root = os.path.abspath(root)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.fail_from = fail_from
+        self.stall_at = stall_at
+        self.stall = stall
+        # {'path', 'start', 'end'} of each GET request
+        self.requests: list[dict] = []
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), _MediaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.media_server = self  # type: ignore
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True
+        )
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def resolve(self, url_path: str):
+        """Returns: file served at url_path (None: not found)."""
+        path = os.path.normpath(os.path.join(self.root, url_path[1:]))
+        inside = path.startswith(self.root + os.sep)
+        if not inside or not os.path.isfile(path):
+            return None
+        return path
+
+    def record(self, request: dict):
+        with self._lock:
+            self.requests.append(request)
+
+    def take_stall(self, start: int, end: int):
+        """Returns: offset of the (single) stall if in bytes [start, end]."""
+        with self._lock:
+            stall_at = self.stall_at
+            if stall_at is None or not start <= stall_at <= end:
+                return None
+            self.stall_at = None
+            return stall_at
+
+    def start(self):
+        self._thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def add_fixture(
+    fixture_dir: str,
+    video_id: str,
+    title: str,
+    streams: list[dict],
+    transcripts: dict[str, list[dict]] = {},
+):
+    """
+    Add a video to a fixture dir.
+
+    Args:
+        streams: StreamInfo fields of each stream (without url) and
+            `file`, the media file copied into the fixture.
+        transcripts: raw transcript of each language.
+    """
+    video_dir = os.path.join(fixture_dir, video_id)
+    os.makedirs(video_dir, exist_ok=True)
+    infos = []
+    for stream in streams:
+        name = os.path.basename(stream['file'])
+        shutil.copyfile(stream['file'], os.path.join(video_dir, name))
+        infos.append(
+            {
+                'is_progressive': False,
+                'is_adaptive': True,
+                'resolution': None,
+                'abr': None,
+                'fps': None,
+                'video_codec': None,
+                'audio_codec': None,
+                **stream,
+                'file': name,
+                'filesize': os.path.getsize(stream['file']),
+            }
+        )
+    with open(os.path.join(video_dir, 'info.json'), 'w') as f:
+        json.dump({'title': title, 'streams': infos}, f, indent=2)
+    for (language, transcript) in transcripts.items():
+        path = os.path.join(video_dir, f'transcript.{language}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(transcript, f, ensure_ascii=False)
+
+
+class LocalSource(MediaSource):
+    """
+    Backend reading a video of a fixture dir (see `add_fixture`).
+
+    Use `functools.partial(LocalSource, fixture_dir=..., server=...)` as
+    the backend of `loader.download_and_save_video`.
+
+    Args:
+        video_id: sub dir of fixture_dir.
+        cache: not used (metadata and transcripts are read from disk,
+            and never cached).
+        fixture_dir: directory of fixtures.
+        server: MediaServer serving fixture_dir (None: file:// urls).
+    """
+
+    # fixtures of different dirs may share video ids
+    cache_transcripts = False
+
+    def __init__(
+        self,
+        video_id: str,
+        cache: FileCache | None = None,
+        fixture_dir='fixtures',
+        server: MediaServer | None = None,
+    ):
+        super().__init__(video_id)
+        self.dir = os.path.join(fixture_dir, video_id)
+        self.url = f'file://{os.path.abspath(self.dir)}'
+        self.server = server
+
+    def _stream_url(self, file: str):
+        if self.server is None:
+            path = os.path.abspath(os.path.join(self.dir, file))
+            return f'file://{quote(path)}'
+        path = os.path.relpath(
+            os.path.join(self.dir, file), self.server.root
+        )
+        return f'{self.server.url}/{quote(path)}'
+
+    def _fetch(self) -> VideoInfo:
+        with open(os.path.join(self.dir, 'info.json'), 'r') as f:
+            data = json.load(f)
+        streams: list[StreamInfo] = []
+        for stream in data['streams']:
+            stream = dict(stream)
+            stream['url'] = self._stream_url(stream.pop('file'))
+            streams.append(stream)  # type: ignore
+        return {
+            'video_id': self.video_id,
+            'title': data['title'],
+            'streams': streams,
+        }
+
+    def fetch_transcript(self, languages: Iterable[str] = ('en',)):
+        languages = list(languages)
+        for language in languages:
+            path = os.path.join(self.dir, f'transcript.{language}.json')
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        raise LookupError(f'no transcript of {self.video_id} in {languages}.')
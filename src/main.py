@@ -1,19 +1,40 @@
 import argparse
 import os
-from distutils.util import strtobool  # type: ignore
 
+from batch import print_summary, read_video_ids, run_batch
 from captions import CaptionExt
 from clients import setup_default_clients
 from dotenv import load_dotenv
 from loader import download_and_save_video
+from progress import ProgressMonitor
+from scheduler import StageScheduler, default_stage_limits
+from tracing import tracer
+from translation_memory import DEFAULT_MEMORY_PATH
 
 load_dotenv()
 
+
+def strtobool(value: str):
+    """Same as distutils.util.strtobool (distutils is removed in 3.12)."""
+    value = value.lower()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return 1
+    if value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return 0
+    raise ValueError(f'invalid truth value {value!r}')
+
+
 parser = argparse.ArgumentParser()
 
 parser.add_argument(
     'video_id',
-    help='Youtube Video ID',
+    help='Youtube Video ID(s)',
+    nargs='*',
+)
+parser.add_argument(
+    '--ids_file',
+    help='file of Youtube Video IDs (one per line)',
+    required=False,
 )
 parser.add_argument(
     '--output',
@@ -58,6 +79,20 @@ parser.add_argument(
     required=False,
 )
 
+parser.add_argument(
+    '--languages',
+    help='comma separated caption languages (e.g. en,ja)',
+    default='en',
+    required=False,
+)
+
+parser.add_argument(
+    '--translate_languages',
+    help='comma separated DeepL target languages of --translate',
+    default='ja',
+    required=False,
+)
+
 parser.add_argument(
     '--metadata',
     help='add metadata',
@@ -79,6 +114,13 @@ parser.add_argument(
     type=strtobool,
     required=False,
 )
+parser.add_argument(
+    '--keep_streams',
+    help='keep the video-only stream (no_audio.mp4) to mux again quickly',
+    default=0,
+    type=strtobool,
+    required=False,
+)
 parser.add_argument(
     '--transcribe',
     help='whether to transcribe caption',
@@ -93,10 +135,124 @@ parser.add_argument(
     type=strtobool,
     required=False,
 )
+parser.add_argument(
+    '--audio_format',
+    help=(
+        'audio mode: mp3 also writes an mp3 of the downloaded stream '
+        '(m4a/webm), native keeps the stream only. Videos always get the '
+        'native stream'
+    ),
+    default='mp3',
+    choices=['mp3', 'native'],
+    required=False,
+)
+parser.add_argument(
+    '--connections',
+    help='number of parallel connections per stream download',
+    default=4,
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    '--resume',
+    help='resume an interrupted download into an existing output dir',
+    default=0,
+    type=strtobool,
+    required=False,
+)
+parser.add_argument(
+    '--force',
+    help='run every stage again, ignoring the manifest of the output dir',
+    default=0,
+    type=strtobool,
+    required=False,
+)
+parser.add_argument(
+    '--reencode',
+    help='re-encode video with moviepy instead of copying streams',
+    default=0,
+    type=strtobool,
+    required=False,
+)
+parser.add_argument(
+    '--transcribe_worker',
+    help='socket path of a running transcribe worker (transcribe_worker.py)',
+    default=None,
+    required=False,
+)
+parser.add_argument(
+    '--transcribe_workers',
+    help='transcribe chunks of audio split at silences in this many processes',
+    default=None,
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    '--cache',
+    help='reuse transcripts and video metadata cached by previous runs',
+    default=1,
+    type=strtobool,
+    required=False,
+)
+parser.add_argument(
+    '--translation_memory',
+    help='translation memory file reused across runs (empty to disable)',
+    default=DEFAULT_MEMORY_PATH,
+    required=False,
+)
+parser.add_argument(
+    '--workers',
+    help='number of videos processed concurrently in batch mode',
+    default=4,
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    '--network_workers',
+    help='max concurrent network stages (download/transcript/translate)',
+    default=4,
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    '--ffmpeg_workers',
+    help='max concurrent ffmpeg stages (default: half of cpu count)',
+    default=None,
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    '--whisper_workers',
+    help='max concurrent whisper stages',
+    default=1,
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    '--trace',
+    help='append wall/cpu/io/memory of each stage to this JSON-lines file',
+    default=None,
+    required=False,
+)
+parser.add_argument(
+    '--profile',
+    help='save a cProfile of each stage to this directory',
+    default=None,
+    required=False,
+)
 args = parser.parse_args()
 
+video_ids: list[str] = list(args.video_id)
+if args.ids_file is not None:
+    video_ids.extend(read_video_ids(args.ids_file))
+if len(video_ids) == 0:
+    parser.error('video_id or --ids_file is required.')
+
 setup_default_clients()
 
+if args.trace is not None or args.profile is not None:
+    tracer.configure(trace_path=args.trace, profile_dir=args.profile)
+
 if args.resolution is None:
     resolutions = ['1080p', '720p']
 else:
@@ -110,17 +266,52 @@ if bool(args.vtt) is True:
 if bool(args.txt) is True:
     exts.add(CaptionExt.TXT)
 
+# download progress of every stream is drawn on the terminal
+progress = ProgressMonitor(display=True)
 
-download_and_save_video(
-    video_id=args.video_id,
-    mode=args.mode,
-    resolutions=resolutions,
-    out_dir=args.output,
-    caption_exts=exts,
-    make_metadata=bool(args.metadata),
-    file_name=args.filename,
-    download_only=bool(args.download_only),
-    transcribe=bool(args.transcribe),
-    translate=bool(args.translate),
-    deepl_api_key=os.environ.get('DEEPL_API_KEY'),
-)
+options = {
+    'mode': args.mode,
+    'resolutions': resolutions,
+    'out_dir': args.output,
+    'caption_exts': exts,
+    'make_metadata': bool(args.metadata),
+    'file_name': args.filename,
+    'download_only': bool(args.download_only),
+    'keep_streams': bool(args.keep_streams),
+    'transcribe': bool(args.transcribe),
+    'translate': bool(args.translate),
+    'deepl_api_key': os.environ.get('DEEPL_API_KEY'),
+    'reencode': bool(args.reencode),
+    'audio_format': args.audio_format,
+    'connections': args.connections,
+    'resume': bool(args.resume),
+    'force': bool(args.force),
+    'progress': progress,
+    'transcribe_worker': args.transcribe_worker,
+    'transcribe_workers': args.transcribe_workers,
+    'translation_memory': args.translation_memory or None,
+    'use_cache': bool(args.cache),
+    'caption_languages': args.languages.split(','),
+    'translate_languages': args.translate_languages.split(','),
+}
+
+if len(video_ids) == 1:
+    download_and_save_video(video_id=video_ids[0], **options)
+else:
+    scheduler = StageScheduler(
+        default_stage_limits(
+            network_workers=args.network_workers,
+            ffmpeg_workers=args.ffmpeg_workers,
+            whisper_workers=args.whisper_workers,
+        )
+    )
+    results = run_batch(
+        video_ids, max_workers=args.workers, scheduler=scheduler, **options
+    )
+    print_summary(results)
+
+progress.close()
+
+if tracer.enabled:
+    tracer.print_summary()
+    tracer.close()
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Iterable, TypedDict
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class FileRecord(TypedDict):
+    size: int
+    mtime_ns: int
+    # None: compared by size and mtime only
+    sha256: str | None
+
+
+class StageRecord(TypedDict):
+    params: dict
+    inputs: dict[str, FileRecord]
+    outputs: dict[str, FileRecord]
+    # results of the stage other than files (e.g. a detected language)
+    info: dict
+    finished: float
+
+
+def file_sha256(path: str, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _normalize(params: dict):
+    # tuples/sets and lists compare equal once stored as json
+    return json.loads(json.dumps(params, sort_keys=True, default=sorted))
+
+
+class StageManifest:
+    """
+    Stages finished in an output dir, saved as `<out_dir>/manifest.json`.
+
+    A stage is done when it was recorded with the same params, its inputs
+    are the files it was run on and its outputs are unchanged. Files are
+    compared by size and mtime, and hashed again only when the mtime
+    differs (e.g. the file was copied). Stages of large files (video
+    streams) are recorded without hashes and compared by size and mtime
+    only.
+
+    Args:
+        out_dir: output dir of a video.
+    """
+
+    def __init__(self, out_dir: str):
+        self.path = os.path.join(out_dir, MANIFEST_NAME)
+        self.out_dir = out_dir
+        self._lock = threading.Lock()
+        self.stages: dict[str, StageRecord] = {}
+        # id of the video the outputs belong to
+        self.video_id: str | None = None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.stages = data['stages']
+            self.video_id = data.get('video_id')
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def claim(self, video_id: str):
+        """
+        Mark out_dir as the output dir of video_id.
+
+        Returns:
+            False if out_dir belongs to another video (e.g. one with the
+            same title), whose outputs must not be reused.
+        """
+        with self._lock:
+            if self.video_id is not None and self.video_id != video_id:
+                return False
+            if self.video_id is None:
+                self.video_id = video_id
+                self._save()
+            return True
+
+    def _file_record(self, name: str, hash=True) -> FileRecord:
+        # inputs are usually outputs of another stage: do not hash again
+        with self._lock:
+            for record in self.stages.values():
+                file = record['outputs'].get(name)
+                if file is not None and self._matches(name, file):
+                    return dict(file)  # type: ignore
+        path = os.path.join(self.out_dir, name)
+        stat = os.stat(path)
+        return {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_sha256(path) if hash else None,
+        }
+
+    def _matches(self, name: str, record: FileRecord):
+        path = os.path.join(self.out_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != record['size']:
+            return False
+        if stat.st_mtime_ns == record['mtime_ns']:
+            return True
+        if record['sha256'] is None or file_sha256(path) != record['sha256']:
+            return False
+        # same content: skip hashing next time
+        record['mtime_ns'] = stat.st_mtime_ns
+        return True
+
+    def is_done(
+        self, stage: str, params: dict | None = None, inputs: Iterable = ()
+    ):
+        """
+        Args:
+            params: parameters the stage is run with.
+            inputs: file names (in out_dir) the stage reads.
+        """
+        with self._lock:
+            record = self.stages.get(stage)
+            if record is None:
+                return False
+            if record['params'] != _normalize(params or {}):
+                return False
+            if set(inputs) != set(record['inputs']):
+                return False
+            files = {**record['inputs'], **record['outputs']}
+            return all(
+                self._matches(name, file) for (name, file) in files.items()
+            )
+
+    def outputs(self, stage: str):
+        """Output file names of a finished stage."""
+        return list(self.stages[stage]['outputs'])
+
+    def info(self, stage: str) -> dict:
+        """Results recorded with a finished stage."""
+        return dict(self.stages[stage].get('info', {}))
+
+    def complete(
+        self,
+        stage: str,
+        params: dict | None = None,
+        outputs: Iterable = (),
+        inputs: Iterable = (),
+        hash=True,
+        info: dict | None = None,
+    ):
+        """
+        Record a finished stage (file names are relative to out_dir).
+
+        Args:
+            hash: hash files for comparison (False: size and mtime only).
+            info: results of the stage returned by `info` when skipped.
+        """
+        record: StageRecord = {
+            'params': _normalize(params or {}),
+            'inputs': {
+                name: self._file_record(name, hash) for name in inputs
+            },
+            'outputs': {
+                name: self._file_record(name, hash) for name in outputs
+            },
+            'info': _normalize(info or {}),
+            'finished': time.time(),
+        }
+        with self._lock:
+            self.stages[stage] = record
+            self._save()
+
+    def invalidate(self, stage: str):
+        with self._lock:
+            if self.stages.pop(stage, None) is not None:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self.stages.clear()
+            self._save()
+
+    def _save(self):
+        # an interrupted run never leaves a partially written manifest
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(
+                {'video_id': self.video_id, 'stages': self.stages},
+                f,
+                indent=2,
+            )
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,223 @@
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, TypedDict
+
+# speed is averaged over this many seconds
+SPEED_WINDOW = 5.0
+# streams without new bytes for this long are shown as stalled
+STALL_WARNING = 5.0
+
+
+class ProgressInfo(TypedDict):
+    name: str
+    downloaded: int
+    total: int | None
+    speed: float
+    eta: float | None
+    elapsed: float
+    idle: float
+    done: bool
+    error: str | None
+
+
+class StreamProgress:
+    """
+    Progress of one stream download.
+
+    An instance is the `on_chunk` callback of `downloader.download_file`:
+    it is called (from any thread) with the number of bytes written, or a
+    negative number when a range is downloaded again.
+
+    Args:
+        name: label of the stream (e.g. '<video_id>/audio').
+        total: size of the stream if known.
+        on_progress: called with a ProgressInfo after every chunk.
+        on_complete: called with the last ProgressInfo when finished.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        total: int | None = None,
+        on_progress: Callable[[ProgressInfo], None] | None = None,
+        on_complete: Callable[[ProgressInfo], None] | None = None,
+    ):
+        self.name = name
+        self.total = total
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self.downloaded = 0
+        self.done = False
+        self.error: str | None = None
+        self.start = time.monotonic()
+        self.last_update = self.start
+        # (time, downloaded) samples within SPEED_WINDOW
+        self._samples: deque[tuple[float, int]] = deque()
+        self._lock = threading.Lock()
+
+    def __call__(self, num_bytes: int):
+        now = time.monotonic()
+        with self._lock:
+            self.downloaded += num_bytes
+            if num_bytes > 0:
+                self.last_update = now
+            # the first sample is the baseline of speed, as the first
+            # update may be bytes resumed from a previous run
+            self._samples.append((now, self.downloaded))
+            while (
+                len(self._samples) > 2
+                and now - self._samples[1][0] > SPEED_WINDOW
+            ):
+                self._samples.popleft()
+        if self.on_progress is not None:
+            self.on_progress(self.info())
+
+    def restart(self):
+        """Count from zero (the download is started again)."""
+        with self._lock:
+            self.downloaded = 0
+            self._samples.clear()
+
+    def speed(self):
+        """Bytes per second over the last SPEED_WINDOW seconds."""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._samples) < 2:
+                return 0.0
+            start_time, start_bytes = self._samples[0]
+            elapsed = max(now - start_time, 1e-3)
+            return max(self.downloaded - start_bytes, 0) / elapsed
+
+    def info(self) -> ProgressInfo:
+        speed = self.speed()
+        now = time.monotonic()
+        eta = None
+        if self.total is not None and speed > 0:
+            eta = max(self.total - self.downloaded, 0) / speed
+        return {
+            'name': self.name,
+            'downloaded': self.downloaded,
+            'total': self.total,
+            'speed': speed,
+            'eta': eta,
+            'elapsed': now - self.start,
+            'idle': 0.0 if self.done else now - self.last_update,
+            'done': self.done,
+            'error': self.error,
+        }
+
+    def complete(self, error: str | None = None):
+        self.done = True
+        self.error = error
+        if self.on_complete is not None:
+            self.on_complete(self.info())
+
+
+class ProgressMonitor:
+    """
+    Progress of all stream downloads of a run.
+
+    Callbacks receive the ProgressInfo of every stream, so batch runners
+    can aggregate them. With `display`, a status line of the running
+    streams is redrawn on the terminal every `interval` seconds.
+
+    Args:
+        on_progress: called with a ProgressInfo after every chunk.
+        on_complete: called with a ProgressInfo when a stream finishes.
+        display: draw progress on stderr (only if it is a terminal).
+        interval: seconds between redraws.
+    """
+
+    def __init__(
+        self,
+        on_progress: Callable[[ProgressInfo], None] | None = None,
+        on_complete: Callable[[ProgressInfo], None] | None = None,
+        display=False,
+        interval=0.5,
+    ):
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self.display = display and sys.stderr.isatty()
+        self.interval = interval
+        self.streams: list[StreamProgress] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def track(self, name: str, total: int | None = None):
+        """Returns: StreamProgress of a new stream."""
+        stream = StreamProgress(
+            name, total, self.on_progress, self._complete
+        )
+        with self._lock:
+            self.streams.append(stream)
+        if self.display and self._thread is None:
+            self._thread = threading.Thread(target=self._draw, daemon=True)
+            self._thread.start()
+        return stream
+
+    def _complete(self, info: ProgressInfo):
+        if self.on_complete is not None:
+            self.on_complete(info)
+        if self.display:
+            status = 'failed' if info['error'] is not None else 'done'
+            print(
+                f'\r\033[K{info["name"]}: {status}, '
+                f'{info["downloaded"] / 1e6:.1f}MB in '
+                f'{info["elapsed"]:.1f}s',
+                file=sys.stderr,
+            )
+
+    def summary(self):
+        """Totals of all streams (speed of the running ones)."""
+        with self._lock:
+            infos = [stream.info() for stream in self.streams]
+        running = [info for info in infos if not info['done']]
+        return {
+            'streams': len(infos),
+            'running': len(running),
+            'downloaded': sum(info['downloaded'] for info in infos),
+            'speed': sum(info['speed'] for info in running),
+            'stalled': [
+                info['name']
+                for info in running
+                if info['idle'] > STALL_WARNING
+            ],
+        }
+
+    def status_line(self):
+        summary = self.summary()
+        with self._lock:
+            infos = [
+                stream.info() for stream in self.streams if not stream.done
+            ]
+        parts = []
+        for info in infos:
+            part = f'{info["name"]} {info["downloaded"] / 1e6:.1f}'
+            if info['total'] is not None:
+                part += f'/{info["total"] / 1e6:.1f}'
+            part += 'MB'
+            if info['idle'] > STALL_WARNING:
+                part += f' stalled {info["idle"]:.0f}s'
+            elif info['eta'] is not None:
+                part += f' ETA {info["eta"]:.0f}s'
+            parts.append(part)
+        return f'{summary["speed"] / 1e6:.1f}MB/s | ' + ' | '.join(parts)
+
+    def _draw(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                running = any(not stream.done for stream in self.streams)
+            if running:
+                width = shutil.get_terminal_size().columns - 1
+                line = self.status_line()[:width]
+                print(f'\r\033[K{line}', end='', file=sys.stderr)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            print('\r\033[K', end='', file=sys.stderr)
@@ -0,0 +1,61 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from tracing import span
+
+# Network-bound stages wait on remote servers, so many of them can overlap.
+# CPU-bound stages (ffmpeg, whisper) saturate cores and are kept small.
+NETWORK_STAGES = ('metadata', 'download', 'transcript', 'translate')
+CPU_STAGES = ('ffmpeg', 'whisper')
+
+
+def default_stage_limits(
+    network_workers=4,
+    ffmpeg_workers: int | None = None,
+    whisper_workers=1,
+) -> dict[str, int]:
+    if ffmpeg_workers is None:
+        ffmpeg_workers = max(1, (os.cpu_count() or 2) // 2)
+
+    limits = {stage: network_workers for stage in NETWORK_STAGES}
+    limits['ffmpeg'] = ffmpeg_workers
+    limits['whisper'] = whisper_workers
+    return limits
+
+
+class StageScheduler:
+    """
+    Bound how many videos may run each kind of stage at the same time.
+
+    Args:
+        limits: max concurrency per stage name.
+            Stages without a limit run unbounded.
+    """
+
+    def __init__(self, limits: dict[str, int] | None = None):
+        self.limits = {} if limits is None else dict(limits)
+        self._semaphores = {
+            stage: threading.BoundedSemaphore(limit)
+            for (stage, limit) in self.limits.items()
+        }
+
+    @contextmanager
+    def stage(self, name: str):
+        """Run a block in stage `name` (the block is traced as the stage)."""
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            with span(name):
+                yield
+            return
+
+        start = time.perf_counter()
+        with semaphore:
+            with span(name, wait=time.perf_counter() - start):
+                yield
+
+    def run(self, name: str, func, *args, **kwargs):
+        """Call func inside stage `name`."""
+        with self.stage(name):
+            return func(*args, **kwargs)
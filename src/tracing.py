@@ -0,0 +1,282 @@
+"""
+Per-stage tracing.
+
+Each span records wall time, cpu time, bytes read/written and peak RSS,
+and is written as one JSON line to the trace file. Tracing is off until
+`tracer.configure` is called, and spans are then almost free.
+
+Counters are process-wide (including ffmpeg/whisper child processes once
+they exit), so stages running at the same time share them.
+"""
+
+import contextvars
+import cProfile
+import functools
+import inspect
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import TypedDict
+
+# attributes (e.g. video_id) inherited by nested spans
+_context: contextvars.ContextVar[dict] = contextvars.ContextVar(
+    'trace_context', default={}
+)
+
+
+class SpanRecord(TypedDict):
+    stage: str
+    start: float
+    wait: float
+    wall: float
+    cpu: float
+    read_bytes: int
+    write_bytes: int
+    peak_rss_mb: float
+    error: str | None
+    attrs: dict
+
+
+def _io_counters():
+    """(bytes read, bytes written) by this process and its children."""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            lines = f.read().splitlines()
+        counters = dict(line.split(': ') for line in lines)
+    except OSError:
+        return 0, 0
+    # rchar/wchar include sockets, read_bytes only the storage layer
+    return int(counters['rchar']), int(counters['wchar'])
+
+
+def _cpu_time():
+    times = os.times()
+    return (
+        times.user
+        + times.system
+        + times.children_user
+        + times.children_system
+    )
+
+
+def _peak_rss_mb():
+    """Peak RSS of this process or of any finished child process."""
+    # ru_maxrss is KB on Linux and bytes on macOS
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+    try:
+        # ru_maxrss keeps the parent's peak across fork/exec on Linux
+        with open('/proc/self/status', 'r') as f:
+            line = next(line for line in f if line.startswith('VmHWM'))
+        own = int(line.split()[1]) / 1024
+    except (OSError, StopIteration):
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+    return round(max(own, children), 1)
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.records: list[SpanRecord] = []
+        self._trace_file = None
+        self._profile_dir: str | None = None
+        self._profile_count = 0
+        self._lock = threading.Lock()
+
+    def configure(
+        self,
+        trace_path: str | None = None,
+        profile_dir: str | None = None,
+    ):
+        """
+        Turn tracing on.
+
+        Args:
+            trace_path: JSON-lines file spans are appended to.
+            profile_dir: save a cProfile of each span as
+                `<profile_dir>/<stage>-<n>.prof`.
+        """
+        if trace_path is not None:
+            os.makedirs(
+                os.path.dirname(os.path.abspath(trace_path)), exist_ok=True
+            )
+            self._trace_file = open(trace_path, 'a', encoding='utf-8')
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+        self._profile_dir = profile_dir
+        self.enabled = True
+
+    def close(self):
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+        self.enabled = False
+
+    def _start_profile(self):
+        if self._profile_dir is None:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another span of this process is being profiled
+            return None
+        return profile
+
+    def _save_profile(self, stage: str, profile: cProfile.Profile):
+        profile.disable()
+        with self._lock:
+            self._profile_count += 1
+            count = self._profile_count
+        name = stage.replace('/', '_')
+        profile.dump_stats(f'{self._profile_dir}/{name}-{count}.prof')
+
+    @contextmanager
+    def span(self, stage: str, wait=0.0, **attrs):
+        """
+        Trace the enclosed block as stage.
+
+        Args:
+            wait: seconds spent waiting before the block (e.g. for a
+                stage slot of the scheduler).
+            attrs: attributes of this span and of the spans inside it.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        attrs = {**_context.get(), **attrs}
+        token = _context.set(attrs)
+        error = None
+        read_bytes, write_bytes = _io_counters()
+        cpu = _cpu_time()
+        profile = self._start_profile()
+        start = time.time()
+        start_perf = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            wall = time.perf_counter() - start_perf
+            if profile is not None:
+                self._save_profile(stage, profile)
+            end_read_bytes, end_write_bytes = _io_counters()
+            _context.reset(token)
+            self._record(
+                {
+                    'stage': stage,
+                    'start': round(start, 3),
+                    'wait': round(wait, 6),
+                    'wall': round(wall, 6),
+                    'cpu': round(_cpu_time() - cpu, 6),
+                    'read_bytes': end_read_bytes - read_bytes,
+                    'write_bytes': end_write_bytes - write_bytes,
+                    'peak_rss_mb': _peak_rss_mb(),
+                    'error': error,
+                    'attrs': attrs,
+                }
+            )
+
+    def _record(self, record: SpanRecord):
+        with self._lock:
+            self.records.append(record)
+            if self._trace_file is not None:
+                line = json.dumps(record, default=str)
+                self._trace_file.write(line + '\n')
+                self._trace_file.flush()
+
+    def summary(self):
+        """Totals per stage."""
+        rows: dict[str, dict] = {}
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            row = rows.setdefault(
+                record['stage'],
+                {
+                    'stage': record['stage'],
+                    'count': 0,
+                    'errors': 0,
+                    'wait': 0.0,
+                    'wall': 0.0,
+                    'cpu': 0.0,
+                    'read_bytes': 0,
+                    'write_bytes': 0,
+                    'peak_rss_mb': 0.0,
+                },
+            )
+            row['count'] += 1
+            row['errors'] += record['error'] is not None
+            row['wait'] += record['wait']
+            row['wall'] += record['wall']
+            row['cpu'] += record['cpu']
+            row['read_bytes'] += record['read_bytes']
+            row['write_bytes'] += record['write_bytes']
+            row['peak_rss_mb'] = max(row['peak_rss_mb'], record['peak_rss_mb'])
+        return sorted(rows.values(), key=lambda row: -row['wall'])
+
+    def print_summary(self):
+        rows = self.summary()
+        if len(rows) == 0:
+            return
+        print(
+            f'{"stage":<24}{"count":>6}{"wait(s)":>9}{"wall(s)":>10}'
+            f'{"cpu(s)":>10}{"read(MB)":>10}{"write(MB)":>10}{"rss(MB)":>9}'
+        )
+        for row in rows:
+            print(
+                f'{row["stage"]:<24}{row["count"]:>6}{row["wait"]:>9.2f}'
+                f'{row["wall"]:>10.2f}{row["cpu"]:>10.2f}'
+                f'{row["read_bytes"] / 1e6:>10.1f}'
+                f'{row["write_bytes"] / 1e6:>10.1f}'
+                f'{row["peak_rss_mb"]:>9.0f}'
+                + (f'  ({row["errors"]} failed)' if row['errors'] else '')
+            )
+
+
+tracer = Tracer()
+
+
+def span(stage: str, **attrs):
+    """Trace a block with the global tracer."""
+    return tracer.span(stage, **attrs)
+
+
+def traced(stage: str, *arg_names: str):
+    """
+    Decorator tracing each call of a function as stage.
+
+    Args:
+        arg_names: arguments of the function recorded as span attributes
+            (e.g. video_id).
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            attrs = {}
+            if len(arg_names) > 0:
+                bound = signature.bind_partial(*args, **kwargs).arguments
+                attrs = {name: bound.get(name) for name in arg_names}
+            with tracer.span(stage, **attrs):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def submit(executor, func, *args, **kwargs):
+    """executor.submit keeping the trace attributes of the caller."""
+    context = contextvars.copy_context()
+    return executor.submit(context.run, func, *args, **kwargs)
@@ -1,36 +1,414 @@
+import os
+import subprocess
+import threading
+from collections import Counter, OrderedDict
 from itertools import chain
+from typing import TYPE_CHECKING
 
-import whisper  # type: ignore
 from captions import CaptionData, WordTimestamp, save_caption
+from tracing import span
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# whisper resamples every audio to 16kHz mono
+SAMPLE_RATE = 16000
+# audio is decoded and transcribed this many seconds at a time
+WINDOW_SECONDS = 600.0
+# text of the previous window given as prompt of the next one
+PROMPT_CHARS = 500
+
+
+class ModelCache:
+    """
+    LRU of loaded whisper models keyed by model name.
+
+    Loading a model reads its weights from disk, so models are kept
+    resident and reused by later transcriptions in the same process.
+    """
+
+    def __init__(self, max_models=2):
+        self.max_models = max_models
+        self._models: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str):
+        with self._lock:
+            if model_name in self._models:
+                self._models.move_to_end(model_name)
+                return self._models[model_name]
+
+            import whisper  # type: ignore
+
+            with span('whisper.load_model', model_name=model_name):
+                model = whisper.load_model(model_name)
+            self._models[model_name] = model
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            return model
+
+    def __contains__(self, model_name: str):
+        return model_name in self._models
+
+
+model_cache = ModelCache()
+
+
+def _transcribe(
+    model, audio, translate_to: str | None, verbose, prompt: str | None = None
+):
+    if translate_to is None:
+        return model.transcribe(
+            audio,
+            verbose=verbose,
+            word_timestamps=True,
+            initial_prompt=prompt,
+        )
+
+    # XXX: Whisper cannot translate English to other language
+    return model.transcribe(
+        audio,
+        task='translate',
+        language=translate_to,
+        verbose=verbose,
+        word_timestamps=True,
+        initial_prompt=prompt,
+    )
+
+
+def _quietest(audio: 'np.ndarray', start: int, end: int, frame: int):
+    """Returns: center of the quietest frame of audio[start:end]."""
+    import numpy as np
+
+    window = audio[start:end]
+    num_frames = len(window) // frame
+    if num_frames == 0:
+        # search range shorter than a frame: split at the limit
+        return end
+    frames = window[: num_frames * frame].reshape(num_frames, frame)
+    energy = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    return start + int(np.argmin(energy)) * frame + frame // 2
+
+
+def find_silence_splits(
+    audio: 'np.ndarray',
+    chunk_seconds=300.0,
+    search_seconds=30.0,
+    frame_seconds=0.05,
+    sample_rate=SAMPLE_RATE,
+):
+    """
+    Find where to split audio into chunks of about chunk_seconds.
+
+    Each split is placed at the quietest frame within the last
+    search_seconds before the chunk limit, so words are rarely cut.
+
+    Returns:
+        Sample offsets of chunk boundaries (including 0 and len(audio)).
+    """
+    chunk = int(chunk_seconds * sample_rate)
+    # chunks are at least half of chunk_seconds
+    search = min(int(search_seconds * sample_rate), chunk // 2)
+    frame = max(1, int(frame_seconds * sample_rate))
+
+    splits = [0]
+    while len(audio) - splits[-1] > chunk:
+        end = splits[-1] + chunk
+        splits.append(_quietest(audio, end - search, end, frame))
+    splits.append(len(audio))
+    return splits
+
+
+def _open_pcm(path: str, sample_rate: int):
+    # 16-bit mono pcm on stdout, resampled by ffmpeg (as whisper does)
+    cmd = [
+        'ffmpeg',
+        '-nostdin',
+        '-v',
+        'error',
+        '-threads',
+        '0',
+        '-i',
+        path,
+        '-vn',
+        '-f',
+        's16le',
+        '-ac',
+        '1',
+        '-acodec',
+        'pcm_s16le',
+        '-ar',
+        str(sample_rate),
+        '-',
+    ]
+    return subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+
+
+def _to_float(data: bytes):
+    import numpy as np
+
+    return np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+
+
+def _wait_pcm(process: subprocess.Popen):
+    assert process.stdout is not None and process.stderr is not None
+    process.stdout.close()
+    stderr = process.stderr.read()
+    process.stderr.close()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode, process.args, stderr=stderr
+        )
+
+
+def decode_audio(path: str, sample_rate=SAMPLE_RATE):
+    """
+    Decode any audio (or video) file with one ffmpeg pipe.
+
+    Returns:
+        Mono float32 samples in [-1, 1) at sample_rate.
+    """
+    process = _open_pcm(path, sample_rate)
+    assert process.stdout is not None
+    data = process.stdout.read()
+    _wait_pcm(process)
+    return _to_float(data)
+
+
+def iter_audio_windows(
+    audio: 'str | np.ndarray',
+    window_seconds=WINDOW_SECONDS,
+    search_seconds=30.0,
+    frame_seconds=0.05,
+    sample_rate=SAMPLE_RATE,
+):
+    """
+    Split audio into windows of at most window_seconds.
+
+    A file is decoded window by window from the ffmpeg pipe, so only one
+    window is held in memory. Windows end at the quietest frame within
+    the last search_seconds (see find_silence_splits), and the rest is
+    carried over to the next window.
+
+    Args:
+        audio: audio file, or samples at sample_rate.
+    Returns:
+        Iterator of (offset in samples, samples of the window).
+    """
+    import numpy as np
+
+    if isinstance(audio, np.ndarray):
+        splits = find_silence_splits(
+            audio, window_seconds, search_seconds, frame_seconds, sample_rate
+        )
+        for (start, end) in zip(splits[:-1], splits[1:]):
+            yield start, audio[start:end]
+        return
+
+    window = int(window_seconds * sample_rate)
+    search = min(int(search_seconds * sample_rate), window // 2)
+    frame = max(1, int(frame_seconds * sample_rate))
+
+    process = _open_pcm(audio, sample_rate)
+    assert process.stdout is not None
+    try:
+        offset = 0
+        buffer = np.zeros(0, dtype=np.float32)
+        while True:
+            data = process.stdout.read((window - len(buffer)) * 2)
+            buffer = np.concatenate([buffer, _to_float(data)])
+            if len(buffer) < window:
+                # end of stream
+                break
+            split = _quietest(buffer, window - search, window, frame)
+            yield offset, buffer[:split]
+            offset += split
+            buffer = buffer[split:].copy()
+        if len(buffer) > 0:
+            yield offset, buffer
+    except BaseException:
+        # stopped before the end of the stream
+        process.kill()
+        process.communicate()
+        raise
+    _wait_pcm(process)
+
+
+def _init_chunk_worker(num_threads: int):
+    import torch  # type: ignore
+
+    torch.set_num_threads(num_threads)
+
+
+def _transcribe_chunk(
+    audio: 'np.ndarray',
+    offset: float,
+    model_name: str,
+    translate_to: str | None,
+    verbose=None,
+    prompt: str | None = None,
+):
+    """
+    Transcribe a chunk and shift its timestamps by offset (seconds).
+
+    Timestamps are clamped to the chunk, so segments of consecutive
+    chunks never overlap.
+
+    Args:
+        prompt: text before the chunk (whisper's initial_prompt).
+    Returns:
+        (segments, language detected by whisper)
+    """
+    model = model_cache.get(model_name)
+    result = _transcribe(model, audio, translate_to, verbose, prompt)
+    duration = len(audio) / SAMPLE_RATE
+
+    def shift(seconds: float):
+        return round(min(max(seconds, 0.0), duration) + offset, 3)
+
+    segments = []
+    for segment in result['segments']:
+        words = [
+            {**word, 'start': shift(word['start']), 'end': shift(word['end'])}
+            for word in segment.get('words', [])
+        ]
+        segments.append(
+            {
+                'start': shift(segment['start']),
+                'end': shift(segment['end']),
+                'text': segment['text'],
+                'words': words,
+            }
+        )
+    return segments, result.get('language')
+
+
+def _main_language(languages):
+    """Most common language of the chunks (None if not detected)."""
+    counts = Counter(language for language in languages if language)
+    if len(counts) == 0:
+        return None
+    return counts.most_common(1)[0][0]
+
+
+def transcribe_chunked(
+    audio: 'str | np.ndarray',
+    model_name='base',
+    translate_to: str | None = None,
+    num_workers=2,
+    chunk_seconds=300.0,
+    return_language=False,
+):
+    """
+    Split audio at silences and transcribe the chunks in a process pool.
+
+    Args:
+        audio: audio file, or 16kHz mono samples.
+        return_language: also return the most common language of the
+            chunks.
+    Returns:
+        Segments of the whole audio (same shape as whisper's result).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    import numpy as np
+
+    if not isinstance(audio, np.ndarray):
+        audio = decode_audio(audio)
+    splits = find_silence_splits(audio, chunk_seconds)
+    chunks = list(zip(splits[:-1], splits[1:]))
+    print(f'Transcribing {len(chunks)} chunks with {num_workers} workers...')
+
+    num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=get_context('spawn'),
+        initializer=_init_chunk_worker,
+        initargs=(num_threads,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _transcribe_chunk,
+                audio[start:end],
+                start / SAMPLE_RATE,
+                model_name,
+                translate_to,
+            )
+            for (start, end) in chunks
+        ]
+        results = [future.result() for future in futures]
+    segments = list(chain(*[segments for (segments, _) in results]))
+    if return_language:
+        languages = [language for (_, language) in results]
+        return segments, _main_language(languages)
+    return segments
 
 
 def generate_transcribed_caption(
-    audio_path: str,
+    audio: 'str | np.ndarray',
     model_name='base',
     translate_to: str | None = None,
     save_path: str | None = None,
     verbose=True,
+    num_workers: int | None = None,
+    chunk_seconds=300.0,
+    window_seconds=WINDOW_SECONDS,
+    return_language=False,
 ):
-    model = whisper.load_model(model_name)
-    if translate_to is None:
-        result = model.transcribe(
-            audio_path,
-            verbose=verbose,
-            word_timestamps=True,
-        )
+    """
+    Args:
+        audio: audio file (any format ffmpeg reads, e.g. the downloaded
+            m4a/webm stream), or 16kHz mono float32 samples.
+        num_workers: transcribe chunks of audio in this many processes
+            (None: windows of audio in this process).
+        chunk_seconds: approximate chunk length for num_workers.
+        window_seconds: max length of audio decoded and transcribed at
+            once without num_workers. Each window is a separate whisper
+            call: the text of the previous window is passed as its
+            initial_prompt (instead of whisper's own conditioning on
+            previous text), and timestamps are clamped to the window.
+            Audio up to window_seconds is transcribed in one call.
+        return_language: also return the language detected by whisper
+            (e.g. 'en', or None if not detected). It is the most common
+            one of the windows or chunks.
+    Returns:
+        (caption, word timestamps)
+    """
+    if num_workers is None:
+        with span('whisper.transcribe', model_name=model_name):
+            segments = []
+            languages = []
+            for (offset, window) in iter_audio_windows(audio, window_seconds):
+                # whisper conditions on the text before a window only
+                # through the prompt
+                prompt = ''.join(item['text'] for item in segments[-20:])
+                window_segments, language = _transcribe_chunk(
+                    window,
+                    offset / SAMPLE_RATE,
+                    model_name,
+                    translate_to,
+                    verbose,
+                    prompt[-PROMPT_CHARS:].strip() or None,
+                )
+                segments += window_segments
+                languages.append(language)
+            language = _main_language(languages)
     else:
-        # XXX: Whisper cannot translate English to other language
-        result = model.transcribe(
-            audio_path,
-            task='translate',
-            language=translate_to,
-            verbose=verbose,
-            word_timestamps=True,
-        )
+        with span('whisper.transcribe_chunked', model_name=model_name):
+            segments, language = transcribe_chunked(
+                audio,
+                model_name,
+                translate_to,
+                num_workers,
+                chunk_seconds,
+                return_language=True,
+            )
 
-    segments = result['segments']
     word_timestamps: list[WordTimestamp] = list(
-        chain(*[item['words'] for item in result['segments']])
+        chain(*[item['words'] for item in segments])
     )
 
     caption: list[CaptionData] = [
@@ -47,20 +425,24 @@ def generate_transcribed_caption(
     if save_path is not None:
         save_caption(caption, save_path)
 
+    if return_language:
+        return caption, word_timestamps, language
     return caption, word_timestamps
 
 
 if __name__ == '__main__':
     import argparse
 
+    from transcribe_worker import transcribe_with_worker, worker_available
+
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        'dir',
+        '--dir',
         '-d',
         help='target dir of audio file and output caption file',
     )
     parser.add_argument(
-        'audio',
+        '--audio',
         '-a',
         help='audio file name',
         default='audio.mp3',
@@ -70,10 +452,30 @@ if __name__ == '__main__':
         help='model name',
         default='base',
     )
+    parser.add_argument(
+        '--num_workers',
+        help='transcribe chunks of audio in this many processes',
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        '--worker',
+        help='socket path of transcribe worker (see transcribe_worker.py)',
+        default=None,
+    )
     args = parser.parse_args()
 
-    generate_transcribed_caption(
-        f'{args.dir}/{args.audio}',  # default download file_name
-        model_name=args.model,
-        save_path=f'{args.dir}/whisper.vtt',
-    )
+    if args.worker is not None and worker_available(args.worker):
+        transcribe_with_worker(
+            args.worker,
+            f'{args.dir}/{args.audio}',
+            model_name=args.model,
+            save_path=f'{args.dir}/whisper.vtt',
+        )
+    else:
+        generate_transcribed_caption(
+            f'{args.dir}/{args.audio}',  # default download file_name
+            model_name=args.model,
+            save_path=f'{args.dir}/whisper.vtt',
+            num_workers=args.num_workers,
+        )
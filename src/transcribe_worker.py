@@ -0,0 +1,188 @@
+"""
+Long-lived transcription worker.
+
+The worker keeps whisper models resident and takes jobs over a Unix socket,
+so later transcriptions only pay for inference.
+Protocol: one JSON object per line in both directions.
+
+$ python src/transcribe_worker.py --preload base
+"""
+
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import traceback
+
+from captions import CaptionData, WordTimestamp, save_caption
+from transcribe import generate_transcribed_caption, model_cache
+
+DEFAULT_SOCKET_PATH = os.environ.get(
+    'TRANSCRIBE_WORKER_SOCKET',
+    os.path.join(tempfile.gettempdir(), 'youtube-downloader-whisper.sock'),
+)
+
+
+class TranscribeWorkerError(Exception):
+    pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server: TranscribeWorker = self.server  # type: ignore
+        for line in self.rfile:
+            try:
+                response = server.process(json.loads(line))
+            except Exception as e:
+                traceback.print_exc()
+                response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+            self.wfile.write(
+                (json.dumps(response, default=float) + '\n').encode()
+            )
+            self.wfile.flush()
+
+
+class TranscribeWorker(socketserver.UnixStreamServer):
+    """
+    Unix socket server running transcription jobs one at a time.
+
+    Args:
+        socket_path: path of the Unix socket.
+        max_models: number of models kept in memory (LRU).
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, max_models=2):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _Handler)
+        model_cache.max_models = max_models
+
+    def process(self, request: dict):
+        op = request.get('op', 'transcribe')
+        if op == 'ping':
+            return {'ok': True}
+        if op == 'shutdown':
+            threading.Thread(target=self.shutdown).start()
+            return {'ok': True}
+        if op != 'transcribe':
+            raise ValueError(f'unknown op: {op}')
+
+        caption, word_timestamps, language = generate_transcribed_caption(
+            request['audio_path'],
+            model_name=request.get('model_name', 'base'),
+            translate_to=request.get('translate_to'),
+            verbose=request.get('verbose', False),
+            num_workers=request.get('num_workers'),
+            return_language=True,
+        )
+        return {
+            'ok': True,
+            'caption': caption,
+            'word_timestamps': word_timestamps,
+            'language': language,
+        }
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):  # type: ignore
+            os.remove(self.server_address)  # type: ignore
+
+
+def _request(socket_path: str, request: dict, timeout: float | None = None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        with sock.makefile('rwb') as f:
+            f.write((json.dumps(request) + '\n').encode())
+            f.flush()
+            line = f.readline()
+
+    if line == b'':
+        raise TranscribeWorkerError('worker closed the connection.')
+    response = json.loads(line)
+    if not response['ok']:
+        raise TranscribeWorkerError(response['error'])
+    return response
+
+
+def worker_available(socket_path=DEFAULT_SOCKET_PATH):
+    try:
+        _request(socket_path, {'op': 'ping'}, timeout=1.0)
+    except (OSError, TranscribeWorkerError):
+        return False
+    return True
+
+
+def transcribe_with_worker(
+    socket_path: str,
+    audio_path: str,
+    model_name='base',
+    translate_to: str | None = None,
+    save_path: str | None = None,
+    verbose=False,
+    num_workers: int | None = None,
+    return_language=False,
+):
+    """
+    Same as `generate_transcribed_caption`, but runs on the worker.
+
+    Args:
+        num_workers: processes the worker transcribes chunks of audio in
+            (None: in the worker process).
+    """
+    response = _request(
+        socket_path,
+        {
+            'op': 'transcribe',
+            'audio_path': os.path.abspath(audio_path),
+            'model_name': model_name,
+            'translate_to': translate_to,
+            'verbose': verbose,
+            'num_workers': num_workers,
+        },
+    )
+    caption: list[CaptionData] = response['caption']
+    word_timestamps: list[WordTimestamp] = response['word_timestamps']
+    language: str | None = response.get('language')
+
+    if save_path is not None:
+        save_caption(caption, save_path)
+
+    if return_language:
+        return caption, word_timestamps, language
+    return caption, word_timestamps
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--socket',
+        help='socket path',
+        default=DEFAULT_SOCKET_PATH,
+    )
+    parser.add_argument(
+        '--max_models',
+        help='number of models kept in memory',
+        default=2,
+        type=int,
+    )
+    parser.add_argument(
+        '--preload',
+        help='model names loaded at startup (comma separated)',
+        default='',
+    )
+    args = parser.parse_args()
+
+    for model_name in filter(None, args.preload.split(',')):
+        model_cache.get(model_name)
+
+    with TranscribeWorker(args.socket, args.max_models) as server:
+        print(f'Transcribe worker is listening on {args.socket}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
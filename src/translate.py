@@ -1,14 +1,110 @@
-import math
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
 from typing import TypedDict
+from urllib.parse import quote_plus
 
-import requests  # type: ignore
+from caption_track import CaptionTrack
 from captions import (
     CaptionData,
     caption_to_sentences,
     load_caption_file,
     save_caption,
 )
+from tracing import span, submit
+from translation_memory import (
+    DEFAULT_MEMORY_PATH,
+    TranslationMemory,
+    normalize_text,
+)
+
+
+# DEEPL_API_URL (e.g. https://api.deepl.com for pro keys) is read when a
+# client is created, so a url in .env loaded by main.py is used
+DEFAULT_DEEPL_API_URL = 'https://api-free.deepl.com'
+# throttled (429) and server errors are worth another try
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# DeepL rejects request bodies over 128 KiB (some room for other fields)
+DEFAULT_MAX_REQUEST_BYTES = 127 * 1024
+DEFAULT_MAX_REQUEST_CHARS = 30_000
+
+
+class TranslationError(Exception):
+    pass
+
+
+class TranslationStats(TypedDict):
+    hits: int
+    misses: int
+    chars_saved: int
+    duplicates: int
+    requests: int
+    chars_sent: int
+
+
+def empty_stats() -> TranslationStats:
+    return {
+        'hits': 0,
+        'misses': 0,
+        'chars_saved': 0,
+        'duplicates': 0,
+        'requests': 0,
+        'chars_sent': 0,
+    }
+
+
+def print_translation_stats(stats: TranslationStats):
+    print(
+        f'translation memory: {stats["hits"]} hits, '
+        f'{stats["misses"]} misses, '
+        f'{stats["chars_saved"]} characters saved'
+    )
+    print(
+        f'translation api: {stats["requests"]} requests, '
+        f'{stats["chars_sent"]} characters sent, '
+        f'{stats["duplicates"]} duplicate lines sent once'
+    )
+
+
+def pack_batches(
+    texts: list[str],
+    max_texts=500,
+    max_chars=DEFAULT_MAX_REQUEST_CHARS,
+    max_bytes=DEFAULT_MAX_REQUEST_BYTES,
+):
+    """
+    Split texts into requests filled up to the budgets.
+
+    Args:
+        max_texts: texts per request.
+        max_chars: characters of the texts per request.
+        max_bytes: size of the form-encoded texts per request.
+    Returns:
+        Batches of texts in the original order. A text over the budgets
+        is sent alone.
+    """
+    batches: list[list[str]] = []
+    batch: list[str] = []
+    num_chars = 0
+    num_bytes = 0
+    for text in texts:
+        text_bytes = len('&text=') + len(quote_plus(text))
+        if len(batch) > 0 and (
+            len(batch) == max_texts
+            or num_chars + len(text) > max_chars
+            or num_bytes + text_bytes > max_bytes
+        ):
+            batches.append(batch)
+            batch = []
+            num_chars = 0
+            num_bytes = 0
+        batch.append(text)
+        num_chars += len(text)
+        num_bytes += text_bytes
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches
 
 
 class DeeplResponse(TypedDict):
@@ -16,24 +112,185 @@ class DeeplResponse(TypedDict):
     translations: list[str] | None
 
 
+def _retry_after(value: str | None):
+    """Seconds to wait from a Retry-After header (seconds or HTTP date)."""
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0.0)
+
+
+class DeeplClient:
+    """
+    DeepL API client sending batches concurrently over a pooled session.
+
+    Args:
+        api_key: DeepL auth key (default: DEEPL_API_KEY).
+        base_url: API url (default: DEEPL_API_URL, or the free API).
+        max_workers: number of concurrent requests.
+        retries: retries per request on 429/5xx and connection errors.
+        backoff: first retry delay in seconds, doubled on each retry
+            (Retry-After of the response is used when given).
+        max_backoff: upper limit of a retry delay.
+        timeout: timeout of each request.
+    """
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        base_url: str | None = None,
+        max_workers=4,
+        retries=5,
+        backoff=0.5,
+        max_backoff=30.0,
+        timeout=30.0,
+    ):
+        import requests  # type: ignore
+        from requests.adapters import HTTPAdapter  # type: ignore
+
+        if api_key is None:
+            api_key = os.environ.get('DEEPL_API_KEY')
+        if base_url is None:
+            base_url = os.environ.get('DEEPL_API_URL', DEFAULT_DEEPL_API_URL)
+
+        self.api_key = api_key
+        self.url = f'{base_url.rstrip("/")}/v2/translate'
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Authorization'] = f'DeepL-Auth-Key {api_key}'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def _delay(self, attempt: int, retry_after: str | None = None):
+        delay = _retry_after(retry_after)
+        if delay is None:
+            delay = self.backoff * 2**attempt
+        return min(delay, self.max_backoff)
+
+    def post(self, texts: list[str], source_lang='EN', target_lang='JA'):
+        """
+        Send one translate request, retrying throttled and failed ones.
+
+        Returns:
+            The last response (its status code is not checked).
+        """
+        import requests  # type: ignore
+
+        data = {
+            'text': texts,
+            'source_lang': source_lang,
+            'target_lang': target_lang,
+        }
+        attempt = 0
+        while True:
+            try:
+                res = self.session.post(
+                    self.url, data=data, timeout=self.timeout
+                )
+            except requests.RequestException:
+                if attempt == self.retries:
+                    raise
+                delay = self._delay(attempt)
+            else:
+                if (
+                    res.status_code not in RETRY_STATUS_CODES
+                    or attempt == self.retries
+                ):
+                    return res
+                delay = self._delay(attempt, res.headers.get('Retry-After'))
+            time.sleep(delay)
+            attempt += 1
+
+    def translate(self, texts: list[str], source_lang='EN', target_lang='JA'):
+        """
+        Translate one batch of texts.
+
+        Raises:
+            TranslationError: the request failed after all retries.
+        """
+        import requests  # type: ignore
+
+        try:
+            with span('deepl.request', num_texts=len(texts)):
+                res = self.post(texts, source_lang, target_lang)
+        except requests.RequestException as e:
+            raise TranslationError(str(e)) from e
+        if res.status_code != 200:
+            raise TranslationError(
+                f'DeepL returned status {res.status_code}: {res.text[:200]}'
+            )
+
+        translations = [item['text'] for item in res.json()['translations']]
+        if len(translations) != len(texts):
+            raise TranslationError(
+                f'sent {len(texts)} texts, got {len(translations)}.'
+            )
+        return translations
+
+    def translate_batches(
+        self,
+        batches: list[list[str]],
+        source_lang='EN',
+        target_lang='JA',
+    ):
+        """
+        Translate batches concurrently.
+
+        Returns:
+            Translations of each batch, in the order of batches.
+        Raises:
+            TranslationError: a batch failed (the others are cancelled).
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = [
+            submit(
+                executor, self.translate, batch, source_lang, target_lang
+            )
+            for batch in batches
+        ]
+        try:
+            return [future.result() for future in futures]
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
 # TODO: create args class for cleaner inheritance
 def deepl_translate(
     text: str | list[str],
     source_lang='EN',
     target_lang='JA',
     api_key=os.environ.get('DEEPL_API_KEY'),
+    client: DeeplClient | None = None,
 ) -> DeeplResponse:
-    res = requests.post(
-        'https://api-free.deepl.com/v2/translate',
-        headers={'Authorization': f'DeepL-Auth-Key {api_key}'},
-        data={
-            'text': text,
-            'source_lang': source_lang,
-            'target_lang': target_lang,
-        },
-    )
+    texts = [text] if isinstance(text, str) else text
+    if client is None:
+        with DeeplClient(api_key, max_workers=1) as client:
+            res = client.post(texts, source_lang, target_lang)
+    else:
+        res = client.post(texts, source_lang, target_lang)
 
-    # TODO: log errors
     if res.status_code != 200:
         return {
             'status_code': res.status_code,
@@ -47,43 +304,94 @@ def deepl_translate(
 
 
 def translate_captions(
-    caption: list[CaptionData],
+    caption: list[CaptionData] | CaptionTrack,
     source_lang='EN',
     target_lang='JA',
     deepl_api_key=os.environ.get('DEEPL_API_KEY'),
     num_batches=500,
-) -> list[CaptionData] | None:
+    client: DeeplClient | None = None,
+    memory: TranslationMemory | None = None,
+    stats: TranslationStats | None = None,
+    max_chars=DEFAULT_MAX_REQUEST_CHARS,
+    max_bytes=DEFAULT_MAX_REQUEST_BYTES,
+):
+    """
+    Translate caption texts with DeepL (batches are sent concurrently).
+
+    Each distinct text (after normalization) is translated once and the
+    translation is used for every cue with that text.
+
+    Args:
+        num_batches: max texts per request.
+        memory: only texts missing in the memory are sent to the API.
+        stats: counters updated with this translation.
+        max_chars: max characters per request.
+        max_bytes: max size of the texts per request (form-encoded).
+    Returns:
+        Translated caption of the same type as caption (a CaptionTrack
+        for a track, a list of CaptionData otherwise).
+    Raises:
+        TranslationError: a batch could not be translated, so no partial
+            translation is returned.
+    """
     if num_batches < 1 or num_batches > 500:
         raise ValueError('num_batches should be between 1 and 500 integer.')
-
-    translated: list[CaptionData] = []
-
-    num_requests = math.ceil(len(caption) / num_batches)
-
-    for i in range(num_requests):
-        caption_batch = caption[i * num_batches : (i + 1) * num_batches]
-        deepl_response = deepl_translate(
-            text=[item['text'] for item in caption_batch],
-            source_lang=source_lang,
-            target_lang=target_lang,
-            api_key=deepl_api_key,
-        )
-
-        # TODO: more sophisticated error handling
-        if deepl_response['translations'] is None:
-            break
-        if len(deepl_response['translations']) != len(caption_batch):
-            break
-
-        new_captions: list[CaptionData] = [
-            {**item, 'text': res_text}
-            for (item, res_text) in zip(
-                caption_batch, deepl_response['translations']
+    if stats is None:
+        stats = empty_stats()
+
+    if isinstance(caption, CaptionTrack):
+        texts = caption.texts
+    else:
+        texts = [item['text'] for item in caption]
+
+    # first text of each normalized form is sent for all of them
+    keys = [normalize_text(text) for text in texts]
+    distinct: dict[str, str] = {}
+    for (key, text) in zip(keys, texts):
+        distinct.setdefault(key, text)
+
+    found: dict[str, str] = {}
+    if memory is not None:
+        found = memory.get_many(distinct.values(), source_lang, target_lang)
+    num_misses = 0
+    for (key, text) in zip(keys, texts):
+        if key in found:
+            stats['hits'] += 1
+            stats['chars_saved'] += len(text)
+        else:
+            num_misses += 1
+    stats['misses'] += num_misses
+
+    miss_keys = [key for key in distinct if key not in found]
+    miss_texts = [distinct[key] for key in miss_keys]
+    stats['duplicates'] += num_misses - len(miss_texts)
+    batches = pack_batches(miss_texts, num_batches, max_chars, max_bytes)
+
+    if len(batches) == 0:
+        results = []
+    elif client is None:
+        with DeeplClient(deepl_api_key) as client:
+            results = client.translate_batches(
+                batches, source_lang, target_lang
             )
-        ]
-
-        translated.extend(new_captions)
-
+    else:
+        results = client.translate_batches(batches, source_lang, target_lang)
+    stats['requests'] += len(batches)
+    stats['chars_sent'] += sum(map(len, miss_texts))
+
+    new_texts = [text for result in results for text in result]
+    found.update(zip(miss_keys, new_texts))
+    if memory is not None:
+        memory.put_many(zip(miss_texts, new_texts), source_lang, target_lang)
+    translated_texts = [found[key] for key in keys]
+
+    if isinstance(caption, CaptionTrack):
+        return caption.with_texts(translated_texts)
+
+    translated: list[CaptionData] = [
+        {**item, 'text': res_text}
+        for (item, res_text) in zip(caption, translated_texts)
+    ]
     return translated
 
 
@@ -95,23 +403,56 @@ def create_translated_caption(
     source_lang='EN',
     target_lang='JA',
     num_batches=500,
+    client: DeeplClient | None = None,
+    memory: TranslationMemory | None = None,
 ):
+    """
+    Translate a caption file and save it.
+
+    Args:
+        memory: translation memory (hits and misses are printed).
+    Returns:
+        TranslationStats, or None if the translation failed.
+    """
     caption = load_caption_file(file_path)
     if trim_caption_to_sentences is True:
         caption = caption_to_sentences(caption)
 
-    translated_caption = translate_captions(
-        caption, source_lang, target_lang, deepl_api_key, num_batches
-    )
-
-    if translated_caption is None:
-        print('failed to translate caption.')
+    stats = empty_stats()
+    try:
+        translated_caption = translate_captions(
+            CaptionTrack.from_captions(caption),
+            source_lang,
+            target_lang,
+            deepl_api_key,
+            num_batches,
+            client=client,
+            memory=memory,
+            stats=stats,
+        )
+    except TranslationError as e:
+        print(f'failed to translate caption: {e}')
         return
 
-    save_caption(translated_caption, save_path)
+    save_caption(translated_caption, save_path)  # type: ignore
+    print_translation_stats(stats)
+    return stats
 
 
-def combine_captions(cap_1: list[CaptionData], cap_2: list[CaptionData]):
+def combine_captions(
+    cap_1: list[CaptionData] | CaptionTrack,
+    cap_2: list[CaptionData] | CaptionTrack,
+):
+    """
+    Join texts of both captions cue by cue.
+
+    Returns:
+        Combined caption of the same type as cap_1.
+    """
+    if isinstance(cap_1, CaptionTrack):
+        if not isinstance(cap_2, CaptionTrack):
+            cap_2 = CaptionTrack.from_captions(cap_2)
+        return cap_1.combine(cap_2)
     if len(cap_1) != len(cap_2):
         raise ValueError('both captions should be the same index length.')
 
@@ -131,10 +472,12 @@ def combine_translated_captions(
     translated_caption_path: str,
     save_path: str,
 ):
-    raw_cap = load_caption_file(raw_caption_path)
-    translated_cap = load_caption_file(translated_caption_path)
-    new_cap = combine_captions(raw_cap, translated_cap)
-    save_caption(new_cap, save_path)
+    raw_cap = CaptionTrack.from_captions(load_caption_file(raw_caption_path))
+    translated_cap = CaptionTrack.from_captions(
+        load_caption_file(translated_caption_path)
+    )
+    new_cap = raw_cap.combine(translated_cap)
+    save_caption(new_cap, save_path)  # type: ignore
 
 
 if __name__ == '__main__':
@@ -146,14 +489,32 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        'dir',
+        '--dir',
         '-d',
         help='target dir of caption file',
+        required=True,
+    )
+    parser.add_argument(
+        '--base_url',
+        help='DeepL API url (default: DEEPL_API_URL, or the free API)',
+        default=None,
+    )
+    parser.add_argument(
+        '--memory',
+        help='translation memory file (empty to disable)',
+        default=DEFAULT_MEMORY_PATH,
     )
     args = parser.parse_args()
 
-    create_translated_caption(
-        f'{args.dir}/whisper.vtt',  # need srt file with puncts for caption_to_sentences!
-        f'{args.dir}/translated.vtt',
-        deepl_api_key=os.environ.get('DEEPL_API_KEY', ''),
-    )
+    memory = None if args.memory == '' else TranslationMemory(args.memory)
+    with DeeplClient(
+        os.environ.get('DEEPL_API_KEY', ''), base_url=args.base_url
+    ) as client:
+        # need a caption with punctuation for caption_to_sentences
+        create_translated_caption(
+            f'{args.dir}/whisper.vtt',
+            f'{args.dir}/translated.vtt',
+            deepl_api_key=os.environ.get('DEEPL_API_KEY', ''),
+            client=client,
+            memory=memory,
+        )
@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Iterable
+
+from cache import CACHE_DIR
+
+DEFAULT_MEMORY_PATH = os.environ.get(
+    'TRANSLATION_MEMORY_PATH',
+    os.path.join(CACHE_DIR, 'translation_memory.sqlite3'),
+)
+# total size of source and translated texts (utf-8)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def normalize_text(text: str):
+    """Key of a text in the memory (NFC, collapsed whitespace)."""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+class TranslationMemory:
+    """
+    On-disk cache of translations (SQLite).
+
+    Entries are keyed by (normalized text, source_lang, target_lang).
+    When the texts exceed max_bytes, the least recently used entries are
+    evicted.
+
+    Args:
+        path: database file (':memory:' for a temporary one).
+        max_bytes: size limit of the stored texts.
+    """
+
+    def __init__(
+        self, path=DEFAULT_MEMORY_PATH, max_bytes=DEFAULT_MAX_BYTES
+    ):
+        if path != ':memory:':
+            os.makedirs(
+                os.path.dirname(os.path.abspath(path)), exist_ok=True
+            )
+        self.path = path
+        self.max_bytes = max_bytes
+        # other processes/threads may use the same file: wait for locks
+        self._conn = sqlite3.connect(
+            path, timeout=30.0, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS translations ('
+                ' text TEXT NOT NULL,'
+                ' source_lang TEXT NOT NULL,'
+                ' target_lang TEXT NOT NULL,'
+                ' translation TEXT NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' last_used REAL NOT NULL,'
+                ' PRIMARY KEY (text, source_lang, target_lang))'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS translations_last_used'
+                ' ON translations (last_used)'
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._conn.execute(
+                'SELECT COUNT(*) FROM translations'
+            ).fetchone()
+        return count
+
+    def size(self):
+        """Bytes of the stored texts."""
+        with self._lock:
+            (size,) = self._conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM translations'
+            ).fetchone()
+        return size
+
+    def get_many(
+        self, texts: Iterable[str], source_lang: str, target_lang: str
+    ):
+        """
+        Returns:
+            {normalized text: translation} of the texts in the memory.
+        """
+        keys = list({normalize_text(text) for text in texts})
+        found: dict[str, str] = {}
+        with self._lock, self._conn:
+            # stay below the limit of sql variables
+            for i in range(0, len(keys), 500):
+                part = keys[i : i + 500]
+                placeholders = ','.join('?' * len(part))
+                rows = self._conn.execute(
+                    'SELECT text, translation FROM translations'
+                    ' WHERE source_lang = ? AND target_lang = ?'
+                    f' AND text IN ({placeholders})',
+                    [source_lang, target_lang, *part],
+                ).fetchall()
+                found.update(rows)
+            self._conn.executemany(
+                'UPDATE translations SET last_used = ?'
+                ' WHERE text = ? AND source_lang = ? AND target_lang = ?',
+                [
+                    (time.time(), text, source_lang, target_lang)
+                    for text in found
+                ],
+            )
+        return found
+
+    def put_many(
+        self,
+        pairs: Iterable[tuple[str, str]],
+        source_lang: str,
+        target_lang: str,
+    ):
+        """Store (text, translation) pairs and evict old entries."""
+        now = time.time()
+        rows = [
+            (
+                key,
+                source_lang,
+                target_lang,
+                translation,
+                len(key.encode()) + len(translation.encode()),
+                now,
+            )
+            for (key, translation) in (
+                (normalize_text(text), translation)
+                for (text, translation) in pairs
+            )
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO translations'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                rows,
+            )
+            self._evict()
+
+    def _evict(self):
+        # keep the most recently used entries that fit in max_bytes
+        self._conn.execute(
+            'DELETE FROM translations WHERE rowid IN ('
+            ' SELECT rowid FROM ('
+            '  SELECT rowid, SUM(size) OVER ('
+            '   ORDER BY last_used DESC, rowid DESC) AS total'
+            '  FROM translations)'
+            ' WHERE total > ?)',
+            (self.max_bytes,),
+        )
@@ -0,0 +1,220 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Iterable, TypedDict
+from urllib.parse import parse_qs, urlparse
+
+from cache import FileCache
+from captions import fetch_transcript
+from pytubefix import YouTube  # type: ignore
+
+# titles and stream lists rarely change (stream urls are refreshed)
+VIDEO_INFO_TTL = 7 * 24 * 60 * 60
+# refresh urls expiring within this many seconds
+URL_EXPIRY_MARGIN = 10 * 60
+
+
+class StreamInfo(TypedDict):
+    itag: int
+    type: str
+    subtype: str
+    is_progressive: bool
+    is_adaptive: bool
+    resolution: str | None
+    abr: str | None
+    fps: int | None
+    video_codec: str | None
+    audio_codec: str | None
+    filesize: int | None
+    url: str
+
+
+class VideoInfo(TypedDict):
+    video_id: str
+    title: str
+    streams: list[StreamInfo]
+
+
+def stream_info(stream) -> StreamInfo:
+    """JSON-serializable copy of a pytube Stream."""
+    return {
+        'itag': stream.itag,
+        'type': stream.type,
+        'subtype': stream.subtype,
+        'is_progressive': stream.is_progressive,
+        'is_adaptive': stream.is_adaptive,
+        'resolution': stream.resolution,
+        'abr': stream.abr,
+        'fps': getattr(stream, 'fps', None),
+        'video_codec': stream.video_codec,
+        'audio_codec': stream.audio_codec,
+        # `filesize` sends a HEAD request when the size is not in the
+        # manifest, which is too slow for every stream
+        'filesize': getattr(stream, '_filesize', None) or None,
+        'url': stream.url,
+    }
+
+
+def url_expires_at(url: str):
+    """Expiry (unix time) of a signed googlevideo url, if any."""
+    expire = parse_qs(urlparse(url).query).get('expire')
+    if expire is None:
+        return None
+    return float(expire[0])
+
+
+def _number(value: str | None):
+    """'1080p' -> 1080, '128kbps' -> 128"""
+    if value is None:
+        return 0
+    return int(''.join(c for c in value if c.isdigit()) or 0)
+
+
+def select_audio_stream(streams: list[StreamInfo]):
+    """Select the audio-only stream with the highest bitrate."""
+    candidates = [
+        stream
+        for stream in streams
+        if stream['type'] == 'audio' and stream['is_adaptive']
+    ]
+    if len(candidates) == 0:
+        return None
+    return max(candidates, key=lambda stream: _number(stream['abr']))
+
+
+def select_video_stream(
+    streams: list[StreamInfo],
+    resolutions: str | list[str] = ['1080p', '720p'],
+):
+    """Select the highest resolution of mp4 video-only streams."""
+    if isinstance(resolutions, str):
+        resolutions = [resolutions]
+    candidates = [
+        stream
+        for stream in streams
+        if not stream['is_progressive']
+        and stream['type'] == 'video'
+        and stream['subtype'] == 'mp4'
+        and stream['resolution'] in resolutions
+    ]
+    if len(candidates) == 0:
+        return None
+    return max(candidates, key=lambda stream: _number(stream['resolution']))
+
+
+def select_progressive_stream(streams: list[StreamInfo]):
+    """Select the lowest resolution of mp4 streams with audio."""
+    candidates = [
+        stream
+        for stream in streams
+        if stream['is_progressive'] and stream['subtype'] == 'mp4'
+    ]
+    if len(candidates) == 0:
+        return None
+    return min(candidates, key=lambda stream: _number(stream['resolution']))
+
+
+class MediaSource(ABC):
+    """
+    Metadata, streams and transcripts of a video from some backend.
+
+    Title and streams are resolved once and kept in cache. Stream urls
+    may expire (e.g. signed youtube urls), so an expired url is refreshed
+    when it is requested while the rest of the metadata is reused.
+
+    Backends implement `_fetch` and `fetch_transcript`.
+
+    Args:
+        video_id: id of the video in the backend.
+        cache: cache of VideoInfo (None: always fetch).
+    """
+
+    # transcripts are cached by video id (see captions.load_yt_transcript)
+    cache_transcripts = True
+
+    def __init__(self, video_id: str, cache: FileCache | None = None):
+        self.video_id = video_id
+        self.url = video_id
+        self.cache = cache
+        self._info: VideoInfo | None = None
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _fetch(self) -> VideoInfo:
+        """Returns: title and streams (with urls) of the video."""
+
+    @abstractmethod
+    def fetch_transcript(self, languages: Iterable[str] = ('en',)):
+        """
+        Returns:
+            Raw transcript in the first available language:
+            [{'text': str, 'start': float, 'duration': float}]
+        """
+
+    def _update(self):
+        self._info = self._fetch()
+        if self.cache is not None:
+            self.cache.put(self.video_id, self._info)
+
+    @property
+    def info(self):
+        with self._lock:
+            if self._info is None and self.cache is not None:
+                self._info = self.cache.get(self.video_id)
+            if self._info is None:
+                self._update()
+            return self._info
+
+    @property
+    def title(self) -> str:
+        return self.info['title']
+
+    @property
+    def streams(self) -> list[StreamInfo]:
+        return self.info['streams']
+
+    def stream_url(self, itag: int):
+        """Url of a stream, refreshed if it has expired."""
+        # resolve metadata (from cache) first
+        self.info
+        with self._lock:
+            stream = self._find(itag)
+            expires_at = url_expires_at(stream['url'])
+            if (
+                expires_at is not None
+                and expires_at - URL_EXPIRY_MARGIN < time.time()
+            ):
+                self._update()
+                stream = self._find(itag)
+            return stream['url']
+
+    def _find(self, itag: int):
+        for stream in self._info['streams']:  # type: ignore
+            if stream['itag'] == itag:
+                return stream
+        raise KeyError(f'no stream with itag {itag}.')
+
+
+class VideoSource(MediaSource):
+    """
+    Youtube backend (pytubefix and youtube-transcript-api).
+
+    Args:
+        video_id: youtube video id.
+        cache: cache of VideoInfo (None: always fetch).
+    """
+
+    def __init__(self, video_id: str, cache: FileCache | None = None):
+        super().__init__(video_id, cache)
+        self.url = f'https://www.youtube.com/watch?v={video_id}'
+
+    def _fetch(self) -> VideoInfo:
+        yt = YouTube(self.url)
+        return {
+            'video_id': self.video_id,
+            'title': yt.title,
+            'streams': [stream_info(stream) for stream in yt.streams],
+        }
+
+    def fetch_transcript(self, languages: Iterable[str] = ('en',)):
+        return fetch_transcript(self.video_id, languages)
@@ -1,82 +1,319 @@
+import os
+import re
 import subprocess
 
-import moviepy.editor as mpe  # type: ignore
-from pytube import YouTube  # type: ignore
+from downloader import DownloadError, download_file
+from progress import ProgressMonitor
+from tracing import span, traced
+from video_source import (
+    StreamInfo,
+    VideoSource,
+    select_audio_stream,
+    select_progressive_stream,
+    select_video_stream,
+)
 
+# (video codec, audio codec) tried in order when muxing.
+# Streams are copied as they are unless the container cannot hold them.
+MUX_CODECS = [
+    ('copy', 'copy'),
+    ('copy', 'aac'),
+    ('libx264', 'aac'),
+]
 
-def combine_audio(vidname: str, audname: str, outname: str, fps=60):
+# ffmpeg errors meaning the container cannot hold a copied codec.
+# Other errors (missing input, bad subtitle, full disk) are not retried.
+MUX_INCOMPATIBLE = re.compile(
+    r'could not find tag for codec'
+    r'|not currently supported in container'
+    r'|incompatible with output codec'
+    r'|in mp4 support is experimental'
+    r'|are supported for webm',
+    re.IGNORECASE,
+)
+
+# downloads of a stream after its connections failed or stalled
+STREAM_RETRIES = 2
+
+# file extension of native audio stream by mime subtype
+AUDIO_SUBTYPE_EXTS = {'mp4': 'm4a', 'webm': 'webm'}
+
+
+@traced('moviepy.reencode')
+def combine_audio_moviepy(vidname: str, audname: str, outname: str, fps=60):
+    """Re-encode the whole video with moviepy (slow)."""
     # https://stackoverflow.com/questions/63881088/how-to-merge-mp3-and-mp4-in-python-mute-a-mp4-file-and-add-a-mp3-file-on-it
-    if vidname == outname:
-        raise ValueError(
-            'using same outname as vidname causes combining bugs!'
-        )
+    import moviepy.editor as mpe  # type: ignore
+
     my_clip = mpe.VideoFileClip(vidname)
     audio_background = mpe.AudioFileClip(audname)
     final_clip = my_clip.set_audio(audio_background)
     final_clip.write_videofile(outname, fps=fps)
 
 
-def download_audio(yt: YouTube, output_path: str, filename='audio.mp3'):
-    audio_stream = (
-        yt.streams.filter(
-            progressive=True,
-            file_extension='mp4',
+@traced('ffmpeg.assemble')
+def assemble_video(
+    video_file: str,
+    audio_file: str,
+    output_file: str,
+    subtitle_files: list[str] = [],
+    subtitle_languages: list[str] | None = None,
+    subtitle_titles: list[str] | None = None,
+):
+    """
+    Write video, audio and subtitle tracks into output_file in one pass.
+
+    Video and audio streams are copied without re-encoding. Codecs are
+    re-encoded only when ffmpeg reports that the container of output_file
+    cannot hold them; any other ffmpeg error is raised at once.
+
+    Args:
+        video_file: video file (its audio track is ignored).
+        audio_file: audio file.
+        output_file: output file.
+        subtitle_files: srt/vtt files added as subtitle tracks.
+        subtitle_languages: ISO 639-2 language of each subtitle track.
+        subtitle_titles: title of each subtitle track (default: file name).
+    """
+    if output_file in (video_file, audio_file):
+        raise ValueError(
+            'using same output_file as an input causes combining bugs!'
+        )
+
+    if subtitle_titles is None:
+        subtitle_titles = [
+            os.path.splitext(os.path.basename(file))[0]
+            for file in subtitle_files
+        ]
+
+    inputs = ['-i', video_file, '-i', audio_file]
+    maps = ['-map', '0:v:0', '-map', '1:a:0']
+    metadata = []
+    for i, subtitle_file in enumerate(subtitle_files):
+        inputs += ['-i', subtitle_file]
+        maps += ['-map', f'{i + 2}:0']
+        if subtitle_languages is not None:
+            metadata += [
+                f'-metadata:s:s:{i}',
+                f'language={subtitle_languages[i]}',
+            ]
+        # mp4 keeps track names as handler_name, mkv as title
+        metadata += [
+            f'-metadata:s:s:{i}',
+            f'title={subtitle_titles[i]}',
+            f'-metadata:s:s:{i}',
+            f'handler_name={subtitle_titles[i]}',
+        ]
+
+    ext = os.path.splitext(output_file)[1]
+    scodec = 'mov_text' if ext in ('.mp4', '.m4v', '.mov') else 'copy'
+
+    for i, (vcodec, acodec) in enumerate(MUX_CODECS):
+        codecs = ['-c:v', vcodec, '-c:a', acodec]
+        if len(subtitle_files) > 0:
+            codecs += ['-c:s', scodec]
+        res = subprocess.run(
+            ['ffmpeg', '-y', *inputs, *maps, *codecs, *metadata, output_file],
+            capture_output=True,
+        )
+        if res.returncode == 0:
+            return
+
+        stderr = res.stderr.decode(errors='replace')
+        if i == len(MUX_CODECS) - 1 or not MUX_INCOMPATIBLE.search(stderr):
+            print(stderr)
+            lines = stderr.strip().splitlines()
+            reason = lines[-1] if lines else f'exit code {res.returncode}'
+            raise RuntimeError(f'Failed to assemble {output_file}: {reason}')
+        print(
+            f'Failed to mux with vcodec={vcodec}, acodec={acodec}. '
+            'Retrying with re-encoding...'
+        )
+
+
+def combine_audio(
+    vidname: str,
+    audname: str,
+    outname: str,
+    fps=60,
+    reencode=False,
+):
+    """
+    Mux a video-only file and an audio file into outname.
+
+    Args:
+        vidname: video file (audio track is ignored).
+        audname: audio file.
+        outname: output file.
+        fps: fps of re-encoded video (moviepy only).
+        reencode: re-encode the whole video with moviepy (old behavior).
+    """
+    if vidname == outname:
+        raise ValueError(
+            'using same outname as vidname causes combining bugs!'
+        )
+
+    if reencode is True:
+        combine_audio_moviepy(vidname, audname, outname, fps=fps)
+        return
+
+    assemble_video(vidname, audname, outname)
+
+
+def download_stream(
+    source: VideoSource,
+    stream: StreamInfo,
+    output_path: str,
+    filename: str,
+    connections=4,
+    progress: ProgressMonitor | None = None,
+    retries=STREAM_RETRIES,
+):
+    """
+    Download a stream with parallel range requests.
+
+    A failed download (e.g. connections kept stalling) is retried from
+    where it stopped, with a new url if the previous one has expired.
+    """
+    import requests  # type: ignore
+
+    tracker = None
+    if progress is not None:
+        tracker = progress.track(
+            f'{source.video_id}/{stream["type"]}', stream['filesize']
         )
-        .order_by('resolution')
-        .first()
+
+    with span('download.stream', itag=stream['itag'], type=stream['type']):
+        for attempt in range(retries + 1):
+            if tracker is not None:
+                tracker.restart()
+            try:
+                download_file(
+                    source.stream_url(stream['itag']),
+                    f'{output_path}/{filename}',
+                    filesize=stream['filesize'],
+                    connections=connections,
+                    on_chunk=tracker,
+                )
+                break
+            except (DownloadError, requests.RequestException) as e:
+                if attempt == retries:
+                    if tracker is not None:
+                        tracker.complete(error=str(e))
+                    raise
+                print(f'Failed to download {filename} ({e}). Retrying...')
+
+    if tracker is not None:
+        tracker.complete()
+
+
+@traced('ffmpeg.convert_audio')
+def convert_audio(input_file: str, output_file: str):
+    """Transcode audio with ffmpeg (codec is chosen from output ext)."""
+    subprocess.run(
+        ['ffmpeg', '-y', '-i', input_file, '-vn', output_file],
+        capture_output=True,
+        check=True,
     )
 
+
+def download_audio(
+    source: VideoSource,
+    output_path: str,
+    filename='audio',
+    connections=4,
+    progress: ProgressMonitor | None = None,
+):
+    """
+    Download audio in its native container (m4a/webm).
+
+    Args:
+        source: video to download.
+        output_path: dir to save audio.
+        filename: file name without extension.
+        connections: number of parallel connections.
+        progress: monitor of download progress.
+    Returns:
+        Saved file name, or None if no audio is available.
+    """
+    audio_stream = select_audio_stream(source.streams)
+
+    if audio_stream is not None:
+        ext = AUDIO_SUBTYPE_EXTS.get(
+            audio_stream['subtype'], audio_stream['subtype']
+        )
+        size = ''
+        if audio_stream['filesize'] is not None:
+            size = f' ({audio_stream["filesize"] / 1e6:.1f}MB)'
+        print(
+            f'Audio: {audio_stream["abr"]} {audio_stream["audio_codec"]}'
+            + size
+        )
+        print('Downloading audio...')
+        download_stream(
+            source,
+            audio_stream,
+            output_path,
+            f'{filename}.{ext}',
+            connections,
+            progress,
+        )
+        return f'{filename}.{ext}'
+
+    # fallback to the audio track of the lowest resolution video
+    audio_stream = select_progressive_stream(source.streams)
+
     if audio_stream is None:
         print('No audio available.')
-        return False
+        return None
 
-    print(f'Video with audio resolution: {audio_stream.resolution}')
+    print(f'Video with audio resolution: {audio_stream["resolution"]}')
 
     print('Downloading video for audio...')
-    audio_stream.download(
-        output_path=output_path,
-        filename='low_res.mp4',
+    download_stream(
+        source,
+        audio_stream,
+        output_path,
+        'low_res.mp4',
+        connections,
+        progress,
     )
-
-    print('converting mp4 to mp3...')
     subprocess.run(
         [
             'ffmpeg',
+            '-y',
             '-i',
             f'{output_path}/low_res.mp4',
-            f'{output_path}/{filename}',
-        ]
+            '-vn',
+            '-c:a',
+            'copy',
+            f'{output_path}/{filename}.m4a',
+        ],
+        capture_output=True,
+        check=True,
     )
-    subprocess.run(['rm', '-rf', f'{output_path}/low_res.mp4'])
-    return True
+    os.remove(f'{output_path}/low_res.mp4')
+    return f'{filename}.m4a'
 
 
 def download_video(
-    yt: YouTube,
+    source: VideoSource,
     output_path: str,
     resolutions: str | list[str] = ['1080p', '720p'],
     filename='video.mp4',
+    connections=4,
+    progress: ProgressMonitor | None = None,
 ):
-    video_stream = (
-        yt.streams.filter(
-            progressive=False,
-            file_extension='mp4',
-            res=resolutions,
-        )
-        .order_by('resolution')
-        .desc()
-        .first()
-    )
+    video_stream = select_video_stream(source.streams, resolutions)
     if video_stream is None:
         print('No allowed resolutions for video.')
         return False
 
-    print(f'Video resolution: {video_stream.resolution}')
+    print(f'Video resolution: {video_stream["resolution"]}')
 
     print('Downloading video...')
-    video_stream.download(
-        output_path=output_path,
-        filename=filename,
+    download_stream(
+        source, video_stream, output_path, filename, connections, progress
     )
     return True
 
@@ -109,6 +346,11 @@ if __name__ == '__main__':
         default='audio.mp3',
         required=False,
     )
+    parser.add_argument(
+        '--reencode',
+        help='re-encode the whole video with moviepy',
+        action='store_true',
+    )
 
     args = parser.parse_args()
 
@@ -117,5 +359,6 @@ if __name__ == '__main__':
         f'{args.dir}/{args.audio}',
         f'{args.dir}/{args.vout}',
         fps=60,
+        reencode=args.reencode,
     )
     subprocess.run(['rm', '-rf', f'{args.dir}/{args.vin}'])
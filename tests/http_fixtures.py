@@ -0,0 +1,172 @@
+"""Local HTTP servers standing in for remote services in tests/benchmarks."""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from src.local_source import MediaServer
+
+
+class LocalServer:
+    """Run a handler class on a random localhost port in a thread."""
+
+    def __init__(self, handler_class: type[BaseHTTPRequestHandler]):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.fixture = self  # type: ignore
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True
+        )
+        self.requests: list[dict] = []
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class RangeServer(MediaServer):
+    """
+    MediaServer serving payload at any path.
+
+    Args:
+        payload: bytes to serve.
+    """
+
+    def __init__(
+        self,
+        payload: bytes,
+        latency=0.0,
+        bandwidth: int | None = None,
+        fail_from: int | None = None,
+        stall_at: int | None = None,
+        stall=0.0,
+    ):
+        self._dir = tempfile.TemporaryDirectory()
+        super().__init__(
+            self._dir.name, latency, bandwidth, fail_from, stall_at, stall
+        )
+        self.payload = payload
+        self.path = os.path.join(self.root, 'payload')
+        with open(self.path, 'wb') as f:
+            f.write(payload)
+
+    def resolve(self, url_path: str):
+        return self.path
+
+    def close(self):
+        super().close()
+        self._dir.cleanup()
+
+
+class _DeeplHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data: dict, headers: dict = {}):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for (key, value) in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fixture: DeeplServer = self.server.fixture  # type: ignore
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        texts = form.get('text', [])
+        number = fixture.begin(
+            {
+                'path': self.path,
+                'authorization': self.headers.get('Authorization'),
+                'texts': texts,
+                'target_lang': form['target_lang'][0],
+            }
+        )
+        try:
+            time.sleep(fixture.latency)
+            if number < fixture.throttle:
+                self._send_json(
+                    429,
+                    {'message': 'Too many requests'},
+                    {'Retry-After': str(fixture.retry_after)},
+                )
+                return
+            if fixture.fail_status is not None:
+                self._send_json(fixture.fail_status, {'message': 'error'})
+                return
+
+            target_lang = form['target_lang'][0]
+            self._send_json(
+                200,
+                {
+                    'translations': [
+                        {
+                            'detected_source_language': 'EN',
+                            'text': f'[{target_lang}] {text}',
+                        }
+                        for text in texts
+                    ]
+                },
+            )
+        finally:
+            fixture.end()
+
+
+class DeeplServer(LocalServer):
+    """
+    Stand-in of the DeepL translate API (/v2/translate).
+
+    Texts are "translated" to `[<target_lang>] <text>`.
+
+    Args:
+        latency: seconds before each response.
+        throttle: the first throttle requests get 429 with Retry-After.
+        retry_after: Retry-After header value (seconds) of 429 responses.
+        fail_status: answer every other request with this status.
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        throttle=0,
+        retry_after=0.0,
+        fail_status: int | None = None,
+    ):
+        super().__init__(_DeeplHandler)
+        self.latency = latency
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.fail_status = fail_status
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def begin(self, request: dict):
+        """Record a request and return its number (0, 1, ...)."""
+        with self._lock:
+            self.requests.append(request)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return len(self.requests) - 1
+
+    def end(self):
+        with self._lock:
+            self.in_flight -= 1
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+import src.batch as batch
+
+
+def test_run_batch_continues_after_failure(monkeypatch, capsys) -> None:
+    calls = []
+    lock = threading.Lock()
+
+    def download_and_save_video(video_id, out_dir, scheduler, **kwargs):
+        with lock:
+            calls.append((video_id, out_dir))
+        if video_id == 'bad':
+            raise RuntimeError('no streams')
+        return video_id != 'missing'
+
+    monkeypatch.setattr(
+        batch, 'download_and_save_video', download_and_save_video
+    )
+
+    results = batch.run_batch(
+        ['a', 'bad', 'missing', 'b', 'a'], max_workers=2, out_dir='out'
+    )
+
+    assert [result['video_id'] for result in results] == [
+        'a',
+        'bad',
+        'missing',
+        'b',
+    ]
+    assert [result['success'] for result in results] == [
+        True,
+        False,
+        False,
+        True,
+    ]
+    assert results[1]['error'] == 'RuntimeError: no streams'
+    assert results[2]['error'] == 'failed'
+    assert sorted(calls) == [
+        ('a', 'out/a'),
+        ('b', 'out/b'),
+        ('bad', 'out/bad'),
+        ('missing', 'out/missing'),
+    ]
+
+    batch.print_summary(results)
+    out = capsys.readouterr().out
+    assert '2/4 videos succeeded.' in out
+    assert 'FAILED bad' in out
+    assert 'RuntimeError: no streams' in out
+
+
+def test_run_batch_interrupt_is_not_a_failure(monkeypatch) -> None:
+    def download_and_save_video(video_id, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(
+        batch, 'download_and_save_video', download_and_save_video
+    )
+    with pytest.raises(KeyboardInterrupt):
+        batch.run_batch(['a'], max_workers=1)
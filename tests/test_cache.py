@@ -0,0 +1,55 @@
+import time
+
+import src.captions as captions
+from src.cache import FileCache
+from src.captions import CaptionExt, load_yt_caption, load_yt_transcript
+
+TRANSCRIPT = [
+    {'text': 'Hello.', 'start': 0.0, 'duration': 2.5},
+    {'text': 'Good bye.', 'start': 2.0, 'duration': 1.5},
+]
+
+
+def test_file_cache_expiry(tmp_path, monkeypatch) -> None:
+    cache = FileCache('test', ttl=60, cache_dir=str(tmp_path))
+    assert cache.get('a/b') is None
+    cache.put('a/b', {'value': [1, 2]})
+    assert cache.get('a/b') == {'value': [1, 2]}
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert cache.get('a/b') is None
+
+
+def test_transcript_cache(tmp_path, monkeypatch) -> None:
+    fetched = []
+
+    def fetch_transcript(video_id, languages):
+        fetched.append((video_id, languages))
+        return TRANSCRIPT
+
+    monkeypatch.setattr(captions, 'fetch_transcript', fetch_transcript)
+    cache = FileCache('transcripts', cache_dir=str(tmp_path))
+
+    caption = load_yt_transcript('abc', cache=cache)
+    # overlapping cue ends at the start of the next one
+    assert caption[0] == {
+        'index': 1,
+        'start': 0.0,
+        'end': 2.0,
+        'duration': 2.0,
+        'text': 'Hello.',
+    }
+    assert fetched == [('abc', ['en'])]
+
+    formatted = load_yt_caption(
+        'abc', {CaptionExt.SRT, CaptionExt.VTT, CaptionExt.TXT}, cache=cache
+    )
+    assert formatted['srt'].startswith('1\n00:00:00,000 --> 00:00:02,000\n')
+    assert formatted['vtt'].startswith('WEBVTT\n\n1\n00:00:00.000')
+    assert formatted['txt'] == 'Hello.\nGood bye.\n'
+    # every format is rendered from the cached transcript
+    assert len(fetched) == 1
+
+    load_yt_transcript('abc', languages=['de'], cache=cache)
+    assert len(fetched) == 2
@@ -4,8 +4,14 @@ import json
 
 from src.captions import (
     CaptionData,
+    CaptionExt,
     caption_to_sentences,
+    iter_caption_file,
     load_caption_file,
+    parse_caption_lines,
+    save_caption,
+    split_word_windows,
+    strftime,
     word_timestamp_to_caption,
 )
 
@@ -78,6 +84,59 @@ def test_load_vtt_no_index() -> None:
     assert caption_item == expected_dict
 
 
+def test_iter_caption_file() -> None:
+    items = iter_caption_file('tests/sample_caption.vtt')
+    assert next(items)['index'] == 1
+    assert next(items)['start'] == 3.760
+    assert len(list(items)) == 90
+
+
+def test_parse_malformed_caption() -> None:
+    lines = [
+        'WEBVTT',
+        '',
+        '00:01.000 --> 00:02.500 align:start position:0%',
+        'no blank line',
+        '7',
+        '00:00:03.000 --> 00:00:04.000',
+        'first line ',
+        'second line',
+        '',
+        '00:00:05.000 --> 00:00:06.000',
+        'a' * 100_000,
+    ]
+    caption = list(parse_caption_lines(lines, CaptionExt.VTT))
+
+    assert [item['index'] for item in caption] == [1, 7, 3]
+    assert caption[0] == {
+        'index': 1,
+        'start': 1.0,
+        'end': 2.5,
+        'duration': 1.5,
+        'text': 'no blank line',
+    }
+    assert caption[1]['text'] == 'first line second line'
+    assert len(caption[2]['text']) == 100_000
+
+
+def test_strftime() -> None:
+    assert strftime(3723.456, CaptionExt.SRT) == '01:02:03,456'
+    assert strftime(13.68, CaptionExt.VTT) == '00:00:13.680'
+    assert strftime(59.9996, CaptionExt.VTT) == '00:01:00.000'
+
+
+def test_save_caption(tmp_path) -> None:
+    caption = load_caption_file('tests/sample_caption.srt')
+    for ext in ('srt', 'vtt'):
+        save_caption(iter(caption), str(tmp_path / f'caption.{ext}'))
+        assert load_caption_file(str(tmp_path / f'caption.{ext}')) == caption
+
+    save_caption(caption, str(tmp_path / 'caption.txt'))
+    with open(tmp_path / 'caption.txt') as f:
+        lines = f.read().splitlines()
+    assert lines[2] == caption[2]['text']
+
+
 def test_caption_to_sentences() -> None:
     caption = load_caption_file('tests/sample_caption.srt')
     converted_caption = caption_to_sentences(caption)
@@ -108,3 +167,24 @@ def test_word_timestamp_to_caption() -> None:
         'text': expected_text,
     }
     assert caption[2] == expected
+
+
+def test_word_timestamp_to_caption_windows() -> None:
+    with open('tests/sample_wt.json', 'r') as f:
+        wt = json.loads(f.read())
+
+    windows = list(split_word_windows(wt, window_words=100))
+    assert sum(len(window) for window in windows) == len(wt)
+    for window in windows[:-1]:
+        assert len(window) >= 100
+        assert window[-1]['word'].rstrip().endswith('.')
+
+    # the rule based segmenter needs no model
+    caption = word_timestamp_to_caption(wt, segmenter='sentencizer')
+    windowed = word_timestamp_to_caption(
+        wt, segmenter='sentencizer', window_words=100
+    )
+    assert windowed == caption
+    assert [item['index'] for item in caption] == list(
+        range(1, len(caption) + 1)
+    )
@@ -0,0 +1,60 @@
+import pytest
+
+import src.translate as translate
+from src.caption_track import CaptionTrack
+from src.captions import load_caption_file
+
+
+def test_round_trip() -> None:
+    caption = load_caption_file('tests/sample_caption.srt')
+    track = CaptionTrack.from_captions(caption)
+
+    assert len(track) == 92
+    assert track[2] == caption[2]
+    assert track[-1] == caption[-1]
+    assert track.text(-92) == caption[0]['text']
+    with pytest.raises(IndexError):
+        track[92]
+    with pytest.raises(IndexError):
+        track.text(-93)
+    assert track.to_captions() == caption
+
+
+def test_time_operations() -> None:
+    track = CaptionTrack([0.0, 2.0, 5.0], [1.5, 4.0, 6.0], ['a', 'bc', 'd'])
+
+    shifted = track.shift(1.25)
+    assert shifted.starts.tolist() == [1.25, 3.25, 6.25]
+    assert shifted.texts == ['a', 'bc', 'd']
+
+    scaled = track.scale(2.0)
+    assert scaled.ends.tolist() == [3.0, 8.0, 12.0]
+    assert scaled.durations.tolist() == [3.0, 4.0, 2.0]
+
+    clipped = track.clip(1.0, 5.5)
+    assert clipped.to_captions() == [
+        {'index': 1, 'start': 1.0, 'end': 1.5, 'duration': 0.5, 'text': 'a'},
+        {'index': 2, 'start': 2.0, 'end': 4.0, 'duration': 2.0, 'text': 'bc'},
+        {'index': 3, 'start': 5.0, 'end': 5.5, 'duration': 0.5, 'text': 'd'},
+    ]
+    assert [item['index'] for item in track.clip(3.0)] == [2, 3]
+
+    combined = track.combine(track.with_texts(['x', 'y', 'z']))
+    assert combined.texts == ['a\nx', 'bc\ny', 'd\nz']
+    with pytest.raises(ValueError):
+        track.combine(CaptionTrack([0.0], [1.0], ['a']))
+
+
+def test_combine_keeps_input_type() -> None:
+    # the class translate sees (src is also on sys.path)
+    CaptionTrack = translate.CaptionTrack
+    track = CaptionTrack([0.0, 2.0], [1.5, 4.0], ['a', 'b'])
+    caption = track.to_captions()
+    other = track.with_texts(['x', 'y'])
+
+    combined = translate.combine_captions(track, other.to_captions())
+    assert isinstance(combined, CaptionTrack)
+    assert combined.texts == ['a\nx', 'b\ny']
+    combined = translate.combine_captions(caption, other)
+    assert [item['text'] for item in combined] == ['a\nx', 'b\ny']
+    assert isinstance(combined, list)
@@ -0,0 +1,117 @@
+import os
+
+import pytest
+
+from src.downloader import (
+    DownloadError,
+    Journal,
+    download_file,
+    journal_path,
+)
+from tests.http_fixtures import RangeServer
+
+PAYLOAD = os.urandom(1_000_000)
+
+
+def test_download_file(tmp_path) -> None:
+    path = str(tmp_path / 'video.mp4')
+    with RangeServer(PAYLOAD) as server:
+        size = download_file(
+            f'{server.url}/video', path, connections=4, chunk_size=100_000
+        )
+
+    assert size == len(PAYLOAD)
+    with open(path, 'rb') as f:
+        assert f.read() == PAYLOAD
+    assert len(server.requests) == 10
+    assert not os.path.exists(journal_path(path))
+
+
+def test_resume_download(tmp_path) -> None:
+    path = str(tmp_path / 'video.mp4')
+    with RangeServer(PAYLOAD, fail_from=500_000) as server:
+        with pytest.raises(DownloadError):
+            download_file(
+                f'{server.url}/video',
+                path,
+                connections=2,
+                chunk_size=100_000,
+                retries=0,
+            )
+    assert os.path.exists(journal_path(path))
+
+    with RangeServer(PAYLOAD) as server:
+        download_file(
+            f'{server.url}/video', path, connections=2, chunk_size=100_000
+        )
+
+    with open(path, 'rb') as f:
+        assert f.read() == PAYLOAD
+    # only the failed half is downloaded again
+    assert sorted(request['start'] for request in server.requests) == [
+        500_000,
+        600_000,
+        700_000,
+        800_000,
+        900_000,
+    ]
+
+
+def test_stalled_range_is_retried(tmp_path) -> None:
+    path = str(tmp_path / 'video.mp4')
+    written = []
+    with RangeServer(PAYLOAD, stall_at=250_000, stall=5.0) as server:
+        download_file(
+            f'{server.url}/video',
+            path,
+            connections=2,
+            chunk_size=100_000,
+            stall_timeout=0.5,
+            on_chunk=written.append,
+        )
+
+    with open(path, 'rb') as f:
+        assert f.read() == PAYLOAD
+    # the stalled range is requested again
+    starts = [request['start'] for request in server.requests]
+    assert starts.count(200_000) == 2
+    assert sum(written) == len(PAYLOAD)
+
+
+def test_file_without_journal_is_downloaded_again(tmp_path) -> None:
+    path = str(tmp_path / 'video.mp4')
+    # killed after the journal was written, before any range
+    Journal(journal_path(path), len(PAYLOAD), 100_000).save()
+    with open(path, 'wb') as f:
+        f.truncate(len(PAYLOAD))
+
+    with RangeServer(PAYLOAD) as server:
+        download_file(
+            f'{server.url}/video', path, connections=2, chunk_size=100_000
+        )
+    with open(path, 'rb') as f:
+        assert f.read() == PAYLOAD
+    assert len(server.requests) == 10
+
+
+def test_resumed_bytes_count_short_last_chunk(tmp_path) -> None:
+    path = str(tmp_path / 'video.mp4')
+    payload = PAYLOAD[:950_000]
+    with open(path, 'wb') as f:
+        f.write(payload)
+    # only the last chunk (50_000 bytes) is done
+    journal = Journal(journal_path(path), len(payload), 100_000)
+    journal.done = {9}
+    journal.save()
+
+    written = []
+    with RangeServer(payload) as server:
+        download_file(
+            f'{server.url}/video',
+            path,
+            connections=2,
+            chunk_size=100_000,
+            on_chunk=written.append,
+        )
+    assert written[0] == 50_000
+    assert sum(written) == len(payload)
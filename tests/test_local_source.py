@@ -0,0 +1,236 @@
+import functools
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+import src.loader as loader
+from src.cache import FileCache
+from src.captions import CaptionExt, load_yt_caption
+from src.local_source import LocalSource, MediaServer, add_fixture
+
+TRANSCRIPT = [
+    {'text': 'Hello.', 'start': 0.0, 'duration': 1.5},
+    {'text': 'Good bye.', 'start': 1.5, 'duration': 1.0},
+]
+
+
+@pytest.fixture
+def fixture_dir(tmp_path):
+    media_dir = tmp_path / 'media'
+    media_dir.mkdir()
+    (media_dir / 'audio.m4a').write_bytes(os.urandom(300_000))
+    (media_dir / 'video.mp4').write_bytes(os.urandom(700_000))
+    fixture_dir = tmp_path / 'fixtures'
+    add_fixture(
+        str(fixture_dir),
+        'vid1',
+        'Local Video',
+        [
+            {
+                'itag': 140,
+                'type': 'audio',
+                'subtype': 'mp4',
+                'abr': '128kbps',
+                'file': str(media_dir / 'audio.m4a'),
+            },
+            {
+                'itag': 137,
+                'type': 'video',
+                'subtype': 'mp4',
+                'resolution': '1080p',
+                'file': str(media_dir / 'video.mp4'),
+            },
+        ],
+        {'en': TRANSCRIPT},
+    )
+    return fixture_dir
+
+
+def test_local_source(fixture_dir) -> None:
+    source = LocalSource('vid1', fixture_dir=str(fixture_dir))
+    assert source.title == 'Local Video'
+    assert [stream['itag'] for stream in source.streams] == [140, 137]
+    assert source.stream_url(140).startswith('file://')
+    assert source.fetch_transcript(['de', 'en']) == TRANSCRIPT
+    with pytest.raises(LookupError):
+        source.fetch_transcript(['de'])
+
+
+def test_transcripts_not_cached(tmp_path) -> None:
+    cache = FileCache('transcripts', cache_dir=str(tmp_path / 'cache'))
+    for text in ['First.', 'Second.']:
+        # fixtures of different dirs share the video id
+        fixture_dir = tmp_path / text
+        transcript = [{'text': text, 'start': 0.0, 'duration': 1.0}]
+        add_fixture(str(fixture_dir), 'vid1', 'Title', [], {'en': transcript})
+        source = LocalSource('vid1', fixture_dir=str(fixture_dir))
+        caption = load_yt_caption(
+            'vid1', {CaptionExt.TXT}, cache=cache, source=source
+        )
+        assert caption['txt'].strip() == text
+    assert not os.path.exists(cache.dir)
+
+
+@pytest.mark.parametrize('served', [False, True])
+def test_download_from_local_source(
+    fixture_dir, tmp_path, monkeypatch, served
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    with MediaServer(str(fixture_dir), bandwidth=20_000_000) as server:
+        backend = functools.partial(
+            LocalSource,
+            fixture_dir=str(fixture_dir),
+            server=server if served else None,
+        )
+        assert loader.download_and_save_video(
+            'vid1',
+            download_only=True,
+            audio_format='native',
+            use_cache=False,
+            backend=backend,
+        )
+
+    out_dir = tmp_path / 'outputs' / 'local_video'
+    video_dir = fixture_dir / 'vid1'
+    assert (out_dir / 'audio.m4a').read_bytes() == (
+        video_dir / 'audio.m4a'
+    ).read_bytes()
+    assert (out_dir / 'no_audio.mp4').read_bytes() == (
+        video_dir / 'video.mp4'
+    ).read_bytes()
+    assert (out_dir / 'caption.srt').read_text().startswith('1\n00:00:00')
+
+
+def test_same_title_videos(tmp_path, monkeypatch) -> None:
+    fixture_dir = tmp_path / 'fixtures'
+    for video_id in ['vidA', 'vidB']:
+        media_dir = tmp_path / video_id
+        media_dir.mkdir()
+        (media_dir / 'audio.m4a').write_bytes(os.urandom(1000))
+        add_fixture(
+            str(fixture_dir),
+            video_id,
+            'Same Title',
+            [
+                {
+                    'itag': 140,
+                    'type': 'audio',
+                    'subtype': 'mp4',
+                    'file': str(media_dir / 'audio.m4a'),
+                }
+            ],
+            {'en': TRANSCRIPT},
+        )
+
+    monkeypatch.chdir(tmp_path)
+    backend = functools.partial(LocalSource, fixture_dir=str(fixture_dir))
+
+    def download(video_id, **kwargs):
+        return loader.download_and_save_video(
+            video_id,
+            mode='audio',
+            audio_format='native',
+            use_cache=False,
+            backend=backend,
+            **kwargs,
+        )
+
+    assert download('vidA')
+    out_dir = tmp_path / 'outputs' / 'same_title'
+    # vidB is not reported as done with the media of vidA
+    assert not download('vidB')
+    assert (out_dir / 'url.txt').read_text().endswith('vidA')
+    assert (out_dir / 'audio.m4a').read_bytes() == (
+        tmp_path / 'vidA' / 'audio.m4a'
+    ).read_bytes()
+
+    assert download('vidB', out_dir='same_title_b')
+    out_dir = tmp_path / 'outputs' / 'same_title_b'
+    assert (out_dir / 'audio.m4a').read_bytes() == (
+        tmp_path / 'vidB' / 'audio.m4a'
+    ).read_bytes()
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='needs ffmpeg')
+def test_mux_caption_languages(tmp_path, monkeypatch) -> None:
+    media = {
+        'video.mp4': ['testsrc=size=160x120:rate=10:duration=2'],
+        'audio.m4a': ['sine=duration=2'],
+    }
+    for (name, source) in media.items():
+        subprocess.run(
+            ['ffmpeg', '-y', '-f', 'lavfi', '-i', *source, tmp_path / name],
+            capture_output=True,
+            check=True,
+        )
+    fixture_dir = tmp_path / 'fixtures'
+    add_fixture(
+        str(fixture_dir),
+        'vid1',
+        'Local Video',
+        [
+            {
+                'itag': 140,
+                'type': 'audio',
+                'subtype': 'mp4',
+                'file': str(tmp_path / 'audio.m4a'),
+            },
+            {
+                'itag': 137,
+                'type': 'video',
+                'subtype': 'mp4',
+                'resolution': '1080p',
+                'file': str(tmp_path / 'video.mp4'),
+            },
+        ],
+        {
+            'en': TRANSCRIPT,
+            'ja': [{'text': 'こんにちは。', 'start': 0.0, 'duration': 1.5}],
+        },
+    )
+
+    monkeypatch.chdir(tmp_path)
+    backend = functools.partial(LocalSource, fixture_dir=str(fixture_dir))
+    assert loader.download_and_save_video(
+        'vid1',
+        use_cache=False,
+        caption_languages=['en', 'ja', 'de'],
+        backend=backend,
+    )
+
+    out_dir = tmp_path / 'outputs' / 'local_video'
+    # videos get the native stream even with the default audio_format
+    assert (out_dir / 'audio.m4a').exists()
+    assert not (out_dir / 'audio.mp3').exists()
+    assert (out_dir / 'caption.srt').exists()
+    assert (out_dir / 'caption.ja.srt').exists()
+    # no transcript in german
+    assert not (out_dir / 'caption.de.srt').exists()
+
+    res = subprocess.run(
+        ['ffmpeg', '-i', out_dir / 'video.mp4'], capture_output=True
+    )
+    info = res.stderr.decode()
+    assert re.search(r'\(eng\): Subtitle', info)
+    assert re.search(r'\(jpn\): Subtitle', info)
+    assert 'ja (YouTube)' in info
+    assert 'Audio: aac' in info
+
+    # mp3 is only made in audio mode
+    assert loader.download_and_save_video(
+        'vid1',
+        mode='audio',
+        out_dir='music',
+        use_cache=False,
+        backend=backend,
+    )
+    music_dir = tmp_path / 'outputs' / 'music'
+    assert (music_dir / 'audio.mp3').exists()
+    # the native stream is kept for transcription
+    assert (music_dir / 'audio.m4a').exists()
+    manifest = loader.StageManifest(str(music_dir))
+    assert manifest.outputs('audio') == ['audio.m4a']
+    assert manifest.is_done('mp3', inputs=['audio.m4a'])
@@ -0,0 +1,186 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import src.loader as loader
+from src.loader import CaptionExt
+from src.manifest import StageManifest
+
+
+def test_manifest_stages(tmp_path) -> None:
+    (tmp_path / 'audio.mp3').write_bytes(b'audio')
+    (tmp_path / 'out.mp4').write_bytes(b'video')
+
+    manifest = StageManifest(str(tmp_path))
+    assert not manifest.is_done('mux')
+    manifest.complete(
+        'mux', {'langs': ('eng',)}, ['out.mp4'], inputs=['audio.mp3']
+    )
+
+    # reloaded from disk
+    manifest = StageManifest(str(tmp_path))
+    assert manifest.is_done('mux', {'langs': ['eng']}, ['audio.mp3'])
+    assert manifest.outputs('mux') == ['out.mp4']
+    # other params or inputs
+    assert not manifest.is_done('mux', {'langs': ['jpn']}, ['audio.mp3'])
+    assert not manifest.is_done('mux', {'langs': ['eng']}, [])
+
+    # touched but same content
+    os.utime(tmp_path / 'audio.mp3', ns=(0, 0))
+    assert manifest.is_done('mux', {'langs': ['eng']}, ['audio.mp3'])
+
+    # same size, other content
+    (tmp_path / 'audio.mp3').write_bytes(b'AUDIO')
+    assert not manifest.is_done('mux', {'langs': ['eng']}, ['audio.mp3'])
+
+    manifest.invalidate('mux')
+    assert not manifest.is_done('mux')
+
+
+def test_unhashed_files(tmp_path) -> None:
+    (tmp_path / 'video.mp4').write_bytes(b'video')
+    manifest = StageManifest(str(tmp_path))
+    manifest.complete('mux', outputs=['video.mp4'], hash=False)
+    assert manifest.stages['mux']['outputs']['video.mp4']['sha256'] is None
+    assert manifest.is_done('mux')
+
+    # not hashed, so a touched file counts as changed
+    os.utime(tmp_path / 'video.mp4', ns=(0, 0))
+    assert not manifest.is_done('mux')
+
+
+@pytest.mark.parametrize('keep_streams', [False, True])
+def test_rerun_only_changed_stages(tmp_path, monkeypatch, keep_streams):
+    monkeypatch.chdir(tmp_path)
+    calls = []
+
+    def download_audio(source, output_path, filename, connections, **kwargs):
+        calls.append('audio')
+        with open(f'{output_path}/{filename}.m4a', 'w') as f:
+            f.write('audio')
+        return f'{filename}.m4a'
+
+    def download_video(source, output_path, filename, **kwargs):
+        calls.append('video')
+        with open(f'{output_path}/{filename}', 'w') as f:
+            f.write('video')
+        return True
+
+    def download_captions(video_id, output_path, languages, exts, *args, **kw):
+        calls.append('caption')
+        for ext in exts:
+            with open(f'{output_path}.{ext.value}', 'w') as f:
+                f.write(ext.value)
+        return [f'caption.{ext.value}' for ext in exts]
+
+    def assemble_video(video_file, audio_file, output_file, **kwargs):
+        calls.append(('mux', tuple(kwargs['subtitle_files'])))
+        with open(output_file, 'w') as f:
+            f.write('muxed')
+
+    monkeypatch.setattr(
+        loader,
+        'VideoSource',
+        lambda video_id, cache: SimpleNamespace(
+            video_id=video_id, url='url', title='Title'
+        ),
+    )
+    monkeypatch.setattr(loader, 'download_audio', download_audio)
+    monkeypatch.setattr(loader, 'download_video', download_video)
+    monkeypatch.setattr(loader, 'download_captions', download_captions)
+    monkeypatch.setattr(loader, 'assemble_video', assemble_video)
+
+    options = {
+        'out_dir': 'abc',
+        'audio_format': 'native',
+        'keep_streams': keep_streams,
+    }
+    assert loader.download_and_save_video(
+        'abc', caption_exts={CaptionExt.VTT}, **options
+    )
+    assert sorted(map(str, calls)) == [
+        "('mux', ('outputs/abc/caption.vtt',))",
+        'audio',
+        'caption',
+        'video',
+    ]
+    stream = tmp_path / 'outputs' / 'abc' / 'no_audio.mp4'
+    assert stream.exists() == keep_streams
+
+    # nothing changed
+    calls.clear()
+    assert loader.download_and_save_video(
+        'abc', caption_exts={CaptionExt.VTT}, **options
+    )
+    assert calls == []
+
+    # a new caption format is muxed again, with the removed stream
+    # downloaded again
+    assert loader.download_and_save_video(
+        'abc', caption_exts={CaptionExt.SRT, CaptionExt.VTT}, **options
+    )
+    mux = ('mux', ('outputs/abc/caption.srt',))
+    if keep_streams:
+        assert calls == ['caption', mux]
+    else:
+        assert calls == ['caption', 'video', mux]
+        assert not stream.exists()
+
+    # download_only leaves the stream in the dir
+    calls.clear()
+    assert loader.download_and_save_video(
+        'abc',
+        caption_exts={CaptionExt.SRT, CaptionExt.VTT},
+        download_only=True,
+        **options,
+    )
+    assert calls == ([] if keep_streams else ['video'])
+    assert stream.exists()
+
+    calls.clear()
+    assert loader.download_and_save_video(
+        'abc',
+        caption_exts={CaptionExt.SRT, CaptionExt.VTT},
+        force=True,
+        **options,
+    )
+    assert len(calls) == 4
+
+
+def test_transcription_language(tmp_path, monkeypatch) -> None:
+    calls = []
+
+    def generate_transcribed_caption(
+        audio_path, num_workers=None, return_language=False
+    ):
+        calls.append('whisper')
+        assert return_language
+        return [], [], 'ja'
+
+    def create_translated_caption(save_path, source_lang, target_lang, **kw):
+        calls.append((source_lang, target_lang))
+        with open(save_path, 'w') as f:
+            f.write('WEBVTT\n')
+        return {}
+
+    monkeypatch.setattr(
+        loader, 'generate_transcribed_caption', generate_transcribed_caption
+    )
+    monkeypatch.setattr(
+        loader, 'create_translated_caption', create_translated_caption
+    )
+    monkeypatch.setattr(loader, 'word_timestamp_to_caption', lambda w: [])
+    (tmp_path / 'audio.m4a').write_bytes(b'audio')
+
+    for _ in range(2):
+        tracks = loader.transcribe_audio(
+            str(tmp_path), 'audio.m4a', translate_languages=['ja', 'en']
+        )
+        # the detected language is kept in the manifest
+        assert tracks == [
+            ('transcribe.vtt', 'ja'),
+            ('translated.en.vtt', 'en'),
+        ]
+    # japanese is not translated into japanese
+    assert calls == ['whisper', ('JA', 'EN')]
@@ -0,0 +1,47 @@
+import os
+
+from src.downloader import download_file
+from src.progress import ProgressMonitor, StreamProgress
+from tests.http_fixtures import RangeServer
+
+PAYLOAD = os.urandom(1_000_000)
+
+
+def test_stream_progress() -> None:
+    infos = []
+    stream = StreamProgress('abc/audio', total=1000, on_progress=infos.append)
+    # resumed bytes are not counted in the speed
+    stream(400)
+    assert stream.speed() == 0.0
+    stream(100)
+    stream(-50)
+    assert stream.downloaded == 450
+    assert infos[-1]['speed'] > 0
+    assert infos[-1]['eta'] is not None
+    assert infos[-1]['idle'] < 1.0
+
+    stream.restart()
+    assert stream.info()['downloaded'] == 0
+
+
+def test_monitor_download(tmp_path) -> None:
+    completed = []
+    monitor = ProgressMonitor(on_complete=completed.append)
+    stream = monitor.track('abc/video', len(PAYLOAD))
+    with RangeServer(PAYLOAD, bandwidth=5_000_000) as server:
+        download_file(
+            f'{server.url}/video',
+            str(tmp_path / 'video.mp4'),
+            connections=4,
+            chunk_size=100_000,
+            on_chunk=stream,
+        )
+    stream.complete()
+    monitor.close()
+
+    assert completed[0]['name'] == 'abc/video'
+    assert completed[0]['downloaded'] == len(PAYLOAD)
+    assert completed[0]['done'] is True
+    summary = monitor.summary()
+    assert summary['downloaded'] == len(PAYLOAD)
+    assert summary['running'] == 0
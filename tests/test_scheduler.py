@@ -0,0 +1,82 @@
+import threading
+import time
+
+from src.scheduler import StageScheduler, default_stage_limits
+
+
+def test_stage_limit() -> None:
+    scheduler = StageScheduler({'ffmpeg': 2})
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def work(stage: str) -> None:
+        nonlocal running, max_running
+        with scheduler.stage(stage):
+            with lock:
+                running += 1
+                max_running = max(max_running, running)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+
+    threads = [
+        threading.Thread(target=work, args=('ffmpeg',)) for _ in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max_running == 2
+
+    # stages without limit are not bounded
+    threads = [
+        threading.Thread(target=work, args=('download',)) for _ in range(6)
+    ]
+    max_running = 0
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max_running > 2
+
+
+def test_stage_limits_hold_while_network_stages_overlap() -> None:
+    scheduler = StageScheduler(
+        default_stage_limits(network_workers=3, ffmpeg_workers=2)
+    )
+    lock = threading.Lock()
+    running: dict[str, int] = {}
+    peak: dict[str, int] = {}
+    overlaps = set()
+
+    def stage(name: str) -> None:
+        with lock:
+            overlaps.update(
+                frozenset((name, other))
+                for other in running
+                if running[other] > 0
+            )
+            running[name] = running.get(name, 0) + 1
+            peak[name] = max(peak.get(name, 0), running[name])
+        time.sleep(0.02)
+        with lock:
+            running[name] -= 1
+
+    def video() -> None:
+        # same chain as a video: download, transcript, then cpu stages
+        for name in ('download', 'transcript', 'ffmpeg', 'whisper'):
+            scheduler.run(name, stage, name)
+
+    threads = [threading.Thread(target=video) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak['download'] == 3
+    assert peak['transcript'] == 3
+    assert peak['ffmpeg'] == 2
+    assert peak['whisper'] == 1
+    # limited cpu stages do not hold back downloads of other videos
+    assert {'download', 'ffmpeg'} in overlaps
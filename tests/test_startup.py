@@ -0,0 +1,61 @@
+# Startup benchmark of the plain-download path
+# (no transcribe, translate or re-encode).
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+# generous budgets (importing whisper alone takes seconds and >200MB)
+MAX_IMPORT_SECONDS = 1.5
+MAX_RSS_MB = 120
+HEAVY_MODULES = [
+    'whisper',
+    'torch',
+    'spacy',
+    'thinc',
+    'moviepy',
+    'numpy',
+    'requests',
+]
+
+SCRIPT = """
+import json, resource, sys, time
+sys.path.insert(0, 'src')
+start = time.perf_counter()
+import batch, clients, dotenv, loader
+elapsed = time.perf_counter() - start
+try:
+    # ru_maxrss keeps the parent's peak across fork/exec on Linux
+    with open('/proc/self/status') as f:
+        line = next(line for line in f if line.startswith('VmHWM'))
+    rss_mb = int(line.split()[1]) / 1024
+except OSError:
+    # ru_maxrss is bytes on macOS
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 / 1024
+print(json.dumps({
+    'seconds': elapsed,
+    'rss_mb': rss_mb,
+    'modules': sorted(sys.modules),
+}))
+"""
+
+
+def test_plain_download_startup() -> None:
+    pytest.importorskip('pytubefix')
+    pytest.importorskip('resource')
+
+    res = subprocess.run(
+        [sys.executable, '-c', SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(res.stdout)
+    print(f'\nimport: {result["seconds"]:.3f}s, rss: {result["rss_mb"]:.1f}MB')
+
+    loaded = set(result['modules'])
+    assert [name for name in HEAVY_MODULES if name in loaded] == []
+    assert result['seconds'] < MAX_IMPORT_SECONDS
+    assert result['rss_mb'] < MAX_RSS_MB
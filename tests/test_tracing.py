@@ -0,0 +1,86 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import src.scheduler as scheduler
+from src.tracing import Tracer, submit
+
+
+def test_span_records(tmp_path) -> None:
+    tracer = Tracer()
+    # disabled: nothing is recorded
+    with tracer.span('download'):
+        pass
+    assert tracer.records == []
+
+    trace_path = tmp_path / 'trace.jsonl'
+    tracer.configure(trace_path=str(trace_path))
+    with tracer.span('video', video_id='abc'):
+        with tracer.span('download', itag=140):
+            time.sleep(0.01)
+        with pytest.raises(ValueError):
+            with tracer.span('ffmpeg'):
+                raise ValueError('bad input')
+    tracer.close()
+
+    lines = trace_path.read_text().splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [record['stage'] for record in records] == [
+        'download',
+        'ffmpeg',
+        'video',
+    ]
+    download, ffmpeg, video = records
+    # attributes are inherited by nested spans
+    assert download['attrs'] == {'video_id': 'abc', 'itag': 140}
+    assert ffmpeg['attrs'] == {'video_id': 'abc'}
+    assert download['wall'] >= 0.01
+    assert video['wall'] >= download['wall']
+    assert ffmpeg['error'] == 'ValueError: bad input'
+    assert download['error'] is None
+    assert download['peak_rss_mb'] > 0
+
+    summary = {row['stage']: row for row in tracer.summary()}
+    assert summary['ffmpeg']['errors'] == 1
+    assert summary['download']['count'] == 1
+
+
+def test_submit_keeps_attributes() -> None:
+    tracer = Tracer()
+    tracer.configure()
+
+    def work():
+        with tracer.span('transcript'):
+            pass
+
+    with tracer.span('video', video_id='abc'):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            submit(executor, work).result()
+    tracer.close()
+    assert tracer.records[0]['attrs'] == {'video_id': 'abc'}
+
+
+def test_scheduler_wait(monkeypatch) -> None:
+    tracer = Tracer()
+    tracer.configure()
+    monkeypatch.setattr(scheduler, 'span', tracer.span)
+    stages = scheduler.StageScheduler({'ffmpeg': 1})
+
+    def work():
+        with stages.stage('ffmpeg'):
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=work) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tracer.close()
+
+    # the second video waited for the slot of the first one
+    waits = sorted(record['wait'] for record in tracer.records)
+    assert waits[0] < 0.04
+    assert waits[1] >= 0.04
@@ -0,0 +1,160 @@
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+import src.transcribe as transcribe
+from src.transcribe import (
+    SAMPLE_RATE,
+    decode_audio,
+    find_silence_splits,
+    iter_audio_windows,
+)
+
+
+def test_find_silence_splits() -> None:
+    rng = np.random.default_rng(0)
+    audio = rng.uniform(-0.5, 0.5, SAMPLE_RATE * 100).astype(np.float32)
+    # silences at 25-26s, 52-53s and 80-81s
+    for start in (25, 52, 80):
+        audio[start * SAMPLE_RATE : (start + 1) * SAMPLE_RATE] = 0
+
+    splits = find_silence_splits(audio, chunk_seconds=30, search_seconds=10)
+
+    assert splits[0] == 0
+    assert splits[-1] == len(audio)
+    for (start, split) in zip((25, 52, 80), splits[1:-1]):
+        assert start * SAMPLE_RATE <= split < (start + 1) * SAMPLE_RATE
+    assert len(splits) == 5
+
+
+def test_find_silence_splits_short_audio() -> None:
+    audio = np.zeros(SAMPLE_RATE * 10, dtype=np.float32)
+    assert find_silence_splits(audio, chunk_seconds=30) == [0, len(audio)]
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='needs ffmpeg')
+def test_decode_audio_windows(tmp_path) -> None:
+    path = str(tmp_path / 'audio.m4a')
+    # 440Hz tone with a silence at 4-5s
+    subprocess.run(
+        [
+            'ffmpeg',
+            '-y',
+            '-f',
+            'lavfi',
+            '-i',
+            'sine=frequency=440:sample_rate=44100:duration=12',
+            '-af',
+            "volume=enable='between(t,4,5)':volume=0",
+            path,
+        ],
+        capture_output=True,
+        check=True,
+    )
+
+    audio = decode_audio(path)
+    assert audio.dtype == np.float32
+    assert abs(len(audio) - 12 * SAMPLE_RATE) < SAMPLE_RATE * 0.1
+    assert 0.1 < np.abs(audio).max() <= 1.0
+
+    windows = list(iter_audio_windows(path, window_seconds=5.5))
+    assert [offset for (offset, _) in windows[1:]] == [
+        offset + len(window) for (offset, window) in windows[:-1]
+    ]
+    assert all(len(window) <= 5.5 * SAMPLE_RATE for (_, window) in windows)
+    assert 4 * SAMPLE_RATE <= windows[1][0] < 5 * SAMPLE_RATE
+    # same samples as decoding at once
+    assert np.array_equal(np.concatenate([w for (_, w) in windows]), audio)
+
+    # a decoded buffer is split the same way
+    offsets = [offset for (offset, _) in iter_audio_windows(audio, 5.5)]
+    assert offsets == [offset for (offset, _) in windows]
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='needs ffmpeg')
+def test_decode_audio_error(tmp_path) -> None:
+    with pytest.raises(subprocess.CalledProcessError):
+        decode_audio(str(tmp_path / 'missing.m4a'))
+
+
+def test_transcribe_windows_shift_timestamps(monkeypatch) -> None:
+    class FakeModel:
+        def transcribe(self, audio, **kwargs):
+            end = len(audio) / SAMPLE_RATE
+            word = {'word': ' hi', 'start': 0.0, 'end': end}
+            return {
+                'segments': [
+                    {'start': 0.0, 'end': end, 'text': ' hi', 'words': [word]}
+                ],
+                'language': 'ja',
+            }
+
+    monkeypatch.setattr(
+        transcribe.model_cache, 'get', lambda name: FakeModel()
+    )
+    rng = np.random.default_rng(0)
+    audio = rng.uniform(-0.5, 0.5, SAMPLE_RATE * 25).astype(np.float32)
+    # windows end at the silences
+    for start in (8, 17):
+        audio[start * SAMPLE_RATE : (start + 1) * SAMPLE_RATE] = 0
+
+    caption, words, language = transcribe.generate_transcribed_caption(
+        audio, verbose=None, window_seconds=10, return_language=True
+    )
+
+    starts = [item['start'] for item in caption]
+    assert len(starts) == 3 and starts[0] == 0.0
+    assert 8 <= starts[1] < 9 and 17 <= starts[2] < 18
+    # each window is shifted by its offset
+    assert [item['end'] for item in words] == [*starts[1:], 25.0]
+    assert language == 'ja'
+
+
+def test_window_boundaries(monkeypatch) -> None:
+    prompts = []
+
+    class FakeModel:
+        def transcribe(self, audio, initial_prompt=None, **kwargs):
+            prompts.append(initial_prompt)
+            end = len(audio) / SAMPLE_RATE
+            # whisper may report times past the end of its input
+            segments = [
+                {'start': -0.3, 'end': end / 2, 'text': f' a{len(prompts)}'},
+                {'start': end / 2, 'end': end + 0.5, 'text': ' b'},
+            ]
+            for segment in segments:
+                segment['words'] = [
+                    {'word': segment['text'], **segment}  # type: ignore
+                ]
+            return {'segments': segments, 'language': 'en'}
+
+    monkeypatch.setattr(
+        transcribe.model_cache, 'get', lambda name: FakeModel()
+    )
+    rng = np.random.default_rng(0)
+    audio = rng.uniform(-0.5, 0.5, SAMPLE_RATE * 25).astype(np.float32)
+
+    caption, words = transcribe.generate_transcribed_caption(
+        audio, verbose=None, window_seconds=10
+    )
+
+    times = [(item['start'], item['end']) for item in caption]
+    assert len(times) == 2 * len(prompts) and len(prompts) > 2
+    assert times[0][0] == 0.0 and times[-1][1] == 25.0
+    # ordered and not overlapping across windows
+    for ((_, end), (start, _)) in zip(times, times[1:]):
+        assert end <= start
+    assert [item['start'] for item in words] == [t[0] for t in times]
+    # each window is prompted with the text before it
+    assert prompts[:3] == [None, 'a1 b', 'a1 b a2 b']
+
+
+def test_splits_shorter_than_a_frame() -> None:
+    audio = np.ones(1000, dtype=np.float32)
+    # search range (half of 0.001s) is shorter than a 0.05s frame
+    splits = find_silence_splits(audio, chunk_seconds=0.001)
+    assert splits == list(range(0, 1000, 16)) + [1000]
+    windows = list(iter_audio_windows(audio, window_seconds=0.001))
+    assert sum(len(window) for (_, window) in windows) == 1000
@@ -0,0 +1,152 @@
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import src.loader as loader
+import src.transcribe_worker as transcribe_worker
+from src.transcribe import ModelCache
+from src.transcribe_worker import (
+    TranscribeWorker,
+    TranscribeWorkerError,
+    transcribe_with_worker,
+    worker_available,
+)
+
+CAPTION = [
+    {'index': 1, 'start': 0.0, 'end': 1.0, 'duration': 1.0, 'text': 'hi'}
+]
+WORDS = [{'word': ' hi', 'start': 0.0, 'end': 1.0, 'probability': 0.9}]
+
+
+def test_model_cache_lru(monkeypatch) -> None:
+    loaded = []
+
+    def load_model(model_name):
+        loaded.append(model_name)
+        return SimpleNamespace(name=model_name)
+
+    monkeypatch.setitem(
+        sys.modules, 'whisper', SimpleNamespace(load_model=load_model)
+    )
+    cache = ModelCache(max_models=2)
+
+    base = cache.get('base')
+    assert cache.get('base') is base
+    cache.get('small')
+    # base is used again, so small is the least recently used one
+    cache.get('base')
+    cache.get('medium')
+
+    assert loaded == ['base', 'small', 'medium']
+    assert 'base' in cache
+    assert 'small' not in cache
+    assert 'medium' in cache
+
+    cache.get('small')
+    assert loaded[-1] == 'small'
+    assert 'base' not in cache
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    requests = []
+
+    def generate_transcribed_caption(audio_path, **kwargs):
+        requests.append((audio_path, kwargs))
+        if audio_path.endswith('broken.m4a'):
+            raise ValueError('cannot decode')
+        return CAPTION, WORDS, 'ja'
+
+    monkeypatch.setattr(
+        transcribe_worker,
+        'generate_transcribed_caption',
+        generate_transcribed_caption,
+    )
+    socket_path = str(tmp_path / 'worker.sock')
+    server = TranscribeWorker(socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path, requests
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_worker_protocol(worker, tmp_path) -> None:
+    socket_path, requests = worker
+    assert worker_available(socket_path)
+
+    caption, words, language = transcribe_with_worker(
+        socket_path,
+        str(tmp_path / 'audio.m4a'),
+        model_name='small',
+        save_path=str(tmp_path / 'out.vtt'),
+        num_workers=2,
+        return_language=True,
+    )
+    assert caption == CAPTION
+    assert words == WORDS
+    assert language == 'ja'
+    assert (tmp_path / 'out.vtt').read_text().startswith('WEBVTT')
+    assert requests[0] == (
+        str(tmp_path / 'audio.m4a'),
+        {
+            'model_name': 'small',
+            'translate_to': None,
+            'verbose': False,
+            'num_workers': 2,
+            'return_language': True,
+        },
+    )
+    # the language is opt-in
+    assert transcribe_with_worker(
+        socket_path, str(tmp_path / 'audio.m4a')
+    ) == (CAPTION, WORDS)
+
+    # errors are replied and the worker keeps serving
+    with pytest.raises(TranscribeWorkerError, match='ValueError'):
+        transcribe_with_worker(socket_path, str(tmp_path / 'broken.m4a'))
+    with pytest.raises(TranscribeWorkerError, match='unknown op'):
+        transcribe_worker._request(socket_path, {'op': 'reload'})
+    assert worker_available(socket_path)
+
+
+def test_fallback_without_worker(tmp_path, monkeypatch) -> None:
+    socket_path = str(tmp_path / 'missing.sock')
+    assert not worker_available(socket_path)
+
+    calls = []
+
+    def generate_transcribed_caption(
+        audio_path, num_workers=None, return_language=False
+    ):
+        calls.append((audio_path, num_workers))
+        assert return_language
+        return CAPTION, WORDS, 'en'
+
+    def transcribe_with_worker(*args, **kwargs):
+        raise AssertionError('the worker is not running')
+
+    monkeypatch.setattr(
+        loader, 'generate_transcribed_caption', generate_transcribed_caption
+    )
+    monkeypatch.setattr(
+        loader, 'transcribe_with_worker', transcribe_with_worker
+    )
+    monkeypatch.setattr(
+        loader, 'word_timestamp_to_caption', lambda words: CAPTION
+    )
+    (tmp_path / 'audio.m4a').write_bytes(b'audio')
+
+    tracks = loader.transcribe_audio(
+        str(tmp_path),
+        'audio.m4a',
+        translate=False,
+        worker_socket=socket_path,
+        num_workers=3,
+    )
+    assert calls == [(f'{tmp_path}/audio.m4a', 3)]
+    assert tracks == [('transcribe.vtt', 'en')]
+    assert (tmp_path / 'transcribe.vtt').exists()
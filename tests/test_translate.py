@@ -0,0 +1,131 @@
+import time
+
+import pytest
+
+# same class as used by translate (src modules import each other by bare name)
+from src.translate import (
+    CaptionTrack,
+    DeeplClient,
+    TranslationError,
+    deepl_translate,
+    empty_stats,
+    pack_batches,
+    translate_captions,
+)
+from tests.http_fixtures import DeeplServer
+
+TEXTS = [f'line {i}' for i in range(40)]
+
+
+def test_translate_batches_concurrently() -> None:
+    batches = [TEXTS[i : i + 5] for i in range(0, len(TEXTS), 5)]
+    with DeeplServer(latency=0.2) as server:
+        with DeeplClient('key', base_url=server.url, max_workers=4) as client:
+            start = time.perf_counter()
+            results = client.translate_batches(batches, 'EN', 'JA')
+            elapsed = time.perf_counter() - start
+
+    assert results == [[f'[JA] {text}' for text in batch] for batch in batches]
+    assert server.max_in_flight > 1
+    # 8 batches of 0.2s over 4 connections
+    assert elapsed < 8 * 0.2
+    assert server.requests[0]['path'] == '/v2/translate'
+    assert server.requests[0]['authorization'] == 'DeepL-Auth-Key key'
+
+
+def test_retry_throttled_requests() -> None:
+    with DeeplServer(throttle=2, retry_after=0.1) as server:
+        with DeeplClient('key', base_url=server.url, backoff=10.0) as client:
+            start = time.perf_counter()
+            translations = client.translate(TEXTS[:3], 'EN', 'DE')
+            elapsed = time.perf_counter() - start
+
+    assert translations == [f'[DE] {text}' for text in TEXTS[:3]]
+    assert len(server.requests) == 3
+    # Retry-After is used instead of the exponential backoff
+    assert 0.2 <= elapsed < 10.0
+
+
+def test_translate_captions_fails_clearly() -> None:
+    track = CaptionTrack(
+        starts=range(len(TEXTS)), ends=range(1, len(TEXTS) + 1), texts=TEXTS
+    )
+    with DeeplServer(fail_status=503) as server:
+        client = DeeplClient(
+            'key', base_url=server.url, retries=2, backoff=0.01
+        )
+        with pytest.raises(TranslationError):
+            translate_captions(track, num_batches=10, client=client)
+        assert deepl_translate('hello', client=client)['translations'] is None
+        client.close()
+
+    with DeeplServer() as server:
+        with DeeplClient('key', base_url=server.url) as client:
+            translated = translate_captions(
+                track, num_batches=10, client=client
+            )
+    assert translated.texts == [f'[JA] {text}' for text in TEXTS]
+    assert translated.starts.tolist() == track.starts.tolist()
+
+
+def test_pack_batches() -> None:
+    texts = ['a' * 10, 'b' * 10, 'c' * 10, 'd' * 25, 'e']
+    assert pack_batches(texts, max_texts=2) == [
+        texts[:2],
+        texts[2:4],
+        [texts[4]],
+    ]
+    assert pack_batches(texts, max_chars=20) == [
+        texts[:2],
+        [texts[2]],
+        # over the budget alone
+        [texts[3]],
+        [texts[4]],
+    ]
+    # '&text=' + 10 chars per text
+    assert pack_batches(texts[:3], max_bytes=32) == [texts[:2], [texts[2]]]
+    # non-ascii texts are larger once encoded
+    assert pack_batches(['\u3042' * 3] * 2, max_bytes=30) == [
+        ['\u3042' * 3]
+    ] * 2
+
+
+def test_translate_duplicates_once() -> None:
+    texts = ['[Music]', 'Hello.', '[Music]', ' [Music] ', 'Bye.'] * 20
+    caption = [
+        {'index': i, 'start': 0.0, 'end': 1.0, 'duration': 1.0, 'text': t}
+        for (i, t) in enumerate(texts)
+    ]
+    stats = empty_stats()
+    with DeeplServer() as server:
+        with DeeplClient('key', base_url=server.url) as client:
+            translated = translate_captions(
+                caption, client=client, stats=stats, max_chars=10
+            )
+
+    # requests are sent concurrently, so they arrive in any order
+    sent = [text for request in server.requests for text in request['texts']]
+    assert sorted(sent) == ['Bye.', 'Hello.', '[Music]']
+    assert [item['text'] for item in translated[:5]] == [
+        '[JA] [Music]',
+        '[JA] Hello.',
+        '[JA] [Music]',
+        '[JA] [Music]',
+        '[JA] Bye.',
+    ]
+    assert stats['requests'] == 2
+    assert stats['chars_sent'] == len('[Music]Hello.Bye.')
+    assert stats['duplicates'] == len(texts) - 3
+
+
+def test_api_url_is_read_from_env_on_creation(monkeypatch) -> None:
+    # e.g. set by load_dotenv after translate was imported
+    monkeypatch.setenv('DEEPL_API_URL', 'https://api.deepl.com/')
+    monkeypatch.setenv('DEEPL_API_KEY', 'pro-key')
+    with DeeplClient() as client:
+        assert client.url == 'https://api.deepl.com/v2/translate'
+        assert client.api_key == 'pro-key'
+
+    monkeypatch.delenv('DEEPL_API_URL')
+    with DeeplClient('key') as client:
+        assert client.url == 'https://api-free.deepl.com/v2/translate'
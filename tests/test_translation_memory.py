@@ -0,0 +1,58 @@
+from src.translate import DeeplClient, empty_stats, translate_captions
+from src.translation_memory import TranslationMemory, normalize_text
+from tests.http_fixtures import DeeplServer
+
+
+def test_normalize_text() -> None:
+    assert normalize_text('  Hello,\n world ') == 'Hello, world'
+    # composed and decomposed forms are the same key
+    assert normalize_text('Cafe\u0301') == normalize_text('Caf\u00e9')
+
+
+def test_memory_eviction(tmp_path) -> None:
+    path = str(tmp_path / 'memory.sqlite3')
+    with TranslationMemory(path, max_bytes=100) as memory:
+        memory.put_many([('a' * 20, 'b' * 20)], 'EN', 'JA')
+        memory.put_many([('c' * 20, 'd' * 20)], 'EN', 'JA')
+        # oldest entry is evicted to stay under 100 bytes
+        memory.put_many([('e' * 20, 'f' * 20)], 'EN', 'JA')
+        assert len(memory) == 2
+        assert memory.size() == 80
+
+    with TranslationMemory(path, max_bytes=100) as memory:
+        found = memory.get_many(['a' * 20, 'e' * 20], 'EN', 'JA')
+        assert found == {'e' * 20: 'f' * 20}
+        assert memory.get_many(['e' * 20], 'EN', 'DE') == {}
+
+
+def test_translate_with_memory(tmp_path) -> None:
+    caption = [
+        {'index': 1, 'start': 0.0, 'end': 1.0, 'duration': 1.0, 'text': t}
+        for t in ['Hello.', 'Intro music', 'Bye.']
+    ]
+    path = str(tmp_path / 'memory.sqlite3')
+    with DeeplServer() as server, TranslationMemory(path) as memory:
+        client = DeeplClient('key', base_url=server.url)
+        memory.put_many([('Intro  music', 'cached')], 'EN', 'JA')
+
+        stats = empty_stats()
+        translated = translate_captions(
+            caption, client=client, memory=memory, stats=stats
+        )
+        assert [item['text'] for item in translated] == [
+            '[JA] Hello.',
+            'cached',
+            '[JA] Bye.',
+        ]
+        assert stats['hits'] == 1
+        assert stats['misses'] == 2
+        assert stats['chars_saved'] == len('Intro music')
+        assert server.requests[0]['texts'] == ['Hello.', 'Bye.']
+
+        # everything comes from the memory the second time
+        stats = empty_stats()
+        translate_captions(caption, client=client, memory=memory, stats=stats)
+        assert stats['hits'] == 3
+        assert stats['requests'] == 0
+        assert len(server.requests) == 1
+        client.close()
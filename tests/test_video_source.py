@@ -0,0 +1,95 @@
+import time
+from types import SimpleNamespace
+
+import src.video_source as video_source
+from src.cache import FileCache
+from src.video_source import (
+    VideoSource,
+    select_audio_stream,
+    select_progressive_stream,
+    select_video_stream,
+)
+
+
+def make_stream(itag, type, subtype, progressive, **kwargs):
+    return SimpleNamespace(
+        itag=itag,
+        type=type,
+        subtype=subtype,
+        is_progressive=progressive,
+        is_adaptive=not progressive,
+        resolution=kwargs.get('resolution'),
+        abr=kwargs.get('abr'),
+        video_codec=kwargs.get('video_codec'),
+        audio_codec=kwargs.get('audio_codec'),
+        _filesize=1000 * itag,
+        url=(
+            'https://example.com/videoplayback'
+            f'?itag={itag}&expire={FakeYouTube.expire}'
+        ),
+    )
+
+
+class FakeYouTube:
+    created: list[str] = []
+    expire = 0
+
+    def __init__(self, url):
+        FakeYouTube.created.append(url)
+        self.title = 'Some Title'
+        self.streams = [
+            make_stream(18, 'video', 'mp4', True, resolution='360p'),
+            make_stream(22, 'video', 'mp4', True, resolution='720p'),
+            make_stream(137, 'video', 'mp4', False, resolution='1080p'),
+            make_stream(136, 'video', 'mp4', False, resolution='720p'),
+            make_stream(248, 'video', 'webm', False, resolution='1080p'),
+            make_stream(140, 'audio', 'mp4', False, abr='128kbps'),
+            make_stream(251, 'audio', 'webm', False, abr='160kbps'),
+        ]
+
+
+def test_select_streams(monkeypatch) -> None:
+    monkeypatch.setattr(video_source, 'YouTube', FakeYouTube)
+    streams = VideoSource('abc').streams
+
+    assert select_audio_stream(streams)['itag'] == 251
+    assert select_video_stream(streams)['itag'] == 137
+    assert select_video_stream(streams, '720p')['itag'] == 136
+    assert select_video_stream(streams, ['2160p']) is None
+    assert select_progressive_stream(streams)['itag'] == 18
+    assert streams[0]['filesize'] == 18000
+
+
+def test_video_info_cache(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(video_source, 'YouTube', FakeYouTube)
+    FakeYouTube.created = []
+    FakeYouTube.expire = int(time.time()) + 3600
+    cache = FileCache('video_info', cache_dir=str(tmp_path))
+
+    assert VideoSource('abc', cache).title == 'Some Title'
+    assert len(FakeYouTube.created) == 1
+
+    # title, streams and fresh urls come from the cache
+    source = VideoSource('abc', cache)
+    assert select_audio_stream(source.streams)['itag'] == 251
+    assert 'itag=251' in source.stream_url(251)
+    assert len(FakeYouTube.created) == 1
+
+
+def test_refresh_expired_url(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(video_source, 'YouTube', FakeYouTube)
+    FakeYouTube.created = []
+    FakeYouTube.expire = int(time.time()) - 10
+    cache = FileCache('video_info', cache_dir=str(tmp_path))
+    source = VideoSource('abc', cache)
+    source.title
+
+    FakeYouTube.expire = int(time.time()) + 3600
+    url = source.stream_url(140)
+    assert f'expire={FakeYouTube.expire}' in url
+    assert len(FakeYouTube.created) == 2
+    # the refreshed urls are cached
+    assert f'expire={FakeYouTube.expire}' in VideoSource(
+        'abc', cache
+    ).stream_url(140)
+    assert len(FakeYouTube.created) == 2
@@ -0,0 +1,56 @@
+import shutil
+import subprocess
+
+import pytest
+
+import src.videos as videos
+
+pytestmark = pytest.mark.skipif(
+    shutil.which('ffmpeg') is None, reason='needs ffmpeg'
+)
+
+
+def _ffmpeg(*args) -> None:
+    subprocess.run(['ffmpeg', '-y', *args], capture_output=True, check=True)
+
+
+@pytest.fixture
+def media(tmp_path):
+    video = tmp_path / 'video.mp4'
+    audio = tmp_path / 'audio.wav'
+    _ffmpeg('-f', 'lavfi', '-i', 'testsrc2=size=64x64:duration=1', video)
+    _ffmpeg('-f', 'lavfi', '-i', 'sine=duration=1', '-c:a', 'pcm_alaw', audio)
+    return str(video), str(audio)
+
+
+@pytest.fixture
+def ffmpeg_calls(monkeypatch):
+    calls = []
+    run = subprocess.run
+
+    def spy(cmd, **kwargs):
+        calls.append(cmd)
+        return run(cmd, **kwargs)
+
+    monkeypatch.setattr(videos.subprocess, 'run', spy)
+    return calls
+
+
+def test_incompatible_codec_is_reencoded(media, tmp_path, ffmpeg_calls):
+    video, audio = media
+    # mp4 cannot hold a-law audio: copied video, audio encoded to aac
+    videos.assemble_video(video, audio, str(tmp_path / 'out.mp4'))
+    assert len(ffmpeg_calls) == 2
+    assert ffmpeg_calls[-1][ffmpeg_calls[-1].index('-c:a') + 1] == 'aac'
+
+
+def test_other_errors_are_not_retried(media, tmp_path, ffmpeg_calls):
+    video, audio = media
+    with pytest.raises(RuntimeError, match='No such file'):
+        videos.assemble_video(
+            video,
+            audio,
+            str(tmp_path / 'out.mp4'),
+            subtitle_files=[str(tmp_path / 'missing.vtt')],
+        )
+    assert len(ffmpeg_calls) == 1